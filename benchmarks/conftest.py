@@ -0,0 +1,12 @@
+import logging
+
+import pytest
+
+
+@pytest.fixture(autouse=True, scope='session')
+def quiet_logging():
+    """
+    Modules set the root logger to INFO when imported and logging every line would be most of what is measured
+    Run with -p no:logging so pytest doesn't put it back to the log_cli_level for every test
+    """
+    logging.getLogger().setLevel(logging.WARNING)
@@ -0,0 +1,33 @@
+import pytest
+
+from notification_builder import build_notifications
+from synthetic import make_submissions, make_subscriptions, make_tickers
+from utils import decode_notification_from_sqs, encode_notification_for_sqs
+
+BATCHES = {
+    # One SQS message worth of users with a couple of notifications each
+    'message_batch': dict(num_users=10, num_submissions=10),
+    # Every notification of a large run in one payload
+    'whole_run': dict(num_users=5000, num_submissions=200),
+}
+
+
+def make_batch(num_users: int, num_submissions: int) -> [tuple]:
+    tickers = make_tickers(200)
+    subscriptions = make_subscriptions(tickers, num_users)
+    notifications = build_notifications(make_submissions(tickers, num_submissions), lambda ts: {t: subscriptions[t] for t in ts})
+    return list(notifications.items())
+
+
+@pytest.mark.parametrize('batch', BATCHES.keys())
+def test_encode_notification_for_sqs(benchmark, batch):
+    notifications = make_batch(**BATCHES[batch])
+    encoded = benchmark(encode_notification_for_sqs, notifications)
+    assert len(encoded) > 0
+
+
+@pytest.mark.parametrize('batch', BATCHES.keys())
+def test_decode_notification_from_sqs(benchmark, batch):
+    notifications = make_batch(**BATCHES[batch])
+    encoded = encode_notification_for_sqs(notifications)
+    assert len(benchmark(decode_notification_from_sqs, encoded)) == len(notifications)
@@ -0,0 +1,64 @@
+import random
+
+import pytest
+
+from messages import make_pretty_message, render_submission_block
+from notification_builder import build_notifications
+from synthetic import make_submissions, make_subscriptions, make_tickers
+from utils import reduce_notifications
+
+FAN_OUTS = {
+    # A normal run, a few posts about popular tickers
+    'typical': dict(num_users=2000, num_tickers=50, num_submissions=10),
+    # Everyone subscribed and a burst of DD after an outage
+    'large': dict(num_users=20000, num_tickers=200, num_submissions=200),
+}
+
+
+def make_fan_out(num_users: int, num_tickers: int, num_submissions: int) -> ({}, {}):
+    tickers = make_tickers(num_tickers)
+    return make_submissions(tickers, num_submissions), make_subscriptions(tickers, num_users)
+
+
+@pytest.mark.parametrize('fan_out', FAN_OUTS.keys())
+def test_build_notifications(benchmark, fan_out):
+    tickers_with_submissions, subscriptions = make_fan_out(**FAN_OUTS[fan_out])
+    all_dd = [f'AllDD{n}' for n in range(FAN_OUTS[fan_out]['num_users'] // 10)]
+
+    notifications = benchmark(
+        build_notifications, tickers_with_submissions, lambda ts: {t: subscriptions[t] for t in ts}, lambda: all_dd
+    )
+    assert len(notifications) > 0
+
+
+@pytest.fixture(scope='module')
+def large_notifications() -> {str: [{}]}:
+    tickers_with_submissions, subscriptions = make_fan_out(**FAN_OUTS['large'])
+    return build_notifications(tickers_with_submissions, lambda ts: {t: subscriptions[t] for t in ts})
+
+
+def test_reduce_notifications(benchmark, large_notifications):
+    def reduce_all():
+        return [reduce_notifications(n) for n in large_notifications.values()]
+
+    assert len(benchmark(reduce_all)) == len(large_notifications)
+
+
+def test_make_pretty_message(benchmark, large_notifications):
+    random.seed(0)
+
+    def render_all():
+        return [make_pretty_message(n) for n in large_notifications.values()]
+
+    # Only the first round renders the submission blocks, the rest reuse them
+    assert len(benchmark(render_all)) == len(large_notifications)
+
+
+def test_make_pretty_message_without_cached_blocks(benchmark, large_notifications):
+    random.seed(0)
+
+    def render_all():
+        return [make_pretty_message(n) for n in large_notifications.values()]
+
+    rendered = benchmark.pedantic(render_all, setup=render_submission_block.cache_clear, rounds=5)
+    assert len(rendered) == len(large_notifications)
@@ -0,0 +1,126 @@
+"""
+Run the submissions and notify handlers end to end against the local stand-in backends in tests/local_backends.py
+No Reddit or AWS credentials are needed, latency and throttling are injected to make the run behave like production
+Run with PYTHONPATH=src:tests
+"""
+import argparse
+import logging
+import os
+import random
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import clients
+import rate_limit
+from database import Database
+from lambda_function_notify import notify
+from lambda_function_process_submissions import run_process_submissions
+from local_backends import FaultInjector, LocalDynamoDB, LocalKinesis, LocalReddit, LocalSQS
+from synthetic import REAL_TICKERS, make_subscriptions
+
+# Like the deployed notifiers there is one per bot account, each running one invocation at a time
+BOT_USERS = ['LoadTestBot0', 'LoadTestBot1']
+
+
+def percentile(values: [float], p: float) -> float:
+    ordered = sorted(values)
+    return ordered[min(int(len(ordered) * p / 100), len(ordered) - 1)] if len(ordered) > 0 else 0.0
+
+
+def seed_subscriptions(num_users: int):
+    database = Database()
+    subscriptions = make_subscriptions(REAL_TICKERS, num_users)
+    with ThreadPoolExecutor(max_workers=16) as pool:
+        for ticker, users in subscriptions.items():
+            for user in users:
+                pool.submit(database.subscribe_user_to_ticker, user, ticker)
+
+
+def post_submissions(reddit: LocalReddit, num_posts: int, seed: int = 0):
+    rng = random.Random(seed)
+    for n in range(num_posts):
+        tickers = ' and '.join(t[1:] for t in rng.sample(REAL_TICKERS, rng.randint(1, 3)))
+        reddit.post(f'Why {tickers} are undervalued, part {n}', 'Positions and a long look at the fundamentals')
+
+
+def records_by_notifier(transport: str, records: [{}]) -> [[{}]]:
+    """
+    :return: the records each notifier handles, in the order it handles them. The notifiers take turns receiving
+             from SQS, while each stream notifier is filtered to the partitions with the same parity as its number
+             and reads them in stream order
+    """
+    if transport == 'kinesis':
+        return [[r for r in records if int(r['kinesis']['partitionKey']) % len(BOT_USERS) == n] for n in range(len(BOT_USERS))]
+    return [records[n::len(BOT_USERS)] for n in range(len(BOT_USERS))]
+
+
+def run(args):
+    dynamodb, reddit = LocalDynamoDB(), LocalReddit()
+    transport = LocalKinesis(args.stream_shards) if args.transport == 'kinesis' else LocalSQS()
+    clients.register_client('dynamodb', dynamodb)
+    clients.register_client(args.transport, transport)
+    for bot_user in BOT_USERS:
+        clients.register_reddit(bot_user, reddit)
+    os.environ.update({
+        'BotUserName': BOT_USERS[0],
+        'NotificationTransport': args.transport,
+        'NotificationsQueueUrl': 'local',
+        'NotificationsStreamName': 'local',
+    })
+    # The real limit is one send per second, the default leaves Reddit's pacing out to measure the bot itself
+    rate_limit.REDDIT_SENDS_PER_SECOND = args.sends_per_second
+    rate_limit.REDDIT_SEND_BURST = max(args.sends_per_second, 1)
+
+    seed_subscriptions(args.users)
+    post_submissions(reddit, args.posts)
+    # Faults are only injected once the subscriptions are in place
+    dynamodb.faults = FaultInjector(args.aws_latency, args.aws_latency / 2, args.dynamodb_rate_limit, args.dynamodb_rate_limit or 1)
+    transport.faults = FaultInjector(args.aws_latency, args.aws_latency / 2)
+    reddit.faults = FaultInjector(args.reddit_latency, args.reddit_latency / 2, args.reddit_rate_limit, args.reddit_rate_limit or 1)
+
+    started_at = time.monotonic()
+    run_process_submissions({'submission_limit': args.posts}, None)
+    submissions_seconds = time.monotonic() - started_at
+    records = transport.receive_lambda_records()
+
+    def invoke(bot_user: str, record: {}) -> float:
+        invoked_at = time.monotonic()
+        try:
+            notify(bot_user, [record])
+        except Exception as e:
+            print(f'Notify invocation failed and would be retried: {e!r}')
+        return time.monotonic() - invoked_at
+
+    def consume(bot_user: str, notifier_records: [{}]) -> [float]:
+        return [invoke(bot_user, record) for record in notifier_records]
+
+    with ThreadPoolExecutor(max_workers=len(BOT_USERS)) as pool:
+        notifier_seconds = pool.map(consume, BOT_USERS, records_by_notifier(args.transport, records))
+        invocation_seconds = [seconds for consumed in notifier_seconds for seconds in consumed]
+    total_seconds = time.monotonic() - started_at
+
+    delivery_seconds = [m.sent_at - started_at for m in reddit.messages]
+    print(f'Processed {args.posts} submissions for {args.users} users in {submissions_seconds:.2f}s, '
+          f'queued {len(records)} {args.transport} records')
+    print(f'{len(invocation_seconds)} notify invocations: p50 {percentile(invocation_seconds, 50):.3f}s, '
+          f'p99 {percentile(invocation_seconds, 99):.3f}s')
+    print(f'Sent {len(reddit.messages)} messages in {total_seconds:.2f}s, {len(reddit.messages) / total_seconds:,.1f} per second, '
+          f'delivered after p50 {percentile(delivery_seconds, 50):.2f}s, p99 {percentile(delivery_seconds, 99):.2f}s')
+    print(f'Throttled {dynamodb.faults.throttled} DynamoDB calls and {reddit.faults.throttled} Reddit calls')
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Run the bot end to end against local stand-ins for Reddit and AWS')
+    parser.add_argument('--users', type=int, default=2000)
+    parser.add_argument('--posts', type=int, default=20)
+    parser.add_argument('--transport', choices=['sqs', 'kinesis'], default='sqs')
+    parser.add_argument('--stream-shards', type=int, default=2)
+    parser.add_argument('--aws-latency', type=float, default=0.005, help='seconds added to every AWS call')
+    parser.add_argument('--reddit-latency', type=float, default=0.02, help='seconds added to every Reddit call')
+    parser.add_argument('--dynamodb-rate-limit', type=float, help='DynamoDB calls per second before throttling')
+    parser.add_argument('--reddit-rate-limit', type=float, help='Reddit calls per second, across the bot accounts, before asking for a break')
+    parser.add_argument('--sends-per-second', type=float, default=1000, help="the bot's own pacing of Reddit messages")
+    args = parser.parse_args()
+    # Handlers log at INFO, only the summary and errors are wanted
+    logging.getLogger().setLevel(logging.WARNING)
+    run(args)
@@ -0,0 +1,33 @@
+import pytest
+
+from synthetic import make_corpus_submissions, make_dd_selftext, make_emoji_markdown_post, make_short_titles
+from utils import get_tickers_for_submission, group_submissions_for_tickers, parse_tickers_from_text
+
+CORPORA = {
+    'short_titles': lambda: '\n'.join(make_short_titles(100)),
+    'dd_selftext_50kb': lambda: make_dd_selftext(50 * 1024),
+    'emoji_markdown': lambda: '\n\n'.join(make_emoji_markdown_post(seed) for seed in range(10)),
+}
+
+
+@pytest.mark.parametrize('corpus', CORPORA.keys())
+def test_parse_tickers_from_text(benchmark, corpus):
+    text = CORPORA[corpus]()
+    tickers = benchmark(parse_tickers_from_text, text)
+    assert len(tickers) > 0
+
+
+def test_get_tickers_for_submission(benchmark):
+    submissions = make_corpus_submissions(100)
+
+    def parse_all():
+        return [get_tickers_for_submission(s) for s in submissions]
+
+    tickers = benchmark(parse_all)
+    assert any(len(t) > 0 for t in tickers)
+
+
+def test_group_submissions_for_tickers(benchmark):
+    submissions = make_corpus_submissions(100)
+    tickers_with_submissions = benchmark(group_submissions_for_tickers, submissions, lambda submission_id: False)
+    assert len(tickers_with_submissions) > 0
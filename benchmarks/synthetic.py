@@ -0,0 +1,134 @@
+import random
+from dataclasses import dataclass
+
+from submission_utils import SubmissionNotification
+
+# Tickers which are in the symbol table, for corpora which go through the ticker parser
+REAL_TICKERS = ['$GME', '$AMC', '$TSLA', '$PLTR', '$NIO', '$BB', '$NOK', '$AMD', '$MSFT', '$AAPL', '$SPY', '$QQQ']
+# Capitalised words WSB posts are full of which are not tickers, or are but are excluded by the parser
+NOISE_WORDS = ['YOLO', 'DD', 'CEO', 'EPS', 'IV', 'ATH', 'FOMO', 'HODL', 'TLDR', 'EDIT', 'I', 'A', 'USA', 'SEC', 'WSB']
+EMOJI = ['🚀', '💎', '🙌', '🦍', '🌕', '📈', '📉', '🐻', '🐂', '🤡', '💰', '🔥']
+
+
+@dataclass
+class SyntheticSubmission(object):
+    """
+    Has the attributes of a praw Submission the bot reads
+    """
+    id: str
+    title: str
+    selftext: str
+    link_flair_text: str = 'DD'
+    is_self: bool = True
+
+    @property
+    def permalink(self) -> str:
+        return f'/r/wallstreetbets/comments/{self.id}/synthetic_dd/'
+
+
+def make_tickers(num_tickers: int) -> [str]:
+    return [f'$T{n:03d}' for n in range(num_tickers)]
+
+
+def make_submissions(tickers: [str], num_submissions: int, tickers_per_submission: int = 3,
+                     seed: int = 0) -> {str: [SubmissionNotification]}:
+    """
+    :return: @tickers mapped to the synthetic submissions mentioning them, like group_submissions_for_tickers
+    """
+    rng = random.Random(seed)
+    tickers_with_submissions = {}
+    for n in range(num_submissions):
+        submission = SubmissionNotification(f's{n}', 'DD', f'/r/wallstreetbets/comments/s{n}/synthetic_dd/', f'Synthetic DD {n}')
+        for ticker in rng.sample(tickers, tickers_per_submission):
+            tickers_with_submissions.setdefault(ticker, []).append(submission)
+    return tickers_with_submissions
+
+
+def make_subscriptions(tickers: [str], num_users: int, tickers_per_user: int = 5, seed: int = 0) -> {str: [str]}:
+    """
+    :return: @tickers mapped to synthetic subscribers, popular tickers have more of them
+    """
+    rng = random.Random(seed)
+    weights = [1 / (rank + 1) for rank in range(len(tickers))]
+    subscriptions = {ticker: [] for ticker in tickers}
+    for n in range(num_users):
+        for ticker in set(rng.choices(tickers, weights, k=tickers_per_user)):
+            subscriptions[ticker].append(f'User{n}')
+    return subscriptions
+
+
+def make_short_titles(num_titles: int, seed: int = 0) -> [str]:
+    """
+    :return: post titles of a few words mentioning a ticker or two
+    """
+    rng = random.Random(seed)
+    templates = ['Why {0} is undervalued', '{0} to the moon {e}', '{0} and {1} earnings play', 'Thoughts on {0}?',
+                 '{0} {n} calls expiring Friday', 'Is {0} the next {1}? {e}']
+    return [
+        rng.choice(templates).format(*(t[1:] for t in rng.sample(REAL_TICKERS, 2)), e=rng.choice(EMOJI), n=rng.randint(5, 900))
+        for _ in range(num_titles)
+    ]
+
+
+def make_dd_selftext(size_bytes: int = 50 * 1024, seed: int = 0) -> str:
+    """
+    :return: a long DD write-up of about @size_bytes, prose with numbers, links, tables and the odd ticker
+    """
+    rng = random.Random(seed)
+    words = ['revenue', 'guidance', 'margin', 'the', 'quarter', 'growth', 'short', 'interest', 'float', 'squeeze',
+             'institutions', 'balance', 'sheet', 'debt', 'cash', 'flow', 'and', 'is', 'with', 'of', 'to', 'analysts']
+    paragraphs = []
+    size = 0
+    while size < size_bytes:
+        kind = rng.random()
+        if kind < 0.1:
+            paragraph = '| Quarter | Revenue | EPS |\n|---|---|---|\n' + '\n'.join(
+                f'| Q{q} | ${rng.randint(100, 999)}M | {rng.uniform(-2, 5):.2f} |' for q in range(1, 5))
+        elif kind < 0.2:
+            paragraph = f'Source: [filing](https://www.sec.gov/Archives/edgar/data/{rng.randint(10000, 99999)}/)'
+        else:
+            sentence = [rng.choice(words) for _ in range(rng.randint(8, 30))]
+            for _ in range(rng.randint(0, 3)):
+                sentence.insert(rng.randrange(len(sentence)), rng.choice(REAL_TICKERS + NOISE_WORDS))
+            paragraph = ' '.join(sentence).capitalize() + f' {rng.uniform(0, 100):.1f}%.'
+        paragraphs.append(paragraph)
+        size += len(paragraph.encode()) + 2
+    return '\n\n'.join(paragraphs)
+
+
+def make_emoji_markdown_post(seed: int = 0) -> str:
+    """
+    :return: a short post which is mostly emoji, markdown formatting and shouting
+    """
+    rng = random.Random(seed)
+    lines = []
+    for _ in range(rng.randint(10, 30)):
+        emoji = ''.join(rng.choices(EMOJI, k=rng.randint(1, 8)))
+        ticker = rng.choice(REAL_TICKERS)
+        lines.append(rng.choice([
+            f'# {ticker[1:]} {emoji}',
+            f'**{rng.choice(NOISE_WORDS)} {ticker}** {emoji}',
+            f'* ~~{rng.choice(NOISE_WORDS)}~~ {emoji} ^(not financial advice)',
+            f'> {emoji} {rng.choice(NOISE_WORDS)} {rng.choice(NOISE_WORDS)} {emoji}',
+            f'[{ticker}](https://www.reddit.com/r/wallstreetbets/) {emoji}{emoji}',
+        ]))
+    return '\n\n'.join(lines)
+
+
+def make_corpus_submissions(num_submissions: int, seed: int = 0) -> [SyntheticSubmission]:
+    """
+    :return: a mix of submissions like a busy hour on the subreddit, mostly short posts and some long DD
+    """
+    rng = random.Random(seed)
+    titles = make_short_titles(num_submissions, seed)
+    submissions = []
+    for n, title in enumerate(titles):
+        kind = rng.random()
+        if kind < 0.1:
+            selftext = make_dd_selftext(seed=seed + n)
+        elif kind < 0.5:
+            selftext = make_emoji_markdown_post(seed + n)
+        else:
+            selftext = ''
+        submissions.append(SyntheticSubmission(f'c{n}', title, selftext, rng.choice(['DD', 'DD', 'Discussion'])))
+    return submissions
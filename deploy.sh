@@ -11,4 +11,4 @@ aws cloudformation deploy \
   --template-file deployment/out.yml \
   --stack-name wsb-ticker-bot \
   --capabilities CAPABILITY_NAMED_IAM \
-  --parameter-overrides Version="$(git rev-parse --short HEAD)"
+  --parameter-overrides Version="$(git rev-parse --short HEAD)" NotificationTransport="${NOTIFICATION_TRANSPORT:-sqs}"
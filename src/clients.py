@@ -0,0 +1,81 @@
+from __future__ import annotations
+
+import threading
+from typing import TYPE_CHECKING
+
+from defaults import MAX_INBOX_THREADPOOL_WORKERS, MAX_NOTIFICATION_THREADPOOL_WORKERS, MAX_SUBSCRIPTION_UPDATE_WORKERS
+
+if TYPE_CHECKING:
+    from boto3 import Session
+
+AWS_PROFILE_NAME = 'wsb-ticker-bot'
+# Fail fast and let botocore retry rather than hanging on a slow connection for most of the Lambda's budget.
+# Thread pools are never nested, processing the inbox has the most calls in flight, one per inbox worker and one per
+# worker of the subscription pool they share, plus the thread waiting on them
+BOTO_CONFIG = {
+    'connect_timeout': 2,
+    'read_timeout': 5,
+    'retries': {'max_attempts': 4, 'mode': 'standard'},
+    'max_pool_connections': max(MAX_INBOX_THREADPOOL_WORKERS + MAX_SUBSCRIPTION_UPDATE_WORKERS,
+                                MAX_NOTIFICATION_THREADPOOL_WORKERS) + 1
+}
+
+# Created once per container and reused by every warm invocation
+_session = None
+_clients = {}
+_reddits = {}
+_lock = threading.Lock()
+
+
+def get_session() -> Session:
+    global _session
+    with _lock:
+        if _session is None:
+            # boto3 is only imported once a handler needs AWS, it is the slowest import in the bot
+            import boto3
+            from botocore.exceptions import ProfileNotFound
+            try:
+                # Useful for local development using an aws profile, will fail on lambda but method below will succeed
+                _session = boto3.session.Session(profile_name=AWS_PROFILE_NAME)
+            except ProfileNotFound:
+                _session = boto3.session.Session()
+        return _session
+
+
+def get_client(service_name: str):
+    """
+    :return: the shared boto3 client for @service_name, boto3 clients are thread-safe
+    """
+    session = get_session()
+    with _lock:
+        if service_name not in _clients:
+            from botocore.config import Config
+            _clients[service_name] = session.client(service_name, config=Config(**BOTO_CONFIG))
+        return _clients[service_name]
+
+
+def get_reddit(username: str):
+    """
+    :return: the shared Reddit instance for @username, which keeps its OAuth token between invocations
+    """
+    from praw.reddit import Reddit
+    with _lock:
+        if username not in _reddits:
+            _reddits[username] = Reddit(username)
+        return _reddits[username]
+
+
+def register_client(service_name: str, client):
+    """
+    Use @client for @service_name from now on, used to run the bot against local stand-in backends
+    """
+    with _lock:
+        _clients[service_name] = client
+
+
+def register_reddit(username: str, reddit):
+    """
+    Use @reddit for @username from now on, used to run the bot against a local stand-in for Reddit
+    """
+    with _lock:
+        _reddits[username] = reddit
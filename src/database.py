@@ -1,41 +1,290 @@
-import boto3
+import logging
+import threading
+import time
+import zlib
+from collections import OrderedDict
+from concurrent.futures import Executor, ThreadPoolExecutor
 from datetime import timedelta, datetime
-from boto3 import Session
-from botocore.exceptions import ProfileNotFound
+
+from typing import Optional
+
+from clients import get_client
+from defaults import MAX_SUBSCRIPTION_UPDATE_WORKERS
+from metrics import timed
+from submission_utils import SubmissionCursor
 
 COMMENTED_SUBMISSIONS_TABLE_NAME = 'commented-submissions'
 NOTIFIED_SUBMISSIONS_TABLE_NAME = 'notified-submissions'
 SENT_NOTIFICATIONS_TABLE_NAME = 'sent-notifications'
 # Users who have blocked the bot, do not attemp to send
 BLOCKED_USERS_TABLE_NAME = 'blocked-users'
+SUBMISSION_CURSORS_TABLE_NAME = 'submission-cursors'
+ALL_DD_SUBSCRIBERS_TABLE_NAME = 'all-dd-subscribers'
+TICKER_SUBSCRIPTIONS_TABLE_NAME = 'dd-notifications'
+# Reverse index of dd-notifications, the tickers each user is subscribed to
+USER_SUBSCRIPTIONS_TABLE_NAME = 'user-subscriptions'
+# DynamoDB limits a single batch_get_item call to this many keys and batch_write_item to this many items
+BATCH_GET_ITEM_LIMIT = 100
+BATCH_WRITE_ITEM_LIMIT = 25
+MAX_BATCH_ATTEMPTS = 5
+BATCH_RETRY_BASE_SECONDS = 0.05
+SUBMISSION_MARKER_TTL_DAYS = 5
+# The blocked users and all DD subscribers tables are small and rarely change so warm containers keep a copy of them
+# for this long
+BLOCKED_USERS_CACHE_TTL_SECONDS = 300
+ALL_DD_SUBSCRIBERS_CACHE_TTL_SECONDS = 300
+NOTIFICATION_ID_CACHE_SIZE = 10000
+BACKFILL_SCAN_SEGMENTS = 4
+MAX_BATCH_GET_WORKERS = 4
+# Each ticker's subscribers are spread over this many dd-notifications items, keyed ticker#shard, so popular tickers
+# stay under the item size limit and writes for different users don't contend on one item.
+# Users are assigned to shards by hashing so changing this needs the subscriptions migrated again
+SUBSCRIBER_SHARDS = 4
+SHARD_SEPARATOR = '#'
+# Until migrate_subscriptions_to_shards has run, subscribers left on the unsharded item, keyed by the bare ticker,
+# are read alongside the shards and unsubscribing removes the user from it too. Turn off once the migration has run
+READ_UNSHARDED_SUBSCRIPTIONS = True
+
+logger = logging.getLogger()
+logger.setLevel(logging.INFO)
+
+
+class UnprocessedItemsError(Exception):
+    """
+    Raised when DynamoDB keeps returning unprocessed items for a batch request after all retries
+    """
+    pass
+
+
+def subscriber_shard(user: str) -> int:
+    """
+    :return: the shard of a ticker's subscribers which @user belongs to, the same in every process
+    """
+    return zlib.crc32(user.encode()) % SUBSCRIBER_SHARDS
+
+
+def subscription_shard_key(ticker: str, shard: int) -> str:
+    return f'{ticker}{SHARD_SEPARATOR}{shard}'
+
+
+def ticker_from_shard_key(key: str) -> str:
+    return key.partition(SHARD_SEPARATOR)[0]
+
+
+class SubscriptionUpdateError(Exception):
+    """
+    Raised when some of a user's subscription changes could not be saved
+    """
+
+    def __init__(self, user: str, failed_tickers: [str]):
+        super().__init__(f'Could not update subscriptions of user {user} to {", ".join(failed_tickers)}')
+        self.failed_tickers = failed_tickers
+
+
+class CacheStats:
+    """
+    Hit and miss counters for the in-process caches, logged and reset once per invocation
+    """
+
+    def __init__(self):
+        self.counters = {}
+        self._lock = threading.Lock()
+
+    def record(self, cache_name: str, hit: bool):
+        key = (cache_name, 'hits' if hit else 'misses')
+        with self._lock:
+            self.counters[key] = self.counters.get(key, 0) + 1
+
+    def get(self, cache_name: str, kind: str) -> int:
+        return self.counters.get((cache_name, kind), 0)
+
+    def reset(self):
+        with self._lock:
+            self.counters = {}
+
+
+cache_stats = CacheStats()
+
+
+def log_cache_stats():
+    """
+    Log the cache hit and miss counts for this invocation and start counting again
+    """
+    for cache_name in sorted({name for name, _ in cache_stats.counters}):
+        logger.info(f'Cache {cache_name}: {cache_stats.get(cache_name, "hits")} hits, {cache_stats.get(cache_name, "misses")} misses')
+    cache_stats.reset()
+
+
+class UsersCache:
+    """
+    Copy of a small table of users which is reloaded once it is older than @ttl_seconds
+    """
+
+    def __init__(self, cache_name: str, ttl_seconds: float, clock=time.monotonic):
+        self.cache_name = cache_name
+        self.ttl_seconds = ttl_seconds
+        self._clock = clock
+        self._users = None
+        self._loaded_at = 0.0
+        self._lock = threading.Lock()
+
+    def _load(self, load_users) -> {str}:
+        if self._users is None or self._clock() - self._loaded_at > self.ttl_seconds:
+            cache_stats.record(self.cache_name, hit=False)
+            self._users = set(load_users())
+            self._loaded_at = self._clock()
+        else:
+            cache_stats.record(self.cache_name, hit=True)
+        return self._users
+
+    def contains(self, user_id: str, load_users) -> bool:
+        """
+        :param load_users: function returning every user in the table, called when the copy is missing or stale
+        """
+        with self._lock:
+            return user_id in self._load(load_users)
+
+    def users(self, load_users) -> [str]:
+        """
+        :param load_users: function returning every user in the table, called when the copy is missing or stale
+        """
+        with self._lock:
+            return sorted(self._load(load_users))
+
+    def add(self, user_id: str):
+        with self._lock:
+            if self._users is not None:
+                self._users.add(user_id)
+
+    def discard(self, user_id: str):
+        with self._lock:
+            if self._users is not None:
+                self._users.discard(user_id)
+
+    def invalidate(self):
+        with self._lock:
+            self._users = None
+
+
+class LRUSet:
+    """
+    Remembers up to @max_size recently seen keys
+    """
+
+    def __init__(self, max_size: int = NOTIFICATION_ID_CACHE_SIZE):
+        self.max_size = max_size
+        self._keys = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __contains__(self, key) -> bool:
+        with self._lock:
+            if key in self._keys:
+                self._keys.move_to_end(key)
+                return True
+            return False
+
+    def __len__(self) -> int:
+        return len(self._keys)
+
+    def add(self, key):
+        with self._lock:
+            self._keys[key] = True
+            self._keys.move_to_end(key)
+            while len(self._keys) > self.max_size:
+                self._keys.popitem(last=False)
 
 
 class Database:
+    # Shared by every instance so warm containers keep them between invocations
+    blocked_users_cache = UsersCache('blocked-users', BLOCKED_USERS_CACHE_TTL_SECONDS)
+    all_dd_subscribers_cache = UsersCache('all-dd-subscribers', ALL_DD_SUBSCRIBERS_CACHE_TTL_SECONDS)
+    sent_notifications_cache = LRUSet()
+
     def __init__(self):
-        try:
-            # Useful for local development using an aws profile, will fail on lambda but method below will succeed
-            self.session: Session = boto3.session.Session(profile_name="wsb-ticker-bot")
-        except ProfileNotFound:
-            self.session: Session = boto3.session.Session()
-        self.client = self.session.client('dynamodb')
+        self.client = get_client('dynamodb')
 
     def get_users_subscribed_to_ticker(self, ticker: str) -> [str]:
-        try:
-            return self.client.get_item(
-                TableName='dd-notifications',
-                Key={
-                    'ticker': {'S': ticker}
-                },
-                ProjectionExpression='subscribed_users'
-            )['Item']['subscribed_users']['SS']
-        except KeyError:
-            return []
+        return self.get_users_subscribed_to_tickers([ticker])[ticker]
+
+    @timed('SubscriberLookup')
+    def get_users_subscribed_to_tickers(self, tickers: [str]) -> {str: [str]}:
+        """
+        Look up the subscribers of many tickers using as few round trips as possible, every shard of every ticker
+        is fetched and the shards are merged
+        :param tickers: to look up subscribers for
+        :return: each ticker mapped to its subscribed users, tickers without subscribers map to an empty list
+        """
+        subscribed_users = {ticker: set() for ticker in tickers}
+        keys = [subscription_shard_key(ticker, shard) for ticker in subscribed_users for shard in range(SUBSCRIBER_SHARDS)]
+        if READ_UNSHARDED_SUBSCRIPTIONS:
+            keys += list(subscribed_users)
+        items = self.batch_get_items(
+            TICKER_SUBSCRIPTIONS_TABLE_NAME,
+            [{'ticker': {'S': key}} for key in keys],
+            projection_expression='ticker, subscribed_users'
+        )
+        for item in items:
+            try:
+                subscribed_users[ticker_from_shard_key(item['ticker']['S'])].update(item['subscribed_users']['SS'])
+            except KeyError:
+                pass
+        return {ticker: sorted(users) for ticker, users in subscribed_users.items()}
+
+    def batch_get_items(self, table_name: str, keys: [{}], projection_expression: str = None) -> [{}]:
+        """
+        Fetch many items from one table, splitting the keys into batches DynamoDB accepts and retrying
+        unprocessed keys with exponential backoff. Batches are sent concurrently
+        :return: the items which exist, in no particular order
+        """
+        def get_batch(batch_keys: [{}]) -> [{}]:
+            request = {'Keys': batch_keys}
+            if projection_expression is not None:
+                request['ProjectionExpression'] = projection_expression
+            responses = self._send_with_retries(self.client.batch_get_item, {table_name: request}, 'UnprocessedKeys', table_name)
+            return [item for response in responses for item in response.get('Responses', {}).get(table_name, [])]
+
+        batches = [keys[i:i + BATCH_GET_ITEM_LIMIT] for i in range(0, len(keys), BATCH_GET_ITEM_LIMIT)]
+        if len(batches) <= 1:
+            return [item for batch in batches for item in get_batch(batch)]
+        with ThreadPoolExecutor(max_workers=min(len(batches), MAX_BATCH_GET_WORKERS)) as pool:
+            return [item for batch_items in pool.map(get_batch, batches) for item in batch_items]
+
+    def batch_write_items(self, table_name: str, items: [{}]):
+        """
+        Put many items into one table, splitting them into batches DynamoDB accepts and retrying
+        unprocessed items with exponential backoff
+        """
+        for i in range(0, len(items), BATCH_WRITE_ITEM_LIMIT):
+            request = [{'PutRequest': {'Item': item}} for item in items[i:i + BATCH_WRITE_ITEM_LIMIT]]
+            self._send_with_retries(self.client.batch_write_item, {table_name: request}, 'UnprocessedItems', table_name)
+
+    @staticmethod
+    def _send_with_retries(send, request_items: {}, unprocessed_key: str, table_name: str) -> [{}]:
+        """
+        Send a batch request and resend whatever DynamoDB reports as unprocessed until nothing is left
+        :return: every response received
+        """
+        responses = []
+        attempt = 0
+        while request_items:
+            if attempt == MAX_BATCH_ATTEMPTS:
+                raise UnprocessedItemsError(f'Could not process all items for {table_name} after {MAX_BATCH_ATTEMPTS} attempts')
+            if attempt > 0:
+                time.sleep(BATCH_RETRY_BASE_SECONDS * 2 ** (attempt - 1))
+            response = send(RequestItems=request_items)
+            responses.append(response)
+            request_items = response.get(unprocessed_key)
+            attempt += 1
+        return responses
 
     def subscribe_user_to_ticker(self, user: str, ticker: str) -> [str]:
-        return self.client.update_item(
-            TableName='dd-notifications',
+        """
+        :return: the subscribers in @user's shard of @ticker
+        """
+        subscribed_users = self.client.update_item(
+            TableName=TICKER_SUBSCRIPTIONS_TABLE_NAME,
             Key={
-                'ticker': {'S': ticker}
+                'ticker': {'S': subscription_shard_key(ticker, subscriber_shard(user))}
             },
             UpdateExpression='ADD subscribed_users :userToSubscribe',
             ExpressionAttributeValues={
@@ -43,11 +292,117 @@ class Database:
             },
             ReturnValues='UPDATED_NEW'
         )['Attributes']['subscribed_users']['SS']
+        self.client.update_item(
+            TableName=USER_SUBSCRIPTIONS_TABLE_NAME,
+            Key={
+                'user_name': {'S': user}
+            },
+            UpdateExpression='ADD tickers :tickerToAdd',
+            ExpressionAttributeValues={
+                ':tickerToAdd': {'SS': [ticker]}
+            }
+        )
+        return subscribed_users
 
     def unsubscribe_user_from_ticker(self, user: str, ticker: str) -> [str]:
+        """
+        :return: the subscribers left in @user's shard of @ticker
+        """
+        response = self.client.update_item(
+            TableName=TICKER_SUBSCRIPTIONS_TABLE_NAME,
+            Key={
+                'ticker': {'S': subscription_shard_key(ticker, subscriber_shard(user))}
+            },
+            UpdateExpression='DELETE subscribed_users :userToUnsubscribe',
+            ExpressionAttributeValues={
+                ':userToUnsubscribe': {'SS': [user]}
+            },
+            ReturnValues='UPDATED_NEW'
+        )
+        if READ_UNSHARDED_SUBSCRIPTIONS:
+            self.unsubscribe_user_from_unsharded_ticker(user, ticker)
+        self.client.update_item(
+            TableName=USER_SUBSCRIPTIONS_TABLE_NAME,
+            Key={
+                'user_name': {'S': user}
+            },
+            UpdateExpression='DELETE tickers :tickerToRemove',
+            ExpressionAttributeValues={
+                ':tickerToRemove': {'SS': [ticker]}
+            }
+        )
+        try:
+            return response['Attributes']['subscribed_users']['SS']
+        except KeyError:
+            return []
+
+    def get_user_subscriptions(self, user: str) -> [str]:
+        """
+        :return: the tickers @user is subscribed to, read from the reverse index in one request
+        """
+        try:
+            return sorted(self.client.get_item(
+                TableName=USER_SUBSCRIPTIONS_TABLE_NAME,
+                Key={
+                    'user_name': {'S': user}
+                },
+                ConsistentRead=True
+            )['Item']['tickers']['SS'])
+        except KeyError:
+            return []
+
+    def backfill_user_subscriptions(self, total_segments: int = BACKFILL_SCAN_SEGMENTS) -> int:
+        """
+        Rebuild the user subscriptions index from the ticker subscriptions table, scanning it in parallel segments
+        Each user's index item is replaced so subscriptions changed while this runs may need a second backfill
+        :return: the number of users written
+        """
+        user_tickers = {}
+        for item in self.scan_segments(TICKER_SUBSCRIPTIONS_TABLE_NAME, total_segments, 'ticker, subscribed_users'):
+            for user in item.get('subscribed_users', {}).get('SS', []):
+                user_tickers.setdefault(user, set()).add(ticker_from_shard_key(item['ticker']['S']))
+        self.batch_write_items(USER_SUBSCRIPTIONS_TABLE_NAME, [
+            {'user_name': {'S': user}, 'tickers': {'SS': sorted(tickers)}} for user, tickers in user_tickers.items()
+        ])
+        logger.info(f'Backfilled subscriptions of {len(user_tickers)} users')
+        return len(user_tickers)
+
+    def update_user_subscriptions(self, user: str, add: [str] = (), remove: [str] = (),
+                                  pool: Executor = None) -> {str: bool}:
+        """
+        Subscribe @user to the tickers in @add and unsubscribe them from the tickers in @remove
+        Each ticker is a separate item so the updates are made concurrently rather than one after another
+        :param pool: to make the updates on, shared by callers which are themselves running on a pool so pools aren't
+                     nested, by default the updates get a pool of their own
+        :return: whether the update for each ticker succeeded, failures are logged
+        """
+        updates = [(ticker, self.subscribe_user_to_ticker) for ticker in add] + \
+                  [(ticker, self.unsubscribe_user_from_ticker) for ticker in remove]
+        if len(updates) == 0:
+            return {}
+
+        def update_ticker(ticker: str, update) -> bool:
+            try:
+                update(user, ticker)
+                return True
+            except Exception as e:
+                logger.error(f'Could not update subscription of user {user} to {ticker}: {e}')
+                return False
+
+        if pool is None:
+            with ThreadPoolExecutor(max_workers=min(len(updates), MAX_SUBSCRIPTION_UPDATE_WORKERS)) as own_pool:
+                return self.update_user_subscriptions(user, add, remove, own_pool)
+        futures = [(ticker, pool.submit(update_ticker, ticker, update)) for ticker, update in updates]
+        return {ticker: future.result() for ticker, future in futures}
+
+    def unsubscribe_user_from_unsharded_ticker(self, user: str, ticker: str):
+        """
+        Remove @user from the unsharded item of @ticker, if there still is one, rather than creating an empty one
+        """
+        from botocore.exceptions import ClientError
         try:
-            return self.client.update_item(
-                TableName='dd-notifications',
+            self.client.update_item(
+                TableName=TICKER_SUBSCRIPTIONS_TABLE_NAME,
                 Key={
                     'ticker': {'S': ticker}
                 },
@@ -55,10 +410,68 @@ class Database:
                 ExpressionAttributeValues={
                     ':userToUnsubscribe': {'SS': [user]}
                 },
-                ReturnValues='UPDATED_NEW'
-            )['Attributes']['subscribed_users']['SS']
-        except KeyError:
-            return []
+                ConditionExpression='attribute_exists(ticker)'
+            )
+        except ClientError as e:
+            if e.response['Error']['Code'] != 'ConditionalCheckFailedException':
+                raise
+
+    def migrate_subscriptions_to_shards(self, total_segments: int = BACKFILL_SCAN_SEGMENTS) -> int:
+        """
+        Move subscribers from unsharded dd-notifications items, keyed by the bare ticker, into the ticker's shards
+        Subscribers are added to the shards so anyone who subscribed since the sharded layout was deployed is kept.
+        The unsharded subscribers are taken off their item in the same update which reads them, so a user who
+        unsubscribes during the migration is either removed from the unsharded item before it is read or from their
+        shard after it is written, and never copied back in. If a shard can't be written the subscribers are put back
+        on the unsharded item for the next run
+        :return: the number of tickers migrated
+        """
+        items = self.scan_segments(TICKER_SUBSCRIPTIONS_TABLE_NAME, total_segments, 'ticker, subscribed_users')
+        unsharded = [i for i in items if SHARD_SEPARATOR not in i['ticker']['S'] and 'subscribed_users' in i]
+
+        def migrate(item: {}):
+            ticker = item['ticker']['S']
+            response = self.client.update_item(
+                TableName=TICKER_SUBSCRIPTIONS_TABLE_NAME,
+                Key={
+                    'ticker': {'S': ticker}
+                },
+                UpdateExpression='REMOVE subscribed_users',
+                ReturnValues='ALL_OLD'
+            )
+            subscribed_users = response.get('Attributes', {}).get('subscribed_users', {}).get('SS', [])
+            shards = {}
+            for user in subscribed_users:
+                shards.setdefault(subscriber_shard(user), []).append(user)
+            try:
+                for shard, users in shards.items():
+                    self.client.update_item(
+                        TableName=TICKER_SUBSCRIPTIONS_TABLE_NAME,
+                        Key={
+                            'ticker': {'S': subscription_shard_key(ticker, shard)}
+                        },
+                        UpdateExpression='ADD subscribed_users :usersToSubscribe',
+                        ExpressionAttributeValues={
+                            ':usersToSubscribe': {'SS': users}
+                        }
+                    )
+            except Exception:
+                self.client.update_item(
+                    TableName=TICKER_SUBSCRIPTIONS_TABLE_NAME,
+                    Key={
+                        'ticker': {'S': ticker}
+                    },
+                    UpdateExpression='ADD subscribed_users :usersToSubscribe',
+                    ExpressionAttributeValues={
+                        ':usersToSubscribe': {'SS': subscribed_users}
+                    }
+                )
+                raise
+
+        with ThreadPoolExecutor(max_workers=MAX_SUBSCRIPTION_UPDATE_WORKERS) as pool:
+            list(pool.map(migrate, unsharded))
+        logger.info(f'Migrated subscribers of {len(unsharded)} tickers to {SUBSCRIBER_SHARDS} shards each')
+        return len(unsharded)
 
     def has_already_processed(self, submission_id, table_name) -> bool:
         try:
@@ -73,57 +486,132 @@ class Database:
             return False
 
     def is_user_blocked(self, user_id) -> bool:
-        try:
-            self.client.get_item(
-                TableName=BLOCKED_USERS_TABLE_NAME,
-                Key={
-                    'user_id': {'S': user_id}
-                }
-            )['Item']
-            return True
-        except KeyError:
-            return False
+        return self.blocked_users_cache.contains(user_id, self.get_blocked_users)
 
-    def has_already_notified(self, notification_id: str) -> bool:
-        try:
-            self.client.get_item(
-                TableName=SENT_NOTIFICATIONS_TABLE_NAME,
-                Key={
-                    'id': {'S': notification_id}
-                }
-            )['Item']
-            return True
-        except KeyError:
-            return False
+    def get_blocked_users(self) -> [str]:
+        return [i['user_id']['S'] for i in self.scan_all(BLOCKED_USERS_TABLE_NAME, projection_expression='user_id')]
+
+    def scan_all(self, table_name: str, projection_expression: str = None, segment: int = None, total_segments: int = None) -> [{}]:
+        """
+        Scan a whole table, or one segment of it, following LastEvaluatedKey through every page
+        """
+        request = {'TableName': table_name}
+        if projection_expression is not None:
+            request['ProjectionExpression'] = projection_expression
+        if total_segments is not None:
+            request['Segment'] = segment
+            request['TotalSegments'] = total_segments
+        items = []
+        while True:
+            response = self.client.scan(**request)
+            items.extend(response.get('Items', []))
+            if 'LastEvaluatedKey' not in response:
+                return items
+            request['ExclusiveStartKey'] = response['LastEvaluatedKey']
+
+    def scan_segments(self, table_name: str, total_segments: int, projection_expression: str = None) -> [{}]:
+        """
+        Scan a whole table with @total_segments parallel scans
+        """
+        with ThreadPoolExecutor(max_workers=total_segments) as pool:
+            segments = pool.map(lambda segment: self.scan_all(table_name, projection_expression, segment, total_segments),
+                                range(total_segments))
+            return [item for segment in segments for item in segment]
+
+    @timed('DedupLookup')
+    def get_sent_notification_ids(self, notification_ids: [str]) -> {str}:
+        """
+        :return: the subset of @notification_ids which have a sent marker, warm containers check their cache first
+        """
+        sent = set()
+        for notification_id in notification_ids:
+            hit = notification_id in self.sent_notifications_cache
+            cache_stats.record('sent-notifications', hit=hit)
+            hit and sent.add(notification_id)
+        missing = {i for i in notification_ids if i not in sent}
+        if len(missing) > 0:
+            items = self.batch_get_items(SENT_NOTIFICATIONS_TABLE_NAME, [{'id': {'S': i}} for i in missing])
+            for item in items:
+                self.sent_notifications_cache.add(item['id']['S'])
+                sent.add(item['id']['S'])
+        return sent
+
+    @timed('DedupLookup')
+    def get_processed_submission_ids(self, submission_ids: [str], table_name) -> {str}:
+        """
+        :return: the subset of @submission_ids which have a marker in @table_name
+        """
+        items = self.batch_get_items(
+            table_name,
+            [{'submission_id': {'S': submission_id}} for submission_id in set(submission_ids)],
+            projection_expression='submission_id'
+        )
+        return {item['submission_id']['S'] for item in items}
 
     def add_submission_marker(self, table_name, submission_id):
         return self.client.put_item(
             TableName=table_name,
-            Item={
-                'submission_id': {'S': submission_id}
-            },
+            Item=self.create_submission_marker(submission_id),
             ReturnValues='NONE'
         )
 
-    def add_notification_marker(self, notification_id):
-        ttl = (datetime.now() + timedelta(days=5)).timestamp()
+    @timed('MarkerWrite')
+    def add_submission_markers(self, table_name, submission_ids: [str]):
+        self.batch_write_items(table_name, [self.create_submission_marker(s) for s in set(submission_ids)])
+
+    @staticmethod
+    def create_submission_marker(submission_id: str) -> {}:
+        ttl = (datetime.now() + timedelta(days=SUBMISSION_MARKER_TTL_DAYS)).timestamp()
+        return {
+            'submission_id': {'S': submission_id},
+            'ttl': {'N': str(int(ttl))}
+        }
+
+    def get_submission_cursor(self, name: str) -> Optional[SubmissionCursor]:
+        """
+        :param name: of the cursor, one per subreddit
+        :return: the newest submission processed so far or None if nothing has been processed yet
+        """
+        try:
+            item = self.client.get_item(
+                TableName=SUBMISSION_CURSORS_TABLE_NAME,
+                Key={
+                    'cursor_name': {'S': name}
+                },
+                ConsistentRead=True
+            )['Item']
+            return SubmissionCursor(item['fullname']['S'], float(item['created_utc']['N']))
+        except KeyError:
+            return None
+
+    def set_submission_cursor(self, name: str, cursor: SubmissionCursor):
         return self.client.put_item(
-            TableName=SENT_NOTIFICATIONS_TABLE_NAME,
+            TableName=SUBMISSION_CURSORS_TABLE_NAME,
             Item={
-                'id': {'S': notification_id},
-                'ttl': {'N': str(int(ttl))}
+                'cursor_name': {'S': name},
+                'fullname': {'S': cursor.fullname},
+                'created_utc': {'N': str(cursor.created_utc)}
             },
             ReturnValues='NONE'
         )
 
+    @timed('MarkerWrite')
+    def add_notification_markers(self, notification_ids: [str]):
+        ttl = str(int((datetime.now() + timedelta(days=5)).timestamp()))
+        self.batch_write_items(SENT_NOTIFICATIONS_TABLE_NAME, [{'id': {'S': i}, 'ttl': {'N': ttl}} for i in notification_ids])
+        for notification_id in notification_ids:
+            self.sent_notifications_cache.add(notification_id)
+
     def add_blocked_user(self, user_id):
-        return self.client.put_item(
+        response = self.client.put_item(
             TableName=BLOCKED_USERS_TABLE_NAME,
             Item={
                 'user_id': {'S': user_id}
             },
             ReturnValues='NONE'
         )
+        self.blocked_users_cache.add(user_id)
+        return response
 
     def unblock_user(self, user_id):
         self.client.delete_item(
@@ -133,29 +621,32 @@ class Database:
             },
             ReturnValues='NONE'
         )
+        self.blocked_users_cache.discard(user_id)
 
     def subscribe_user_to_all_dd_feed(self, user_name: str):
         self.client.put_item(
-            TableName='all-dd-subscribers',
+            TableName=ALL_DD_SUBSCRIBERS_TABLE_NAME,
             Item={
                 'user_name': {'S': user_name}
             },
             ReturnValues='NONE'
         )
+        self.all_dd_subscribers_cache.add(user_name)
 
     def unsubscribe_user_from_all_dd_feed(self, user_name: str):
         self.client.delete_item(
-            TableName='all-dd-subscribers',
+            TableName=ALL_DD_SUBSCRIBERS_TABLE_NAME,
             Key={
                 'user_name': {'S': user_name}
             },
             ReturnValues='NONE'
         )
+        self.all_dd_subscribers_cache.discard(user_name)
 
     def is_user_subscribed_to_all_dd_feed(self, user_name: str):
         try:
             self.client.get_item(
-                TableName='all-dd-subscribers',
+                TableName=ALL_DD_SUBSCRIBERS_TABLE_NAME,
                 Key={
                     'user_name': {'S': user_name}
                 }
@@ -164,8 +655,11 @@ class Database:
         except KeyError:
             return False
 
+    @timed('SubscriberLookup')
     def get_users_subscribed_to_all_dd_feed(self) -> [str]:
-        try:
-            return [i['user_name']['S'] for i in self.client.scan(TableName='all-dd-subscribers')['Items']]
-        except KeyError:
-            return []
+        """
+        :return: every user subscribed to the all DD feed, served from the warm container's copy when it is fresh
+        """
+        return self.all_dd_subscribers_cache.users(
+            lambda: [i['user_name']['S'] for i in self.scan_all(ALL_DD_SUBSCRIBERS_TABLE_NAME, 'user_name')]
+        )
@@ -3,16 +3,55 @@ BOT_HELPER_USERNAME = "WSBTickerBotHandler"
 DEFAULT_ACCOUNT_AGE = 15
 DEFAULT_SUBMISSION_RETRIEVE_LIMIT = 30
 DEFAULT_REPROCESS = False
+# Upper bound on submissions paged through in one run when catching up to the submission cursor
+MAX_SUBMISSIONS_PER_RUN = 500
 MAX_NOTIFICATION_THREADPOOL_WORKERS = 6
+# Subscription changes from one message are made concurrently, one ticker item per update
+MAX_SUBSCRIPTION_UPDATE_WORKERS = 10
 MAX_TICKERS_ALLOWED_IN_SUBMISSION = 30
 MAX_TICKERS_TO_SUBSCRIBE_AT_ONCE = 10
 MAX_USERS_TO_NOTIFY_PER_CHUNK = 60
+# Streaming mode processes submissions once this many have arrived, this many seconds after the first arrived,
+# or as soon as the stream has nothing new
+STREAM_BATCH_SIZE = 10
+STREAM_BATCH_SECONDS = 15
+STREAM_PAUSE_AFTER = 0
+STREAM_RESTART_SECONDS = 30
+# Each notifier invocation handles one queue message so this bounds its run time
+NOTIFICATIONS_PER_SQS_MESSAGE = 10
+# Notifications are queued on SQS or put on a Kinesis stream, picked per deployment with the NotificationTransport
+# environment variable
+DEFAULT_NOTIFICATION_TRANSPORT = 'sqs'
+NOTIFICATIONS_PER_KINESIS_RECORD = 10
+# Users are hashed into this many Kinesis partition keys, spread over the stream's shards. The stream notifiers in
+# deployment/template.yml split the partitions between the bot accounts by listing them, keep the lists in step
+NOTIFICATION_PARTITIONS = 64
+# Reddit messages can be sent in a burst of this size and are then paced at this rate
+REDDIT_SEND_BURST = 5
+REDDIT_SENDS_PER_SECOND = 1
+# Longer waits asked for by Reddit fail the invocation so it is retried later rather than blocking it
+MAX_RATE_LIMIT_WAIT_SECONDS = 10
 SUBREDDIT = 'wallstreetbets'
 # These will be excluded unless there is a $ before them
 TICKER_EXCLUSIONS = ["OTM", "ITM", "ATM", "ATH", "MACD", "ROI", "GAIN", "LOSS", "TLDR", "CEO", "WSB", "EOD", "YTD",
                      "LLC", "IMO", "CEO", "CFO", "FBI", "SEC", "THE", "NYSE", "USA", "IMF", "AND", "BABY", "EST", "PDT",
                      "IPO", "YOLO", "LONG", "VEGA", "THETA", "GAMMA", "DELTA", "STOP", "ALL"
                      ]
-UNREAD_MESSAGES_TO_PROCESS = 50
+# Inbox messages are handled in batches of this size until the inbox is caught up or the time budget is spent.
+# On Lambda the budget is the invocation's remaining time less the margin, which leaves time for the updates in
+# flight and marking the batch read before the Lambda is stopped. Elsewhere the fixed budget is used
+INBOX_BATCH_SIZE = 10
+INBOX_TIME_BUDGET_SECONDS = 12
+INBOX_TIME_MARGIN_SECONDS = 5
+MAX_INBOX_THREADPOOL_WORKERS = 4
+# Per stage timings and counters are emitted once per invocation in CloudWatch's embedded metric format when the
+# EmitMetrics environment variable is 'true'
+DEFAULT_EMIT_METRICS = False
+METRICS_NAMESPACE = 'WsbTickerBot'
+# An event with "profile": true runs the handler under cProfile and traces its Reddit and AWS calls, the summary
+# lists this many entries and is written to the log on Lambda or to PROFILE_OUTPUT_DIR elsewhere
+DEFAULT_PROFILE = False
+PROFILE_TOP_ENTRIES = 20
+PROFILE_OUTPUT_DIR = 'profiles'
 # VALID_FLAIRS = {'DD', 'Discussion', 'Fundamentals'}
 VALID_FLAIRS = {'DD'}
@@ -1,34 +1,144 @@
+import logging
 import os
-import pickle
+import time
+import zlib
+from dataclasses import dataclass
 
-import boto3
-from boto3 import Session
-from botocore.exceptions import ProfileNotFound
+from clients import get_client
+from defaults import NOTIFICATION_PARTITIONS, NOTIFICATIONS_PER_KINESIS_RECORD
+from notification_codec import NotificationsNotQueuedError, decode_notifications, pack_notifications
+
+# Kinesis limits a record's data and partition key to 1 MiB and a put_records call to 500 records and 5 MiB
+MAX_RECORD_BYTES = 1024 * 1024
+MAX_RECORDS_PER_PUT = 500
+MAX_PUT_BYTES = 5 * 1024 * 1024
+MAX_PUT_ATTEMPTS = 3
+PUT_RETRY_BASE_SECONDS = 0.1
+
+logger = logging.getLogger()
+logger.setLevel(logging.INFO)
+
+
+@dataclass
+class PutStats(object):
+    notifications: int = 0
+    records: int = 0
+    puts: int = 0
+    bytes: int = 0
+    retried: int = 0
+    failed: int = 0
+
+    @property
+    def notifications_per_record(self) -> float:
+        return self.notifications / self.records if self.records else 0.0
+
+
+def partition_key(user: str) -> str:
+    """
+    :return: the partition a user's notifications are written to, the same for every run so one user's
+             notifications are always handled by the consumer of one shard
+    """
+    return str(zlib.crc32(user.encode()) % NOTIFICATION_PARTITIONS)
+
+
+def record_size(record: {}) -> int:
+    return len(record['Data']) + len(record['PartitionKey'].encode())
 
 
 class Kinesis:
     def __init__(self, stream_name=None):
-        try:
-            # Useful for local development using an aws profile, will fail on lambda but method below will succeed
-            self.session: Session = boto3.session.Session(profile_name="wsb-ticker-bot")
-        except ProfileNotFound:
-            self.session: Session = boto3.session.Session()
-        self.client = self.session.client('kinesis')
+        self.client = get_client('kinesis')
 
         if stream_name is not None:
             self.stream_name = stream_name
         else:
             self.stream_name = os.environ["NotificationsStreamName"]
 
-    def send_notification_batch(self, notifications):
-        self.client.put_records(
-            StreamName=self.stream_name,
-            Records=[self.create_notification_message(n) for n in notifications]
+    def send_notification_batch(self, notifications) -> PutStats:
+        """
+        Aggregate notifications into as few records as the Kinesis limits allow, keeping each record to one partition,
+        and put them in as few put_records calls as possible, resending any records Kinesis reports as failed
+        :raises NotificationsNotQueuedError: once every put has been tried, if any record could not be put
+        """
+        stats = PutStats(notifications=len(notifications))
+        records = self.pack_records(notifications)
+        stats.records = len(records)
+        stats.bytes = sum(record_size(r) for r in records)
+
+        unsent = []
+        for put in self.pack_puts(records):
+            stats.puts += 1
+            unsent.extend(self.put_records(put, stats))
+
+        logger.info(
+            f'Put {stats.notifications} notifications in {stats.records} records and {stats.puts} calls, '
+            f'{stats.notifications_per_record:.1f} notifications per record'
         )
+        if len(unsent) > 0:
+            raise NotificationsNotQueuedError([n for r in unsent for n in decode_notifications(r['Data'].decode())])
+        return stats
+
+    def put_records(self, records: [{}], stats: PutStats) -> [{}]:
+        """
+        Put one batch of records, resending only the records which failed
+        :return: the records which could not be put
+        """
+        attempt = 0
+        while len(records) > 0:
+            if attempt > 0:
+                time.sleep(PUT_RETRY_BASE_SECONDS * 2 ** (attempt - 1))
+            response = self.client.put_records(StreamName=self.stream_name, Records=records)
+            attempt += 1
+            if response.get('FailedRecordCount', 0) == 0:
+                return []
+            # Results are in the same order as the records which were put
+            failed = [(record, result) for record, result in zip(records, response['Records']) if 'ErrorCode' in result]
+            if attempt == MAX_PUT_ATTEMPTS:
+                for record, result in failed:
+                    logger.error(f"Could not put notification record for partition {record['PartitionKey']}: "
+                                 f"{result['ErrorCode']} {result.get('ErrorMessage', '')}")
+                stats.failed += len(failed)
+                return [record for record, _ in failed]
+            stats.retried += len(failed)
+            records = [record for record, _ in failed]
+        return []
+
+    @staticmethod
+    def pack_records(notifications, max_bytes=MAX_RECORD_BYTES, max_notifications=NOTIFICATIONS_PER_KINESIS_RECORD) -> [{}]:
+        """
+        Group notifications by partition and aggregate each partition's notifications into records
+        """
+        partitions = {}
+        for notification in notifications:
+            partitions.setdefault(partition_key(notification[0]), []).append(notification)
+        return [
+            Kinesis.create_notification_record(key, payload)
+            for key, partition in partitions.items()
+            for payload in pack_notifications(partition, max_bytes - len(key.encode()), max_notifications)
+        ]
+
+    @staticmethod
+    def pack_puts(records: [{}], max_bytes=MAX_PUT_BYTES, max_records=MAX_RECORDS_PER_PUT) -> [[{}]]:
+        """
+        Group records into put_records calls which stay within the record count and payload limits
+        """
+        puts = []
+        current = []
+        current_bytes = 0
+        for record in records:
+            size = record_size(record)
+            if len(current) == max_records or (len(current) > 0 and current_bytes + size > max_bytes):
+                puts.append(current)
+                current, current_bytes = [], 0
+            current.append(record)
+            current_bytes += size
+        if len(current) > 0:
+            puts.append(current)
+        return puts
 
     @staticmethod
-    def create_notification_message(notification):
+    def create_notification_record(key: str, payload: str) -> {}:
         return {
-            'Data': pickle.dumps(notification),
-            'PartitionKey': 'default'
+            'Data': payload.encode(),
+            'PartitionKey': key
         }
@@ -1,27 +1,42 @@
 import logging
 import os
 
-from utils import generate_notification_id, decode_notification_from_sqs
+from database import log_cache_stats
+from metrics import metrics
+from notification_delivery import NotificationDelivery
+from profiling import profiled
+from rate_limit import RateLimitExceeded
+from utils import decode_notification_record
 from wsb_reddit import WSBReddit
 
 logger = logging.getLogger()
 logger.setLevel(logging.INFO)
 
 
+@profiled
 def run_notify(event, context):
     bot_user = os.environ['BotUserName']
-    wsb_reddit = WSBReddit(bot_user)
+    metrics.begin('notify', {'BotUser': bot_user})
+    try:
+        notify(bot_user, event['Records'])
+    finally:
+        metrics.flush()
+
 
-    records = event['Records']
+def notify(bot_user: str, records: [{}]):
+    wsb_reddit = WSBReddit(bot_user)
+    delivery = NotificationDelivery(wsb_reddit)
 
     for notification_event in records:
-        notifications = decode_notification_from_sqs(notification_event['body'])
+        notifications = decode_notification_record(notification_event)
         logger.info(f"{bot_user} processing one batch of {len(notifications)} notifications")
-        for notification in notifications:
-            notification_id = generate_notification_id(notification)
-            has_notified = wsb_reddit.database.has_already_notified(notification_id)
-            if not has_notified:
-                wsb_reddit.notify(notification)
-                wsb_reddit.database.add_notification_marker(notification_id)
+        try:
+            num_sent = delivery.deliver(notifications)
+        except RateLimitExceeded as e:
+            logger.warning(f"{bot_user} is rate limited, the batch will be retried: {e}")
+            metrics.count('RateLimitedBatches')
+            raise
+        logger.info(f"{bot_user} sent {num_sent} of {len(notifications)} notifications in the batch")
 
+    log_cache_stats()
     logger.info(f"{bot_user} finished processing")
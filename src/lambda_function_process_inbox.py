@@ -1,12 +1,35 @@
 import logging
 import os
 
+from database import log_cache_stats
+from defaults import INBOX_TIME_BUDGET_SECONDS, INBOX_TIME_MARGIN_SECONDS
+from metrics import metrics
+from profiling import profiled
 from wsb_reddit import WSBReddit
 
 logger = logging.getLogger()
 logger.setLevel(logging.INFO)
 
 
+def inbox_time_budget(context) -> float:
+    """
+    :return: seconds to spend processing the inbox, the invocation's remaining time less a safety margin on Lambda
+    """
+    if context is None:
+        return INBOX_TIME_BUDGET_SECONDS
+    return max(0.0, context.get_remaining_time_in_millis() / 1000 - INBOX_TIME_MARGIN_SECONDS)
+
+
+@profiled
 def run_process_inbox(event, context):
-    wsb_reddit = WSBReddit(os.environ['BotUserName'])
-    wsb_reddit.process_inbox()
+    try:
+        event['time_budget']
+    except KeyError:
+        event['time_budget'] = inbox_time_budget(context)
+    metrics.begin('process_inbox', {'BotUser': os.environ['BotUserName']})
+    try:
+        wsb_reddit = WSBReddit(os.environ['BotUserName'])
+        wsb_reddit.process_inbox(event['time_budget'])
+        log_cache_stats()
+    finally:
+        metrics.flush()
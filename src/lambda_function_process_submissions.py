@@ -2,12 +2,15 @@ import logging
 import os
 
 from defaults import *
+from metrics import metrics
+from profiling import profiled
 from wsb_reddit import WSBReddit
 
 logger = logging.getLogger()
 logger.setLevel(logging.INFO)
 
 
+@profiled
 def run_process_submissions(event, context):
     # Use these keys for configuring the bot at runtime using events (can send test events in lambda)
     try:
@@ -20,15 +23,29 @@ def run_process_submissions(event, context):
         event['reprocess'] = DEFAULT_REPROCESS
 
     logger.info(f"Running with settings: {event}")
-    run(
-        event['submission_limit'],
-        event['reprocess']
-    )
+    metrics.begin('process_submissions', {'BotUser': os.environ['BotUserName']})
+    try:
+        run(
+            event['submission_limit'],
+            event['reprocess']
+        )
+    finally:
+        metrics.flush()
     logger.info("Finished Running")
 
 
 def run(submission_limit: int, reprocess: bool):
     wsb_reddit = WSBReddit(os.environ['BotUserName'])
-    submissions = wsb_reddit.get_submissions(limit=submission_limit, flair_filter=True)
-
-    wsb_reddit.process_submissions(submissions, reprocess=reprocess)
+    if reprocess:
+        submissions = wsb_reddit.get_submissions(limit=submission_limit, flair_filter=True)
+        wsb_reddit.process_submissions(submissions, reprocess=reprocess)
+        return
+
+    cursor = wsb_reddit.database.get_submission_cursor(SUBREDDIT)
+    # Without a cursor only look back as far as the configured limit
+    limit = MAX_SUBMISSIONS_PER_RUN if cursor is not None else submission_limit
+    submissions, new_cursor = wsb_reddit.get_new_submissions(cursor, limit=limit, flair_filter=True)
+    if len(submissions) > 0:
+        wsb_reddit.process_submissions(submissions)
+    if new_cursor is not None and new_cursor != cursor:
+        wsb_reddit.database.set_submission_cursor(SUBREDDIT, new_cursor)
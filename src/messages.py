@@ -1,17 +1,27 @@
+from __future__ import annotations
+
 import logging
 import random
 import urllib.parse
-from typing import Union
-
-from praw.models import Message, Comment
+from functools import lru_cache
+from typing import TYPE_CHECKING, Union
 
 from defaults import DEFAULT_ACCOUNT_AGE
 from stock_data.tickers import tickers as tickers_set
 from utils import reduce_notifications
 
+if TYPE_CHECKING:
+    from praw.models import Message, Comment
+
 logger = logging.getLogger()
 logger.setLevel(logging.INFO)
 
+# Submission blocks are rendered once and reused for every subscriber notified about the same post and tickers
+SUBMISSION_BLOCK_CACHE_SIZE = 4096
+TICKER_LINK_CACHE_SIZE = 4096
+# Comments suggest tickers from a sample picked once per container rather than from the whole symbol table
+EXAMPLE_TICKER_SAMPLE_SIZE = 100
+
 
 def reply_to(item: Union[Message, Comment], message: str):
     try:
@@ -30,15 +40,21 @@ def create_unsubscription_notification(tickers: [str]):
     return f'You are no longer subscribed to {", ".join(tickers)}'
 
 
+def create_subscriptions_list_notification(tickers: [str]):
+    if len(tickers) == 0:
+        return create_no_subscriptions_notification()
+    return f'You\'re subscribed to DD for {", ".join(tickers)}\n\n\n\n' + \
+           'To stop all of them reply `stop everything`'
+
+
+def create_no_subscriptions_notification():
+    return "You aren't subscribed to any tickers"
+
+
 def create_all_subscription_notification():
-    # u.message(
-    #     "I've subscribed you to all DD",
-    #     "You'll be notified when any new DD is posted\n\n\n\n" +
-    #     'To stop your subscription to all DD, reply `stop all`'
-    # )
-    return "The ALL DD feed is temporarily disabled\n\n" + \
-           "You'll still be subscribed, but you won't receive notifications until it's re-enabled\n\n\n\n" + \
-           f'In the meantime, you can subscribe to DD for specific tickers [here](https://np.reddit.com/message/compose/?to=WSBStockTickerBot&subject=Subscribe%20Me&message=Type%20tickers%20%24LIKE%20%24THIS%20anywhere%20in%20this%20message%20to%20subscribe%20to%20them)'
+    return "I've subscribed you to all DD\n\n" + \
+           "You'll be notified when any new DD is posted\n\n\n\n" + \
+           'To stop your subscription to all DD, reply `stop all`'
 
 
 def create_all_unsubscription_notification():
@@ -52,9 +68,13 @@ def create_error_notification():
            "[Try reading these instructions on how to use me](https://www.reddit.com/user/WSBStockTickerBot/comments/gt375p/how_to_use_me/)"
 
 
+@lru_cache(maxsize=1)
+def example_tickers() -> [str]:
+    return [tickers_set[i] for i in random.sample(range(len(tickers_set)), EXAMPLE_TICKER_SAMPLE_SIZE)]
+
+
 def make_comment_from_tickers(tickers: [str]):
-    ticker = random.choice(tuple(tickers_set))
-    ticker2 = random.choice(tuple(tickers_set))
+    ticker, ticker2 = random.sample(example_tickers(), 2)
     return (
         "I'm a bot, REEEEEEE\n\n"
         f"I've found these tickers in this submission: {' '.join([create_send_link_for_ticker(t) for t in tickers])}\n\n"
@@ -65,6 +85,7 @@ def make_comment_from_tickers(tickers: [str]):
     )
 
 
+@lru_cache(maxsize=TICKER_LINK_CACHE_SIZE)
 def create_send_link_for_ticker(ticker: str) -> str:
     return f'[{ticker}](https://np.reddit.com/message/compose/?to=WSBStockTickerBot&subject=Subscribe%20Me&message={ticker})'
 
@@ -78,18 +99,21 @@ def create_user_not_old_enough() -> str:
     return f'Your account must be older than {DEFAULT_ACCOUNT_AGE} days to use the bot'
 
 
-def make_pretty_message(ticker_notifications: [{}]) -> str:
-    pretty_message = ""
-    tickers = set()
+@lru_cache(maxsize=SUBMISSION_BLOCK_CACHE_SIZE)
+def render_submission_block(title: str, permalink: str, tickers: (str,)) -> str:
+    return f'## {" ".join(tickers)}:\n- [{title}]({permalink})\n\n\n'
+
 
-    notifications = reduce_notifications(ticker_notifications)
+def make_pretty_message(ticker_notifications: [{}]) -> str:
+    blocks = []
+    tickers = {}
 
-    for n in notifications:
-        pretty_message += f'## {" ".join(n[1])}:\n- [{n[0].title}]({n[0].permalink})\n\n\n'
-        [tickers.add(t) for t in n[1]]
+    for submission, submission_tickers in reduce_notifications(ticker_notifications):
+        blocks.append(render_submission_block(submission.title, submission.permalink, tuple(submission_tickers)))
+        tickers.update(dict.fromkeys(submission_tickers))
 
     tickers_in_this_notification = list(tickers)
     tickers_for_stop_example = random.sample(tickers_in_this_notification, k=2) if len(tickers_in_this_notification) > 1 else tickers_in_this_notification[:1]
 
-    pretty_message += f'To stop notifications, reply with the tickers you\'d like to stop like `stop {" ".join(tickers_for_stop_example)}`'
-    return pretty_message
+    blocks.append(f'To stop notifications, reply with the tickers you\'d like to stop like `stop {" ".join(tickers_for_stop_example)}`')
+    return ''.join(blocks)
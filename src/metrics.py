@@ -0,0 +1,147 @@
+import json
+import logging
+import os
+import threading
+import time
+from functools import wraps
+
+from defaults import DEFAULT_EMIT_METRICS, METRICS_NAMESPACE
+
+logger = logging.getLogger()
+logger.setLevel(logging.INFO)
+
+
+class _Stage:
+    __slots__ = ('metrics', 'name', 'started_at')
+
+    def __init__(self, metrics, name: str):
+        self.metrics = metrics
+        self.name = name
+
+    def __enter__(self):
+        self.started_at = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.metrics.duration(self.name, time.perf_counter() - self.started_at)
+        self.metrics.count(f'{self.name}Calls')
+        return False
+
+
+class _NoStage:
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        return False
+
+
+_NO_STAGE = _NoStage()
+
+
+class Metrics:
+    """
+    Timings and counters for one handler invocation, printed as one CloudWatch embedded metric format (EMF) log line
+    when the invocation finishes. Stages can run on several threads at once and may nest, a stage's time includes
+    the stages run inside it
+    When disabled every call returns straight away so instrumented code costs next to nothing
+    """
+
+    def __init__(self, namespace: str = METRICS_NAMESPACE, enabled: bool = False, emit=print):
+        self.namespace = namespace
+        self.enabled = enabled
+        self.handler = None
+        self.dimensions = {}
+        self.durations = {}
+        self.counts = {}
+        self._emit = emit
+        self._lock = threading.Lock()
+
+    def begin(self, handler: str, dimensions: {str: str} = None, enabled: bool = None):
+        """
+        Start collecting for an invocation of @handler, enabled by the EmitMetrics environment variable by default
+        :param dimensions: besides the handler, e.g. the bot user the invocation runs as
+        """
+        if enabled is None:
+            enabled = os.environ.get('EmitMetrics', str(DEFAULT_EMIT_METRICS)).lower() == 'true'
+        with self._lock:
+            self.enabled = enabled
+            self.handler = handler
+            self.dimensions = {'Handler': handler, **(dimensions or {})}
+            self.durations = {}
+            self.counts = {}
+
+    def stage(self, name: str):
+        """
+        :return: a context manager adding the time spent in it to @name and counting the call
+        """
+        return _Stage(self, name) if self.enabled else _NO_STAGE
+
+    def duration(self, name: str, seconds: float):
+        if not self.enabled:
+            return
+        with self._lock:
+            self.durations[name] = self.durations.get(name, 0.0) + seconds
+
+    def count(self, name: str, value: int = 1):
+        if not self.enabled:
+            return
+        with self._lock:
+            self.counts[name] = self.counts.get(name, 0) + value
+
+    def to_emf(self, timestamp: float = None) -> {}:
+        """
+        :return: the invocation's metrics as an EMF document, durations in milliseconds with a Time suffix
+        """
+        with self._lock:
+            values = {f'{name}Time': round(seconds * 1000, 3) for name, seconds in self.durations.items()}
+            values.update(self.counts)
+            definitions = [{'Name': f'{name}Time', 'Unit': 'Milliseconds'} for name in self.durations]
+            definitions += [{'Name': name, 'Unit': 'Count'} for name in self.counts]
+        return {
+            '_aws': {
+                'Timestamp': int((timestamp if timestamp is not None else time.time()) * 1000),
+                'CloudWatchMetrics': [{
+                    'Namespace': self.namespace,
+                    'Dimensions': [list(self.dimensions)],
+                    'Metrics': definitions
+                }]
+            },
+            **self.dimensions,
+            **values
+        }
+
+    def flush(self):
+        """
+        Emit the invocation's metrics, CloudWatch picks EMF documents out of the Lambda's log output
+        """
+        if not self.enabled:
+            return
+        try:
+            self._emit(json.dumps(self.to_emf(), separators=(',', ':')))
+        except Exception as e:
+            logger.error(f'Could not emit metrics for {self.handler}: {e}')
+        with self._lock:
+            self.durations = {}
+            self.counts = {}
+
+
+# Shared by everything running in this process, handlers begin and flush it once per invocation
+metrics = Metrics()
+
+
+def timed(name: str):
+    """
+    Decorate a function so every call to it is timed as stage @name
+    """
+    def decorator(f):
+        @wraps(f)
+        def wrapper(*args, **kwargs):
+            if not metrics.enabled:
+                return f(*args, **kwargs)
+            with metrics.stage(name):
+                return f(*args, **kwargs)
+        return wrapper
+    return decorator
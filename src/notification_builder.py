@@ -0,0 +1,75 @@
+import logging
+
+from submission_utils import SubmissionNotification
+
+ALL_DD_FLAIR = 'DD'
+
+logger = logging.getLogger()
+logger.setLevel(logging.INFO)
+
+
+def build_notifications(tickers_with_submissions: {str: [SubmissionNotification]}, get_users_subscribed_to_tickers,
+                        get_users_subscribed_to_all=None) -> {str: [{}]}:
+    """
+    Work out what to notify every subscribed user about
+    Users are collected into user -> {ticker -> notification}, each ticker's notification is built once and shared by
+    every user receiving it, so the work is linear in the number of subscriptions notified
+    :param get_users_subscribed_to_tickers: a function taking a list of tickers and returning each ticker mapped to its subscribers
+    :param get_users_subscribed_to_all: a function returning the users subscribed to the all DD feed, who are notified
+                                        about the DD submissions of every ticker
+    :return: each user mapped to their notifications, users with the most submissions to read about first
+    {'user': [
+        {'ticker': 'ticker1', 'subs': [submissions]},
+        {'ticker': 'ticker2', 'subs': [submissions]}
+    ]}
+    """
+    if len(tickers_with_submissions) == 0:
+        return {}
+    subscribed_users = get_users_subscribed_to_tickers(list(tickers_with_submissions.keys()))
+    has_dd = any(s.link_flair_text == ALL_DD_FLAIR for subs in tickers_with_submissions.values() for s in subs)
+    users_subscribed_to_all: [str] = get_users_subscribed_to_all() if has_dd and get_users_subscribed_to_all is not None else []
+    len(users_subscribed_to_all) > 0 and logger.info(f'Will notify {len(users_subscribed_to_all)} users subscribed to all DD')
+
+    user_tickers: {str: {str: {}}} = {}
+    notified_tickers = 0
+    for ticker, subs in tickers_with_submissions.items():
+        subs = unique_submissions(subs)
+        logger.info(f"Found ticker {ticker} mentioned in posts [{', '.join([s.id for s in subs])}]")
+        notification = {'ticker': ticker, 'subs': subs}
+        users_to_notify = subscribed_users.get(ticker, [])
+        for u in users_to_notify:
+            user_tickers.setdefault(u, {})[ticker] = notification
+
+        num_notified = len(users_to_notify)
+        dd_subs = [s for s in subs if s.link_flair_text == ALL_DD_FLAIR]
+        if len(dd_subs) > 0 and len(users_subscribed_to_all) > 0:
+            dd_notification = notification if len(dd_subs) == len(subs) else {'ticker': ticker, 'subs': dd_subs}
+            for u in users_subscribed_to_all:
+                tickers = user_tickers.setdefault(u, {})
+                # Users with their own subscription to the ticker already get every submission for it
+                if ticker not in tickers:
+                    tickers[ticker] = dd_notification
+                    num_notified += 1
+        if num_notified > 0:
+            logger.info(f'Will notify {num_notified} users about ticker {ticker}')
+            notified_tickers += 1
+
+    # Process largest notifications first so it fails if it can't be done
+    notifications = sorted(user_tickers.items(), key=lambda user: notification_size(user[1].values()), reverse=True)
+    notified_tickers > 0 and logger.info(f"Will notify users about a total of {notified_tickers} unique tickers")
+    return {user: list(tickers.values()) for user, tickers in notifications}
+
+
+def unique_submissions(subs: [SubmissionNotification]) -> [SubmissionNotification]:
+    """
+    :return: @subs without repeats of the same submission, in their original order
+    """
+    return list({s.id: s for s in subs}.values())
+
+
+def notification_size(ticker_notifications) -> int:
+    """
+    :return: the number of different submissions in a user's notifications, each is one entry in their message
+             however many of the user's tickers it mentions
+    """
+    return len({s.id for n in ticker_notifications for s in n['subs']})
@@ -0,0 +1,123 @@
+import base64
+import codecs
+import io
+import json
+import logging
+import pickle
+import zlib
+
+from submission_utils import SubmissionNotification
+
+# Payloads look like '<version>:<json>' or '<version>z:<base64 of zlib compressed json>'
+# Legacy payloads are base64 encoded pickles and never contain ':'
+WIRE_FORMAT_VERSION = 1
+# Payloads smaller than this are not worth compressing
+COMPRESSION_THRESHOLD_BYTES = 512
+
+logger = logging.getLogger()
+logger.setLevel(logging.INFO)
+
+
+class NotificationsNotQueuedError(Exception):
+    """
+    Raised when notifications could not be queued for delivery, so the submissions they are about are not marked
+    as processed and are picked up again by the next run
+    """
+
+    def __init__(self, notifications: [tuple]):
+        self.users = [user for user, _ in notifications]
+        self.submission_ids = {s.id for _, ticker_notifications in notifications for n in ticker_notifications for s in n['subs']}
+        super().__init__(f"Could not queue notifications for {len(self.users)} users: {', '.join(self.users[:10])}")
+
+
+def encode_notifications(notifications: [tuple]) -> str:
+    """
+    Encode a batch of notifications compactly. Every submission is written once and users refer to it by index
+    :param notifications: (user, [{'ticker': ticker, 'subs': [SubmissionNotification]}]) tuples
+    """
+    submission_indexes = {}
+    submissions = []
+    users = []
+    for user, ticker_notifications in notifications:
+        tickers = []
+        for n in ticker_notifications:
+            indexes = []
+            for s in n['subs']:
+                if s.id not in submission_indexes:
+                    submission_indexes[s.id] = len(submissions)
+                    submissions.append([s.id, s.link_flair_text, s.permalink, s.title])
+                indexes.append(submission_indexes[s.id])
+            tickers.append([n['ticker'], indexes])
+        users.append([user, tickers])
+
+    payload = json.dumps({'s': submissions, 'u': users}, separators=(',', ':'), ensure_ascii=False)
+    if len(payload) >= COMPRESSION_THRESHOLD_BYTES:
+        compressed = base64.b64encode(zlib.compress(payload.encode(), 9)).decode()
+        if len(compressed) < len(payload.encode()):
+            return f'{WIRE_FORMAT_VERSION}z:{compressed}'
+    return f'{WIRE_FORMAT_VERSION}:{payload}'
+
+
+def decode_notifications(encoded: str) -> [tuple]:
+    """
+    Decode a batch of notifications written by encode_notifications or by the pickle based encoding it replaced
+    """
+    header, separator, body = encoded.partition(':')
+    if separator == '':
+        return _decode_legacy(encoded)
+    if header == f'{WIRE_FORMAT_VERSION}z':
+        body = zlib.decompress(base64.b64decode(body)).decode()
+    elif header != str(WIRE_FORMAT_VERSION):
+        raise ValueError(f'Unsupported notification wire format {header}')
+
+    payload = json.loads(body)
+    submissions = [SubmissionNotification(*s) for s in payload['s']]
+    return [
+        (user, [{'ticker': ticker, 'subs': [submissions[i] for i in indexes]} for ticker, indexes in tickers])
+        for user, tickers in payload['u']
+    ]
+
+
+def encoded_size(encoded: str) -> int:
+    return len(encoded.encode())
+
+
+def pack_notifications(notifications: [tuple], max_bytes: int, max_notifications: int) -> [str]:
+    """
+    Greedily fill payloads with notifications until adding another would pass either limit
+    :return: the encoded payloads
+    """
+    payloads = []
+    current = []
+    current_payload = None
+    for notification in notifications:
+        if 0 < len(current) < max_notifications:
+            payload = encode_notifications(current + [notification])
+            if encoded_size(payload) <= max_bytes:
+                current.append(notification)
+                current_payload = payload
+                continue
+        if len(current) > 0:
+            payloads.append(current_payload)
+        current, current_payload = [notification], encode_notifications([notification])
+        if encoded_size(current_payload) > max_bytes:
+            logger.error(f'Notification for user {notification[0]} is too large to queue and will not be sent')
+            current, current_payload = [], None
+    if len(current) > 0:
+        payloads.append(current_payload)
+    return payloads
+
+
+class _NotificationUnpickler(pickle.Unpickler):
+    """
+    Only allows the types which legacy notification payloads are made of
+    """
+
+    def find_class(self, module, name):
+        if name == 'SubmissionNotification' and module in {'submission_utils', SubmissionNotification.__module__}:
+            return SubmissionNotification
+        raise pickle.UnpicklingError(f'{module}.{name} is not allowed in a notification payload')
+
+
+def _decode_legacy(encoded: str):
+    return _NotificationUnpickler(io.BytesIO(codecs.decode(encoded.encode(), 'base64'))).load()
@@ -0,0 +1,60 @@
+import logging
+from concurrent.futures import ThreadPoolExecutor
+
+from defaults import MAX_NOTIFICATION_THREADPOOL_WORKERS
+from metrics import metrics
+from utils import generate_notification_ids, remove_notified_submissions
+
+logger = logging.getLogger()
+logger.setLevel(logging.INFO)
+
+
+class NotificationDelivery:
+    """
+    Delivers notifications to users, overlapping the DynamoDB reads and marker writes with the Reddit sends
+    Sends happen one at a time on the calling thread and are paced by the Reddit client's rate limiter
+    """
+
+    def __init__(self, wsb_reddit, max_workers: int = MAX_NOTIFICATION_THREADPOOL_WORKERS):
+        self.wsb_reddit = wsb_reddit
+        self.database = wsb_reddit.database
+        self.max_workers = max_workers
+
+    def check_notification(self, notification) -> (tuple, [str], bool):
+        """
+        :return: the notification without the submissions the user has already been sent, None if there are none left,
+                 the ids to mark once it is sent and whether the user has blocked the bot
+        """
+        notification_ids = generate_notification_ids(notification)
+        sent_ids = self.database.get_sent_notification_ids(notification_ids)
+        if len(sent_ids) == len(notification_ids):
+            return None, [], False
+        user, _ = notification
+        unsent = remove_notified_submissions(notification, sent_ids) if len(sent_ids) > 0 else notification
+        return unsent, [i for i in notification_ids if i not in sent_ids], self.database.is_user_blocked(user)
+
+    def deliver(self, notifications: [tuple]) -> int:
+        """
+        Send every notification which hasn't been sent yet and mark it as sent, a user already sent some of the
+        submissions in a notification is only sent the rest
+        :return: the number of messages sent
+        """
+        num_sent = 0
+        with ThreadPoolExecutor(max_workers=self.max_workers) as pool:
+            checks = [pool.submit(self.check_notification, n) for n in notifications]
+            markers = []
+            for notification, check in zip(notifications, checks):
+                unsent, notification_ids, is_blocked = check.result()
+                if unsent is None:
+                    continue
+                if is_blocked:
+                    logger.debug(f'User {notification[0]} is on the blocked list, not notifying')
+                else:
+                    self.wsb_reddit.send_notification(unsent)
+                    num_sent += 1
+                markers.append(pool.submit(self.database.add_notification_markers, notification_ids))
+            for marker in markers:
+                marker.result()
+        metrics.count('NotificationsSent', num_sent)
+        metrics.count('NotificationsSkipped', len(notifications) - num_sent)
+        return num_sent
@@ -0,0 +1,151 @@
+import io
+import logging
+import os
+import re
+import threading
+import time
+from functools import wraps
+
+from defaults import DEFAULT_PROFILE, PROFILE_OUTPUT_DIR, PROFILE_TOP_ENTRIES
+
+logger = logging.getLogger()
+logger.setLevel(logging.INFO)
+
+# Reddit paths naming a user or submission are grouped into one entry per endpoint
+REDDIT_PATH_IDS = re.compile(r'/(user|u|comments|by_id)/[^/]+')
+
+
+def boto_call_name(client, operation_name: str, *args, **kwargs) -> str:
+    return f'{client.meta.service_model.service_name} {operation_name}'
+
+
+def reddit_call_name(requestor, method: str, url: str, *args, **kwargs) -> str:
+    from urllib.parse import urlparse
+    path = REDDIT_PATH_IDS.sub(r'/\1/*', urlparse(url).path)
+    return f'reddit {method} {path}'
+
+
+class RemoteCallTracer:
+    """
+    Times every boto3 API call and every HTTP request prawcore makes to Reddit, from any thread, while installed
+    boto3 calls are timed including botocore's retries, which is how long the bot waited for them
+    """
+
+    def __init__(self, clock=time.perf_counter):
+        self.calls = {}
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._originals = []
+
+    def record(self, name: str, seconds: float):
+        with self._lock:
+            count, total, longest = self.calls.get(name, (0, 0.0, 0.0))
+            self.calls[name] = (count + 1, total + seconds, max(longest, seconds))
+
+    def _wrap(self, owner, attribute: str, name_call):
+        original = getattr(owner, attribute)
+        tracer = self
+
+        @wraps(original)
+        def traced(*args, **kwargs):
+            started_at = tracer._clock()
+            try:
+                return original(*args, **kwargs)
+            finally:
+                # Tracing must never change what the traced call returns or raises
+                try:
+                    tracer.record(name_call(*args, **kwargs), tracer._clock() - started_at)
+                except Exception as e:
+                    logger.error(f'Could not trace a call to {attribute}: {e}')
+
+        setattr(owner, attribute, traced)
+        self._originals.append((owner, attribute, original))
+
+    def install(self):
+        from botocore.client import BaseClient
+        from prawcore.requestor import Requestor
+
+        self._wrap(BaseClient, '_make_api_call', boto_call_name)
+        self._wrap(Requestor, 'request', reddit_call_name)
+
+    def uninstall(self):
+        while len(self._originals) > 0:
+            owner, attribute, original = self._originals.pop()
+            setattr(owner, attribute, original)
+
+    def top_calls(self, limit: int = PROFILE_TOP_ENTRIES) -> [(str, int, float, float)]:
+        """
+        :return: (call, count, total seconds, longest seconds) of the calls which took longest in total
+        """
+        with self._lock:
+            calls = [(name, count, total, longest) for name, (count, total, longest) in self.calls.items()]
+        return sorted(calls, key=lambda c: c[2], reverse=True)[:limit]
+
+
+def format_summary(handler: str, wall_seconds: float, stats_text: str, top_calls: [(str, int, float, float)]) -> str:
+    lines = [f'Profile of {handler}, {wall_seconds * 1000:.0f}ms', f'Top {len(top_calls)} remote calls:',
+             f'{"calls":>6} {"total ms":>10} {"mean ms":>9} {"max ms":>9}  call']
+    for name, count, total, longest in top_calls:
+        lines.append(f'{count:>6} {total * 1000:>10.1f} {total / count * 1000:>9.1f} {longest * 1000:>9.1f}  {name}')
+    lines.append(stats_text.strip())
+    return '\n'.join(lines)
+
+
+def run_profiled(handler_name: str, f, *args, top: int = PROFILE_TOP_ENTRIES, output_dir: str = None):
+    """
+    Run f(*args) under cProfile while tracing remote calls and write a summary of the top functions and remote calls
+    On Lambda the summary goes to the log, elsewhere it and the raw profile are written to @output_dir
+    cProfile only sees the calling thread, work done on the handlers' thread pools shows up in the remote calls
+    """
+    import cProfile
+
+    tracer = RemoteCallTracer()
+    profile = cProfile.Profile()
+    tracer.install()
+    started_at = time.perf_counter()
+    try:
+        profile.enable()
+        try:
+            return f(*args)
+        finally:
+            profile.disable()
+    finally:
+        wall_seconds = time.perf_counter() - started_at
+        tracer.uninstall()
+        try:
+            report_profile(handler_name, wall_seconds, profile, tracer, top, output_dir or PROFILE_OUTPUT_DIR)
+        except Exception as e:
+            logger.error(f'Could not report the profile of {handler_name}: {e}')
+
+
+def report_profile(handler_name: str, wall_seconds: float, profile, tracer: RemoteCallTracer, top: int, output_dir: str):
+    import pstats
+
+    stats_text = io.StringIO()
+    pstats.Stats(profile, stream=stats_text).sort_stats('cumulative').print_stats(top)
+    summary = format_summary(handler_name, wall_seconds, stats_text.getvalue(), tracer.top_calls(top))
+    if 'AWS_LAMBDA_FUNCTION_NAME' in os.environ:
+        logger.info(summary)
+        return
+    os.makedirs(output_dir, exist_ok=True)
+    path = os.path.join(output_dir, f'{handler_name}-{time.strftime("%Y%m%d-%H%M%S")}')
+    profile.dump_stats(f'{path}.prof')
+    with open(f'{path}.txt', 'w') as summary_file:
+        summary_file.write(summary)
+    logger.info(f'Wrote profile of {handler_name} to {path}.txt and {path}.prof')
+
+
+def profiled(handler):
+    """
+    Decorate a Lambda handler so an event with "profile": true runs it under run_profiled
+    """
+    @wraps(handler)
+    def wrapper(event, context):
+        try:
+            event['profile']
+        except KeyError:
+            event['profile'] = DEFAULT_PROFILE
+        if not event['profile']:
+            return handler(event, context)
+        return run_profiled(handler.__name__, handler, event, context)
+    return wrapper
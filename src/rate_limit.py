@@ -0,0 +1,123 @@
+import threading
+import time
+
+from defaults import REDDIT_SEND_BURST, REDDIT_SENDS_PER_SECOND
+
+# Waits shorter than this are float rounding left over from a previous sleep and are not slept for
+MIN_WAIT_SECONDS = 1e-6
+
+
+class RateLimitExceeded(Exception):
+    """
+    Raised instead of blocking when the wait for the next call is longer than the caller allows
+    """
+
+    def __init__(self, wait_seconds: float):
+        super().__init__(f'Rate limited for another {wait_seconds:.1f} seconds')
+        self.wait_seconds = wait_seconds
+
+
+class TokenBucket:
+    """
+    Thread-safe token bucket used to keep calls to an external API within an allowed rate
+    Up to @capacity calls can be made at once, after which calls are paced at @rate per second.
+    The rate follows the limits the API reports and the bucket can be paused when the API asks us to back off
+    """
+
+    def __init__(self, rate: float, capacity: float, clock=time.monotonic, sleep=time.sleep, wall_clock=time.time,
+                 max_rate: float = None):
+        """
+        :param max_rate: the reported limits can only slow the bucket down below this, defaults to @rate
+        """
+        self.rate = rate
+        self.max_rate = max_rate if max_rate is not None else rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self._clock = clock
+        self._sleep = sleep
+        self._wall_clock = wall_clock
+        self._updated_at = clock()
+        self._paused_until = self._updated_at
+        self._lock = threading.Lock()
+
+    def _refill(self):
+        now = self._clock()
+        accrue_from = max(self._updated_at, self._paused_until)
+        if now > accrue_from:
+            self.tokens = min(self.capacity, self.tokens + (now - accrue_from) * self.rate)
+        self._updated_at = max(now, self._updated_at)
+
+    def _wait_time(self, tokens: float) -> float:
+        paused_for = self._paused_until - self._clock()
+        refill_for = (tokens - self.tokens) / self.rate if self.tokens < tokens else 0.0
+        wait_for = max(paused_for, refill_for)
+        return wait_for if wait_for > MIN_WAIT_SECONDS else 0.0
+
+    def _pause(self, seconds: float):
+        # Only the first call after the pause goes straight through, the rest are paced again
+        self.tokens = min(self.capacity, 1)
+        self._paused_until = max(self._paused_until, self._clock() + seconds)
+
+    def acquire(self, tokens: float = 1, max_wait: float = None) -> float:
+        """
+        Block until @tokens are available and take them
+        :param max_wait: raise RateLimitExceeded rather than wait longer than this many seconds
+        :return: the number of seconds spent waiting
+        """
+        waited = 0.0
+        with self._lock:
+            self._refill()
+            wait_for = self._wait_time(tokens)
+            if max_wait is not None and wait_for > max_wait:
+                raise RateLimitExceeded(wait_for)
+            while wait_for > 0:
+                self._sleep(wait_for)
+                waited += wait_for
+                self._refill()
+                wait_for = self._wait_time(tokens)
+            self.tokens -= tokens
+        return waited
+
+    def pause(self, seconds: float):
+        """
+        Stop handing out tokens for @seconds, used when the API responds with a rate limit error
+        """
+        with self._lock:
+            self._refill()
+            self._pause(seconds)
+
+    def update_from_limits(self, limits: {}):
+        """
+        Match the rate to the requests the API says are left in the current window, never going above max_rate
+        as the window's quota is shared with every other request while messages are throttled on their own
+        :param limits: with the remaining requests and the reset_timestamp (epoch seconds) of the window,
+                       as reported by praw's Reddit.auth.limits
+        """
+        remaining = limits.get('remaining')
+        reset_timestamp = limits.get('reset_timestamp')
+        if remaining is None or reset_timestamp is None:
+            return
+        seconds_until_reset = reset_timestamp - self._wall_clock()
+        if seconds_until_reset <= 0:
+            return
+        with self._lock:
+            self._refill()
+            if remaining < 1:
+                self._pause(seconds_until_reset)
+            else:
+                self.rate = min(self.max_rate, remaining / seconds_until_reset)
+                self.tokens = min(self.tokens, remaining)
+
+
+_buckets: {str: TokenBucket} = {}
+_buckets_lock = threading.Lock()
+
+
+def rate_limiter_for(account: str) -> TokenBucket:
+    """
+    :return: the token bucket shared by everything acting as @account in this process
+    """
+    with _buckets_lock:
+        if account not in _buckets:
+            _buckets[account] = TokenBucket(REDDIT_SENDS_PER_SECOND, REDDIT_SEND_BURST)
+        return _buckets[account]
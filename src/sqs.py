@@ -1,20 +1,53 @@
+import hashlib
+import logging
 import os
+import time
+from dataclasses import dataclass
 
-import boto3
-from boto3 import Session
-from botocore.exceptions import ProfileNotFound
+from clients import get_client
+from defaults import NOTIFICATIONS_PER_SQS_MESSAGE
+from notification_codec import NotificationsNotQueuedError, decode_notifications, encoded_size, pack_notifications
+from utils import encode_notification_for_sqs
 
-from utils import chunk_list, encode_notification_for_sqs
+# SQS limits a message, and all messages in one send_message_batch call together, to 256 KiB
+MAX_MESSAGE_BYTES = 256 * 1024
+MAX_BATCH_BYTES = 256 * 1024
+MAX_BATCH_ENTRIES = 10
+MAX_SEND_ATTEMPTS = 3
+SEND_RETRY_BASE_SECONDS = 0.1
+
+logger = logging.getLogger()
+logger.setLevel(logging.INFO)
+
+
+@dataclass
+class PackingStats(object):
+    notifications: int = 0
+    messages: int = 0
+    batches: int = 0
+    bytes: int = 0
+    retried: int = 0
+    failed: int = 0
+
+    @property
+    def notifications_per_message(self) -> float:
+        return self.notifications / self.messages if self.messages else 0.0
+
+    @property
+    def batch_fill(self) -> float:
+        """
+        :return: the average fraction of a send_message_batch payload budget that was used
+        """
+        return self.bytes / (self.batches * MAX_BATCH_BYTES) if self.batches else 0.0
+
+
+def message_size(body: str) -> int:
+    return encoded_size(body)
 
 
 class SQS:
     def __init__(self, queue_url=None):
-        try:
-            # Useful for local development using an aws profile, will fail on lambda but method below will succeed
-            self.session: Session = boto3.session.Session(profile_name="wsb-ticker-bot")
-        except ProfileNotFound:
-            self.session: Session = boto3.session.Session()
-        self.client = self.session.client('sqs')
+        self.client = get_client('sqs')
 
         if queue_url is not None:
             self.queue_url = queue_url
@@ -27,16 +60,85 @@ class SQS:
             MessageBody=encode_notification_for_sqs(notification)
         )
 
-    def send_notification_batch(self, notifications):
-        total = []
-        for entries_chunk in chunk_list(notifications, 10):
-            total.append(encode_notification_for_sqs(entries_chunk))
+    def send_notification_batch(self, notifications) -> PackingStats:
+        """
+        Pack notifications into as few messages and send_message_batch calls as the SQS size limits allow
+        and resend any entries SQS reports as failed
+        :raises NotificationsNotQueuedError: once every batch has been tried, if any message could not be sent
+        """
+        stats = PackingStats(notifications=len(notifications))
+        messages = self.pack_messages(notifications)
+        stats.messages = len(messages)
+        stats.bytes = sum(message_size(m) for m in messages)
 
-        for chunk_of_total in chunk_list(total, 10):
-            self.client.send_message_batch(
-                QueueUrl=self.queue_url,
-                Entries=[self.create_notification_message(e) for e in chunk_of_total]
-            )
+        unsent = []
+        for batch in self.pack_batches(messages):
+            stats.batches += 1
+            entries = [self.create_notification_message(f'{stats.batches}-{i}', body) for i, body in enumerate(batch)]
+            unsent.extend(e['MessageBody'] for e in self.send_entries(entries, stats))
+
+        logger.info(
+            f'Sent {stats.notifications} notifications in {stats.messages} messages and {stats.batches} batches, '
+            f'{stats.notifications_per_message:.1f} notifications per message, {stats.batch_fill:.1%} average batch fill'
+        )
+        if len(unsent) > 0:
+            raise NotificationsNotQueuedError([n for body in unsent for n in decode_notifications(body)])
+        return stats
+
+    def send_entries(self, entries: [{}], stats: PackingStats) -> [{}]:
+        """
+        Send one batch of entries, resending only the entries which failed for reasons other than the request itself
+        :return: the entries which could not be sent
+        """
+        attempt = 0
+        unsent = []
+        while len(entries) > 0:
+            if attempt > 0:
+                time.sleep(SEND_RETRY_BASE_SECONDS * 2 ** (attempt - 1))
+            response = self.client.send_message_batch(QueueUrl=self.queue_url, Entries=entries)
+            attempt += 1
+            failed = response.get('Failed', [])
+            if len(failed) == 0:
+                return unsent
+            entries_by_id = {e['Id']: e for e in entries}
+            retryable = [f for f in failed if not f.get('SenderFault')]
+            for f in failed:
+                if f.get('SenderFault') or attempt == MAX_SEND_ATTEMPTS:
+                    logger.error(f"Could not queue notification message {f['Id']}: {f.get('Code')} {f.get('Message', '')}")
+                    stats.failed += 1
+                    unsent.append(entries_by_id[f['Id']])
+            if attempt == MAX_SEND_ATTEMPTS:
+                return unsent
+            stats.retried += len(retryable)
+            entries = [entries_by_id[f['Id']] for f in retryable]
+        return unsent
+
+    @staticmethod
+    def pack_messages(notifications, max_bytes=MAX_MESSAGE_BYTES, max_notifications=NOTIFICATIONS_PER_SQS_MESSAGE) -> [str]:
+        """
+        Greedily fill message bodies with notifications until adding another would pass either limit
+        :return: the encoded message bodies
+        """
+        return pack_notifications(notifications, max_bytes, max_notifications)
+
+    @staticmethod
+    def pack_batches(messages: [str], max_bytes=MAX_BATCH_BYTES, max_entries=MAX_BATCH_ENTRIES) -> [[str]]:
+        """
+        Group message bodies into send_message_batch calls which stay within the entry and payload limits
+        """
+        batches = []
+        current = []
+        current_bytes = 0
+        for message in messages:
+            size = message_size(message)
+            if len(current) == max_entries or (len(current) > 0 and current_bytes + size > max_bytes):
+                batches.append(current)
+                current, current_bytes = [], 0
+            current.append(message)
+            current_bytes += size
+        if len(current) > 0:
+            batches.append(current)
+        return batches
 
     def delete_notification(self, notification_receipt_handle):
         self.client.delete_message(
@@ -45,8 +147,11 @@ class SQS:
         )
 
     @staticmethod
-    def create_notification_message(notification):
+    def create_notification_message(entry_id: str, body: str):
+        """
+        :param entry_id: unique within the batch, the body's digest is added to make it traceable in failures
+        """
         return {
-            'Id': str(hash(str(notification))),
-            'MessageBody': notification
+            'Id': f'{entry_id}-{hashlib.sha1(body.encode()).hexdigest()[:16]}',
+            'MessageBody': body
         }
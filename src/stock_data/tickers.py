@@ -1,12 +1,145 @@
+import mmap
 import os
-import pickle
+import struct
+from dataclasses import dataclass
+from functools import lru_cache
+from typing import Iterable, Optional
 
-combined_file_name = f'{os.path.dirname(__file__)}/combined.pkl'
+symbols_file_name = f'{os.path.dirname(__file__)}/symbols.bin'
 
+# File layout: a header followed by fixed-width records sorted by symbol so they can be binary searched in place
+# header: magic, format version, record size, record count
+# record: NUL padded ascii symbol, exchange code, flags
+MAGIC = b'WSBT'
+FORMAT_VERSION = 1
+HEADER = struct.Struct('<4sBBxxI')
+SYMBOL_WIDTH = 8
+RECORD = struct.Struct(f'<{SYMBOL_WIDTH}scB')
 
-def load_tickers():
-    with open(combined_file_name, 'rb') as f:
-        return pickle.load(f)
+ETF_FLAG = 0b01
+TEST_ISSUE_FLAG = 0b10
 
+# Membership checks of the most recently parsed tokens are remembered, bounded as long DD bodies are full of tokens
+LOOKUP_CACHE_SIZE = 8192
 
-tickers = load_tickers()
+# Nasdaq is not in the otherlisted exchange column so it gets its own code
+NASDAQ_EXCHANGE = 'Q'
+UNKNOWN_EXCHANGE = '?'
+
+
+@dataclass(frozen=True)
+class SymbolInfo(object):
+    symbol: str
+    exchange: str
+    is_etf: bool
+    is_test_issue: bool
+
+
+class SymbolTable:
+    """
+    Read-only view over the binary symbol directory
+    The file is memory-mapped on first use and symbols are only turned into python objects when they are looked up
+    """
+
+    def __init__(self, file_name: str):
+        self.file_name = file_name
+        self._mm: Optional[mmap.mmap] = None
+        self._count = 0
+        self._record_size = RECORD.size
+        self._contains = lru_cache(maxsize=LOOKUP_CACHE_SIZE)(self._is_symbol)
+
+    def _records(self) -> mmap.mmap:
+        if self._mm is None:
+            with open(self.file_name, 'rb') as f:
+                mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            magic, version, record_size, count = HEADER.unpack_from(mm, 0)
+            if magic != MAGIC or version != FORMAT_VERSION:
+                mm.close()
+                raise ValueError(f'{self.file_name} is not a version {FORMAT_VERSION} symbol table')
+            self._record_size = record_size
+            self._count = count
+            self._mm = mm
+        return self._mm
+
+    def _symbol_at(self, mm: mmap.mmap, index: int) -> bytes:
+        offset = HEADER.size + index * self._record_size
+        return mm[offset:offset + SYMBOL_WIDTH]
+
+    def _find(self, symbol: str) -> int:
+        """
+        :return: the record index of the symbol or -1 if it is not in the table
+        """
+        if len(symbol) > SYMBOL_WIDTH or not symbol.isascii():
+            return -1
+        mm = self._records()
+        key = symbol.encode().ljust(SYMBOL_WIDTH, b'\0')
+        lo, hi = 0, self._count
+        while lo < hi:
+            mid = (lo + hi) // 2
+            current = self._symbol_at(mm, mid)
+            if current < key:
+                lo = mid + 1
+            elif current > key:
+                hi = mid
+            else:
+                return mid
+        return -1
+
+    def _is_symbol(self, symbol) -> bool:
+        return isinstance(symbol, str) and self._find(symbol) != -1
+
+    def __contains__(self, symbol) -> bool:
+        try:
+            return self._contains(symbol)
+        except TypeError:
+            # Unhashable values can't be cached and are never symbols
+            return False
+
+    def __len__(self) -> int:
+        self._records()
+        return self._count
+
+    def __getitem__(self, index: int) -> str:
+        mm = self._records()
+        if index < 0:
+            index += self._count
+        if not 0 <= index < self._count:
+            raise IndexError('symbol table index out of range')
+        return self._symbol_at(mm, index).rstrip(b'\0').decode()
+
+    def __iter__(self):
+        for i in range(len(self)):
+            yield self[i]
+
+    def lookup(self, symbol: str) -> Optional[SymbolInfo]:
+        """
+        :return: exchange and ETF metadata for the symbol or None if it is not a known symbol
+        """
+        index = self._find(symbol)
+        if index == -1:
+            return None
+        offset = HEADER.size + index * self._record_size
+        _, exchange, flags = RECORD.unpack_from(self._records(), offset)
+        return SymbolInfo(symbol, exchange.decode(), bool(flags & ETF_FLAG), bool(flags & TEST_ISSUE_FLAG))
+
+
+def write_symbol_table(symbols: Iterable[SymbolInfo], file_name: str = symbols_file_name):
+    """
+    Write symbols into the binary format read by SymbolTable, the first occurrence of a duplicate symbol wins
+    """
+    records = {}
+    for s in symbols:
+        if len(s.symbol) == 0 or len(s.symbol) > SYMBOL_WIDTH or not s.symbol.isascii():
+            raise ValueError(f'Symbol {s.symbol!r} can not be stored in the symbol table')
+        key = s.symbol.encode().ljust(SYMBOL_WIDTH, b'\0')
+        if key not in records:
+            flags = (ETF_FLAG if s.is_etf else 0) | (TEST_ISSUE_FLAG if s.is_test_issue else 0)
+            records[key] = RECORD.pack(key, s.exchange.encode()[:1] or UNKNOWN_EXCHANGE.encode(), flags)
+
+    with open(file_name, 'wb') as f:
+        f.write(HEADER.pack(MAGIC, FORMAT_VERSION, RECORD.size, len(records)))
+        for key in sorted(records):
+            f.write(records[key])
+
+
+tickers = SymbolTable(symbols_file_name)
@@ -0,0 +1,143 @@
+import argparse
+import logging
+import os
+import time
+
+from defaults import *
+from metrics import metrics
+from notification_codec import NotificationsNotQueuedError
+from submission_utils import SubmissionCursor
+from wsb_reddit import WSBReddit
+
+logger = logging.getLogger()
+logger.setLevel(logging.INFO)
+
+
+class SubmissionStream:
+    """
+    Long running alternative to the scheduled submissions handler which notifies users as soon as DD is posted
+    New submissions are collected from the subreddit stream and processed in micro-batches using the same
+    dedup markers and submission cursor as the scheduled handler
+    """
+
+    def __init__(self, wsb_reddit: WSBReddit, batch_size: int = STREAM_BATCH_SIZE,
+                 batch_seconds: float = STREAM_BATCH_SECONDS, clock=time.monotonic):
+        self.wsb_reddit = wsb_reddit
+        self.batch_size = batch_size
+        self.batch_seconds = batch_seconds
+        self._clock = clock
+        self.batch = []
+        self.batch_started_at = None
+        self.cursor = None
+
+    def catch_up(self):
+        """
+        Process anything posted since the submission cursor so nothing is missed while the stream was down
+        """
+        self.cursor = self.wsb_reddit.database.get_submission_cursor(SUBREDDIT)
+        if self.cursor is None:
+            return
+        submissions, cursor = self.wsb_reddit.get_new_submissions(self.cursor, flair_filter=True)
+        len(submissions) > 0 and logger.info(f'Catching up on {len(submissions)} submissions')
+        self.process(submissions, cursor)
+
+    def run(self, max_batches: int = None) -> int:
+        """
+        Stream submissions until the stream ends or @max_batches have been processed
+        :return: the number of batches processed
+        """
+        num_batches = 0
+        # The stream starts with the newest existing submissions so nothing posted since catching up is missed,
+        # the ones already seen are skipped here and process_submissions skips any with a marker
+        stream = self.wsb_reddit.wsb.stream.submissions(pause_after=STREAM_PAUSE_AFTER)
+        for submission in stream:
+            if submission is not None and not self.is_seen(submission):
+                self.add(submission)
+            if self.should_flush(idle=submission is None):
+                self.flush()
+                num_batches += 1
+                if max_batches is not None and num_batches >= max_batches:
+                    return num_batches
+        if len(self.batch) > 0:
+            self.flush()
+            num_batches += 1
+        return num_batches
+
+    def is_seen(self, submission) -> bool:
+        """
+        :return: whether @submission is at or before the submission cursor
+        """
+        return self.cursor is not None and (
+            submission.fullname == self.cursor.fullname or submission.created_utc < self.cursor.created_utc
+        )
+
+    def add(self, submission):
+        if len(self.batch) == 0:
+            self.batch_started_at = self._clock()
+        self.batch.append(submission)
+
+    def should_flush(self, idle: bool) -> bool:
+        """
+        :param idle: whether the stream has run out of new submissions for now
+        """
+        if len(self.batch) == 0:
+            return False
+        return idle or len(self.batch) >= self.batch_size or self._clock() - self.batch_started_at >= self.batch_seconds
+
+    def flush(self):
+        """
+        Process the batch, a batch which fails is dropped and picked up again by catching up to the cursor
+        """
+        newest = max(self.batch, key=lambda s: s.created_utc)
+        cursor = SubmissionCursor(newest.fullname, newest.created_utc)
+        try:
+            self.process([s for s in self.batch if s.link_flair_text in VALID_FLAIRS], cursor)
+        finally:
+            self.batch = []
+
+    def process(self, submissions, cursor):
+        if len(submissions) > 0:
+            metrics.begin('stream_submissions')
+            try:
+                self.wsb_reddit.process_submissions(submissions)
+            finally:
+                metrics.flush()
+        # The cursor only ever moves forward
+        if cursor is not None and (self.cursor is None or cursor.created_utc > self.cursor.created_utc):
+            self.wsb_reddit.database.set_submission_cursor(SUBREDDIT, cursor)
+            self.cursor = cursor
+
+    def run_forever(self, max_runs: int = None):
+        """
+        Catch up and stream submissions, starting again after errors from Reddit, AWS or queueing notifications
+        :param max_runs: stop after catching up and streaming this many times, never by default
+        """
+        from botocore.exceptions import ClientError
+        from prawcore.exceptions import PrawcoreException
+
+        num_runs = 0
+        while max_runs is None or num_runs < max_runs:
+            num_runs += 1
+            try:
+                self.catch_up()
+                self.run()
+            except (PrawcoreException, ClientError, NotificationsNotQueuedError) as e:
+                logger.error(f'Submission stream failed, restarting in {STREAM_RESTART_SECONDS} seconds: {e}')
+                time.sleep(STREAM_RESTART_SECONDS)
+
+
+def run_stream(bot_user: str, queue_url: str = None, stream_name: str = None):
+    """
+    Run the submission stream forever, restarting it after errors
+    """
+    SubmissionStream(WSBReddit(bot_user, queue_url=queue_url, stream_name=stream_name)).run_forever()
+
+
+if __name__ == '__main__':
+    logging.basicConfig(format='%(asctime)s %(levelname)s %(message)s')
+    parser = argparse.ArgumentParser(description='Notify users about new DD as soon as it is posted')
+    parser.add_argument('--bot-user', default=os.environ.get('BotUserName', BOT_USERNAME))
+    parser.add_argument('--queue-url', default=os.environ.get('NotificationsQueueUrl'))
+    parser.add_argument('--stream-name', default=os.environ.get('NotificationsStreamName'))
+    args = parser.parse_args()
+    run_stream(args.bot_user, args.queue_url, args.stream_name)
@@ -7,3 +7,12 @@ class SubmissionNotification(object):
     link_flair_text: str
     permalink: str
     title: str
+
+
+@dataclass
+class SubmissionCursor(object):
+    """
+    The newest submission the bot has already processed
+    """
+    fullname: str
+    created_utc: float
@@ -0,0 +1,35 @@
+import re
+
+from defaults import TICKER_EXCLUSIONS
+from stock_data.tickers import tickers
+
+# Characters which may trail a ticker and are removed from the ends of a match
+PUNCT_CHARS = """-.%#,:;'"&/![]()?"""
+# Won't match LULU\ yet
+_PUNCT_REGEX = r"(?:[-.%#,:;'\"&/!\[\]\(\)\?]*)"
+_MATCH_3_5_MAYBE_WITH_DOLLAR = r'\$?[A-Z]{3,5}(?:\.[A-Z]{1})?' + _PUNCT_REGEX + r'(?=\s|$|/)'
+# Also covers 1-2 letter tickers with a dollar sign: any such match is found by this alternative first
+_MATCH_1_5_WITH_DOLLAR = r'\$[A-Za-z]{1,5}(?:\.[A-Za-z]{1})?' + _PUNCT_REGEX + r'(?=\s|$|/)'
+
+TICKER_REGEX = re.compile(f'{_MATCH_3_5_MAYBE_WITH_DOLLAR}|{_MATCH_1_5_WITH_DOLLAR}')
+# The memory-mapped symbol table memoizes its lookups so repeated candidates are a single hash lookup
+SYMBOLS = tickers
+# These will be excluded unless there is a $ before them
+EXCLUSIONS = frozenset(TICKER_EXCLUSIONS)
+
+
+def parse_tickers(text: str) -> [str]:
+    """
+    Find all valid tickers in a piece of text in a single pass of the compiled tokenizer
+    :param text: to search for tickers
+    :return: the unique tickers found, prefixed with $ and sorted
+    """
+    found = set()
+    for raw in TICKER_REGEX.findall(text):
+        ticker = raw.upper().strip(PUNCT_CHARS)
+        if ticker in EXCLUSIONS:
+            continue
+        symbol = ticker.strip('$')
+        if symbol in SYMBOLS:
+            found.add('$' + symbol)
+    return sorted(found)
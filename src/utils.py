@@ -1,17 +1,19 @@
+from __future__ import annotations
+
 import base64
-import codecs
 import logging
-import pickle
 import re
 from datetime import datetime, timedelta
 from itertools import islice
+from typing import TYPE_CHECKING
 
-from praw.models import Redditor, Submission
-from praw.reddit import Reddit
-
-from defaults import BOT_USERNAME, DEFAULT_ACCOUNT_AGE, MAX_TICKERS_ALLOWED_IN_SUBMISSION, TICKER_EXCLUSIONS
-from stock_data.tickers import tickers as tickers_set
+from defaults import BOT_USERNAME, DEFAULT_ACCOUNT_AGE, MAX_TICKERS_ALLOWED_IN_SUBMISSION
+from notification_codec import decode_notifications, encode_notifications
 from submission_utils import SubmissionNotification
+from ticker_parser import parse_tickers
+
+if TYPE_CHECKING:
+    from praw.models import Redditor, Submission
 
 logger = logging.getLogger()
 logger.setLevel(logging.INFO)
@@ -34,61 +36,33 @@ def chunks(data, size):
         yield {k: data[k] for k in islice(it, size)}
 
 
-def create_notifications(tickers_with_submissions: {str: [SubmissionNotification]}, get_users_subscribed_to_ticker):
-    """
-    Return all notifications each user in the form
-    {'user': [
-        {'ticker': 'ticker1', 'subs': [submissions]},
-        {'ticker': 'ticker2', 'subs': [submissions]}
-    ]}
-    """
-    notifications = dict()
-    notified_tickers = set()
-    users_subscribed_to_all: [str] = []
-    # users_subscribed_to_all: [str] = self.database.get_users_subscribed_to_all_dd_feed()
-
-    for ticker, subs in tickers_with_submissions.items():
-        logger.info(f"Found ticker {ticker} mentioned in posts [{', '.join([s.id for s in subs])}]")
-        users_to_notify = get_users_subscribed_to_ticker(ticker)
-        unique_users_to_notify = set(users_subscribed_to_all + users_to_notify)
-        if len(unique_users_to_notify) > 0:
-            logger.info(f'Will notify {len(unique_users_to_notify)} users about ticker {ticker}')
-            notified_tickers.add(ticker)
-        for u in users_subscribed_to_all:
-            if u in notifications:
-                for s in subs:
-                    if s.link_flair_text == 'DD':
-                        notifications[u].append({'ticker': ticker, 'subs': subs})
-            else:
-                for s in subs:
-                    if s.link_flair_text == 'DD':
-                        notifications[u] = [{'ticker': ticker, 'subs': subs}]
+def generate_notification_id(user: str, submission_id: str) -> str:
+    """
+    Generate the id of notifying a user about one submission, which is marked once the user has been sent it
+    """
+    return f'{user}-{submission_id}'
 
-        for u in users_to_notify:
-            if u in notifications:
-                notifications[u].append({'ticker': ticker, 'subs': subs})
-            else:
-                notifications[u] = [{'ticker': ticker, 'subs': subs}]
 
-    # Ensure there are no duplicates in a user's notifications from the all DD subscription +
-    # an individual subscription
-    for u, notify_about_these in notifications.items():
-        notifications[u] = list({v['ticker']: v for v in notify_about_these}.values())
-    # Process largest notifications first so it fails if it can't be done
-    sorted_notifications = {k: v for k, v in sorted(notifications.items(), key=lambda x: len(x), reverse=True)}
-    logger.debug(f'Notifications object: {sorted_notifications}')
-    len(notified_tickers) > 0 and logger.info(f"Will notify users about a total of {len(notified_tickers)} unique tickers")
-    return sorted_notifications
+def generate_notification_ids(notification: tuple) -> [str]:
+    """
+    Generate an id for every submission in a notification, so a submission which is processed again, e.g. after a run
+    could not queue all of its notifications, doesn't notify a user about it twice
+    """
+    user, ticker_notifications = notification
+    return list(dict.fromkeys(generate_notification_id(user, s.id) for n in ticker_notifications for s in n['subs']))
 
 
-def generate_notification_id(notification: tuple) -> str:
+def remove_notified_submissions(notification: tuple, notified_ids: {str}) -> tuple:
     """
-    Generate a notification id based on the user who is being notified and the first submission id that they're being notified about
-    This assumes that a submission will NEVER be processed twice and therefore never generate another notification for the same user for the same submission
+    :return: @notification without the submissions whose ids are in @notified_ids, tickers left without submissions
+             are dropped
     """
-    user, submissions = notification
-    submission = submissions[0]['subs'][0].id
-    return f'{user}-{submission}'
+    user, ticker_notifications = notification
+    remaining = []
+    for n in ticker_notifications:
+        subs = [s for s in n['subs'] if generate_notification_id(user, s.id) not in notified_ids]
+        len(subs) > 0 and remaining.append({**n, 'subs': subs})
+    return user, remaining
 
 
 def get_tickers_for_submission(submission: Submission) -> [str]:
@@ -107,6 +81,7 @@ def get_tickers_for_submission(submission: Submission) -> [str]:
 
 
 def get_another_reddit_instance():
+    from praw.reddit import Reddit
     return Reddit(BOT_USERNAME)
 
 
@@ -157,30 +132,7 @@ def parse_tickers_from_text(text) -> [str]:
     """
     :return: all tickers found in the text string
     """
-    punct_chars = """-.%#,:;'"&/![]()?"""
-    # Won't match LULU\ yet
-    punct_regex = r"(?:[-.%#,:;'\"&/!\[\]\(\)\?]*)"
-    three_5 = r'{3,5}'
-    one_2 = r'{1,2}'
-    one_5 = r'{1,5}'
-    one = r'{1}'
-    match_3_5_maybe_with_dollar = fr'\$?[A-Z]{three_5}(?:\.[A-Z]{one})?{punct_regex}(?=\s|$|/)'
-    match_1_5_lowercase_with_dollar = fr'\$[A-Za-z]{one_5}(?:\.[A-Za-z]{one})?{punct_regex}(?=\s|$|/)'
-    match_1_2_with_dollar = fr'\$[A-Za-z]{one_2}(?:\.[A-Za-z]{one})?{punct_regex}(?=\s|$|/)'
-    ticker_regex = f"{match_3_5_maybe_with_dollar}|{match_1_5_lowercase_with_dollar}|{match_1_2_with_dollar}"
-
-    raw_tickers = [t.upper() for t in re.findall(ticker_regex, text)]
-
-    # Remove matched punctuation on the ends of tickers
-    stripped_punct_tickers = [t.strip(punct_chars) for t in raw_tickers]
-
-    # Exclude some common terms which we know are not tickers
-    for exclusion in TICKER_EXCLUSIONS:
-        while exclusion in stripped_punct_tickers:
-            stripped_punct_tickers.remove(exclusion)
-
-    # Add $ to front if it is not there, unique, and sort
-    return list(sorted(set(['$' + ticker if ticker[0] != '$' else ticker for ticker in stripped_punct_tickers if ticker.strip('$') in tickers_set])))
+    return parse_tickers(text)
 
 
 def reduce_notifications(ticker_notifications: [{}]) -> [()]:
@@ -221,15 +173,26 @@ def should_sleep_for_seconds(text):
         return float(0)
 
 
-# https://stackoverflow.com/questions/30469575/how-to-pickle-and-unpickle-to-portable-string-in-python-3
 def encode_notification_for_sqs(notification) -> str:
-    return codecs.encode(pickle.dumps(notification), "base64").decode()
+    return encode_notifications(notification)
 
 
 def decode_notification_from_sqs(notification: str):
-    return pickle.loads(codecs.decode(notification.encode(), "base64"))
+    return decode_notifications(notification)
+
+
+def decode_notification_from_kinesis(data: str):
+    """
+    :param data: of a Kinesis record as delivered to Lambda, base64 encoded
+    """
+    return decode_notifications(base64.b64decode(data).decode())
 
 
-def decode_notification_kinesis(notification: str) -> tuple:
-    user, notifications = pickle.loads(base64.b64decode(notification))
-    return user, notifications
+def decode_notification_record(record: {}):
+    """
+    Decode the notifications in a record of a notifier Lambda event, which comes from SQS or Kinesis
+    depending on the deployment's notification transport
+    """
+    if 'kinesis' in record:
+        return decode_notification_from_kinesis(record['kinesis']['data'])
+    return decode_notification_from_sqs(record['body'])
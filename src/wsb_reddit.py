@@ -1,47 +1,97 @@
+from __future__ import annotations
+
 import logging
+import os
 import time
+from concurrent.futures import Executor, ThreadPoolExecutor
 from functools import partial
-from typing import Union
-
-from praw.models import Message, Comment, Submission, Redditor
-from praw.reddit import Reddit
-from prawcore.exceptions import ServerError
+from typing import TYPE_CHECKING, Callable, Optional, Union
 
-from database import Database, NOTIFIED_SUBMISSIONS_TABLE_NAME, COMMENTED_SUBMISSIONS_TABLE_NAME
+from clients import get_reddit
+from database import Database, SubscriptionUpdateError, NOTIFIED_SUBMISSIONS_TABLE_NAME, COMMENTED_SUBMISSIONS_TABLE_NAME
 from defaults import *
-from sqs import SQS
+from rate_limit import RateLimitExceeded, rate_limiter_for
+from metrics import metrics, timed
 from messages import (make_comment_from_tickers, make_pretty_message,
                       reply_to, create_error_notification, create_subscription_notification,
                       create_unsubscription_notification, create_all_subscription_notification,
-                      create_all_unsubscription_notification, create_user_not_old_enough)
-from submission_utils import SubmissionNotification
+                      create_all_unsubscription_notification, create_user_not_old_enough,
+                      create_subscriptions_list_notification, create_no_subscriptions_notification)
+from notification_builder import build_notifications
+from notification_codec import NotificationsNotQueuedError
+from submission_utils import SubmissionCursor, SubmissionNotification
 from utils import (get_tickers_for_submission, group_submissions_for_tickers, is_account_old_enough,
-                   parse_tickers_from_text, create_notifications, should_sleep_for_seconds, should_block_based_on_message)
+                   parse_tickers_from_text, should_sleep_for_seconds, should_block_based_on_message)
+
+if TYPE_CHECKING:
+    from praw.models import Message, Comment, Submission, Redditor
+    from kinesis import Kinesis
+    from sqs import SQS
 
 logger = logging.getLogger()
 logger.setLevel(logging.INFO)
 
 
 class WSBReddit:
-    def __init__(self, username, queue_url=None):
-        self.reddit = Reddit(username)
+    # Subscription updates from every inbox worker share this pool while the inbox is processed
+    subscription_pool = None
+
+    def __init__(self, username, queue_url=None, stream_name=None, transport=None):
+        """
+        :param transport: 'sqs' or 'kinesis', where notifications are sent to be delivered, defaults to the
+                          NotificationTransport environment variable
+        """
+        self.reddit = get_reddit(username)
         self.wsb = self.reddit.subreddit(SUBREDDIT)
         self.database = Database()
-        self.sqs = SQS(queue_url)
+        self.queue_url = queue_url
+        self.stream_name = stream_name
+        self.transport = transport or os.environ.get('NotificationTransport', DEFAULT_NOTIFICATION_TRANSPORT)
+        self._notification_transport = None
+        self.rate_limiter = rate_limiter_for(username)
 
-    def process_inbox(self):
+    @property
+    def notification_transport(self) -> Union[SQS, Kinesis]:
         """
-        Respond to user instructions to the bot
+        Created on first use, processing the inbox doesn't queue anything
         """
+        if self._notification_transport is None:
+            if self.transport == 'kinesis':
+                from kinesis import Kinesis
+                self._notification_transport = Kinesis(self.stream_name)
+            else:
+                from sqs import SQS
+                self._notification_transport = SQS(self.queue_url)
+        return self._notification_transport
+
+    def process_inbox(self, time_budget: float = INBOX_TIME_BUDGET_SECONDS):
+        """
+        Respond to user instructions to the bot, streaming unread messages until the inbox is caught up
+        or @time_budget seconds have passed, messages not replied to by then are left for the next run
+        """
+        from prawcore.exceptions import ServerError
+        deadline = time.monotonic() + time_budget
         num_processed = 0
+        batch = []
         try:
-            messages = list(self.reddit.inbox.unread(limit=UNREAD_MESSAGES_TO_PROCESS))
-            messages.reverse()
-            for message in messages:
-                self.handle_message(message)
-                num_processed += 1
+            with ThreadPoolExecutor(max_workers=MAX_INBOX_THREADPOOL_WORKERS) as pool, \
+                    ThreadPoolExecutor(max_workers=MAX_SUBSCRIPTION_UPDATE_WORKERS) as subscription_pool:
+                self.subscription_pool = subscription_pool
+                for item in self.reddit.inbox.stream(pause_after=0):
+                    item is not None and batch.append(item)
+                    out_of_time = time.monotonic() >= deadline
+                    if len(batch) > 0 and (item is None or len(batch) >= INBOX_BATCH_SIZE or out_of_time):
+                        handling, batch = batch, []
+                        num_processed += self.handle_messages(handling, pool, deadline)
+                    # None means there are no more unread messages for now
+                    if item is None or out_of_time:
+                        break
         except ServerError as e:
             logger.error(f"Reddit API servers returned an error: {e}")
+        except RateLimitExceeded as e:
+            logger.warning(f"Stopped processing the inbox, remaining messages will be handled next run: {e}")
+        finally:
+            self.subscription_pool = None
 
         num_processed > 0 and logger.info(f'Processed {num_processed} user messages')
 
@@ -54,25 +104,64 @@ class WSBReddit:
         """
         logger.info(f'Retrieved {len(submissions)} submissions')
         # self.comment_on_submissions(submissions)
-        has_already_processed_id = partial(self.database.has_already_processed, table_name=NOTIFIED_SUBMISSIONS_TABLE_NAME)
-        tickers_with_submissions: {str: [SubmissionNotification]} = group_submissions_for_tickers(
-            submissions, has_already_processed_id, reprocess=reprocess
+        processed_ids = set() if reprocess else self.database.get_processed_submission_ids(
+            [s.id for s in submissions], table_name=NOTIFIED_SUBMISSIONS_TABLE_NAME
         )
-        self.push_notifications(tickers_with_submissions)
-        [self.database.add_submission_marker(NOTIFIED_SUBMISSIONS_TABLE_NAME, submission.id) for submission in submissions]
+        with metrics.stage('TickerParsing'):
+            tickers_with_submissions: {str: [SubmissionNotification]} = group_submissions_for_tickers(
+                submissions, processed_ids.__contains__, reprocess=reprocess
+            )
+        metrics.count('TickersFound', len(tickers_with_submissions))
+        new_submission_ids = [s.id for s in submissions if s.id not in processed_ids]
+        try:
+            self.push_notifications(tickers_with_submissions)
+        except NotificationsNotQueuedError as e:
+            # Submissions whose notifications were all queued aren't processed again, the rest are retried next run
+            # and users already notified about them are skipped by their sent markers
+            self.database.add_submission_markers(
+                NOTIFIED_SUBMISSIONS_TABLE_NAME, [i for i in new_submission_ids if i not in e.submission_ids]
+            )
+            raise
+        self.database.add_submission_markers(NOTIFIED_SUBMISSIONS_TABLE_NAME, new_submission_ids)
         logger.info(f'Processed {len(submissions)} submissions')
 
+    @timed('FetchSubmissions')
     def get_submissions(self, limit, flair_filter=False) -> [Submission]:
         """
         Retrieve submissions for the bot to work with
         :param limit: retrieve this many submissions
         :param flair_filter: for these flairs
         """
-        subs = self.wsb.new(limit=limit)
+        subs = [s for s in self.wsb.new(limit=limit)]
+        metrics.count('SubmissionsFetched', len(subs))
         if flair_filter:
             return [s for s in subs if s.link_flair_text in VALID_FLAIRS]
         else:
-            return [s for s in subs]
+            return subs
+
+    @timed('FetchSubmissions')
+    def get_new_submissions(self, cursor: SubmissionCursor, limit=MAX_SUBMISSIONS_PER_RUN, flair_filter=False) -> ([Submission], SubmissionCursor):
+        """
+        Page through the newest submissions until reaching the ones already seen
+        :param cursor: the newest submission already processed, None to retrieve @limit submissions
+        :param limit: retrieve at most this many submissions
+        :param flair_filter: for these flairs
+        :return: the unseen submissions and the cursor to store once they have been processed
+        """
+        subs = []
+        for s in self.wsb.new(limit=limit):
+            if cursor is not None and (s.fullname == cursor.fullname or s.created_utc < cursor.created_utc):
+                break
+            subs.append(s)
+        metrics.count('SubmissionsFetched', len(subs))
+        if cursor is not None and len(subs) == limit:
+            logger.warning(f'Did not reach the submission cursor within {limit} submissions, older submissions are skipped')
+
+        # The cursor moves past every new submission, including ones the flair filter drops
+        new_cursor = SubmissionCursor(subs[0].fullname, subs[0].created_utc) if len(subs) > 0 else cursor
+        if flair_filter:
+            subs = [s for s in subs if s.link_flair_text in VALID_FLAIRS]
+        return subs, new_cursor
 
     def comment_on_submissions(self, submissions: [Submission], reprocess=False):
         """
@@ -87,7 +176,9 @@ class WSBReddit:
                 tickers = get_tickers_for_submission(submission)
                 if len(tickers) != 0:
                     logger.info(f'Commenting on submission {submission.id}')
+                    self.rate_limiter.acquire()
                     submission.reply(make_comment_from_tickers(tickers))
+                    self.rate_limiter.update_from_limits(self.reddit.auth.limits)
                 self.database.add_submission_marker(COMMENTED_SUBMISSIONS_TABLE_NAME, submission.id)
 
     def push_notifications(self, tickers_with_submissions: {str: [SubmissionNotification]}):
@@ -95,92 +186,195 @@ class WSBReddit:
         Notify users for a number of tickers which have been found and which submissions they were found within
         :param tickers_with_submissions: map of ticker -> submissions found in
         """
-        get_users_subscribed_to_ticker = partial(self.database.get_users_subscribed_to_ticker)
-        notifications = create_notifications(tickers_with_submissions, get_users_subscribed_to_ticker)
+        with metrics.stage('NotificationBuild'):
+            notifications = build_notifications(tickers_with_submissions, self.database.get_users_subscribed_to_tickers,
+                                                self.database.get_users_subscribed_to_all_dd_feed)
+        metrics.count('NotificationsBuilt', len(notifications))
         if len(notifications) > 0:
-            self.sqs.send_notification_batch(list(notifications.items()))
+            try:
+                with metrics.stage('QueueSend'):
+                    stats = self.notification_transport.send_notification_batch(list(notifications.items()))
+            except NotificationsNotQueuedError as e:
+                # Submission markers are not written so the whole run is retried, users already notified are skipped
+                metrics.count('QueueFailures', len(e.users))
+                raise
+            metrics.count('QueueRetries', stats.retried)
             logger.info(f'Queued {len(notifications)} notifications')
 
-    def notify(self, notification, attempts_left=2):
-        user_to_notify, notify_about_these_subs = notification
+    def notify(self, notification):
+        user_to_notify, _ = notification
 
-        if attempts_left == 0:
-            logger.error(f'Notification of user {user_to_notify} timed out and will not retry. Batch will be retried')
-            exit(1)
+        if not self.database.is_user_blocked(user_to_notify):
+            self.send_notification(notification)
         else:
-            user_has_blocked_bot = self.database.is_user_blocked(user_to_notify)
-            if not user_has_blocked_bot:
-                try:
-                    self.reddit.redditor(user_to_notify).message(
-                        'New DD posted!',
-                        make_pretty_message(notify_about_these_subs)
-                    )
-                    time.sleep(1)
-                except Exception as e:
-                    sleep_for = should_sleep_for_seconds(str(e))
-                    if sleep_for > 0:
-                        logger.error(
-                            f'Notification of user {user_to_notify} ran into a retryable error. ' +
-                            f'Sleeping for {sleep_for} seconds. Error was: {e}'
-                        )
-                        time.sleep(sleep_for + 1)
-                        self.notify(notification, attempts_left=attempts_left - 1)
-                    else:
-                        if should_block_based_on_message(str(e)):
-                            logger.info(f'Adding user {user_to_notify} to blocklist based on message: {str(e)}')
-                            self.database.add_blocked_user(user_to_notify)
-                        else:
-                            logger.error(f'Notification of user {user_to_notify} ran into a fatal error: {e}')
+            logger.debug(f'User {user_to_notify} is on the blocked list, not notifying')
+
+    def send_notification(self, notification, attempts_left=2):
+        """
+        Message a user about the submissions in a notification, pacing sends through the account's rate limiter
+        Raises RateLimitExceeded rather than blocking when Reddit asks us to back off for longer than
+        MAX_RATE_LIMIT_WAIT_SECONDS, or keeps asking once the attempts are used up, so the batch is retried later
+        :param notification: tuple of the user and the tickers/submissions to notify them about
+        :param attempts_left: attempts left, including this one, when Reddit asks us to back off
+        """
+        user_to_notify, notify_about_these_subs = notification
+
+        metrics.duration('RateLimitWait', self.rate_limiter.acquire(max_wait=MAX_RATE_LIMIT_WAIT_SECONDS))
+        try:
+            with metrics.stage('RedditSend'):
+                self.reddit.redditor(user_to_notify).message(
+                    'New DD posted!',
+                    make_pretty_message(notify_about_these_subs)
+                )
+            self.rate_limiter.update_from_limits(self.reddit.auth.limits)
+        except Exception as e:
+            sleep_for = should_sleep_for_seconds(str(e))
+            if sleep_for > 0:
+                logger.error(
+                    f'Notification of user {user_to_notify} ran into a retryable error. ' +
+                    f'Pausing sends for {sleep_for} seconds. Error was: {e}'
+                )
+                self.rate_limiter.pause(sleep_for + 1)
+                if attempts_left <= 1:
+                    logger.error(f'Notification of user {user_to_notify} timed out and will not retry. Batch will be retried')
+                    raise RateLimitExceeded(sleep_for + 1) from e
+                metrics.count('RedditSendRetries')
+                self.send_notification(notification, attempts_left=attempts_left - 1)
             else:
-                logger.debug(f'User {user_to_notify} is on the blocked list, not notifying')
+                if should_block_based_on_message(str(e)):
+                    logger.info(f'Adding user {user_to_notify} to blocklist based on message: {str(e)}')
+                    self.database.add_blocked_user(user_to_notify)
+                else:
+                    logger.error(f'Notification of user {user_to_notify} ran into a fatal error: {e}')
+
+    def reply_to(self, item: Union[Message, Comment], message: str, deadline: float = None):
+        """
+        Reply to a user's message or comment, pacing replies through the account's rate limiter
+        :param deadline: time.monotonic() by which the reply must be sent, raises RateLimitExceeded rather than wait past it
+        """
+        max_wait = MAX_RATE_LIMIT_WAIT_SECONDS if deadline is None else \
+            max(0.0, min(MAX_RATE_LIMIT_WAIT_SECONDS, deadline - time.monotonic()))
+        metrics.duration('RateLimitWait', self.rate_limiter.acquire(max_wait=max_wait))
+        with metrics.stage('RedditReply'):
+            reply_to(item, message)
+        self.rate_limiter.update_from_limits(self.reddit.auth.limits)
+
+    def handle_messages(self, items: [Union[Message, Comment]], pool: Executor = None, deadline: float = None) -> int:
+        """
+        Respond to a batch of user messages or comments. Different authors are handled concurrently on @pool, each
+        author's messages one after another in inbox order, so a message is only interpreted once the author's
+        previous update has been made and e.g. "list" after a subscription sees it
+        A message is replied to once its update has succeeded and the batch is marked read in one call. Messages whose
+        update failed, later messages from the same author and messages not reached by @deadline, a time.monotonic()
+        value, are left unread so they are handled next run
+        :return: the number of messages handled
+        """
+        by_author = {}
+        for item in items:
+            by_author.setdefault(item.author.name, []).append(item)
+        handled_ids = set()
+
+        def handle_author(author_items: [Union[Message, Comment]]):
+            for item in author_items:
+                if deadline is not None and time.monotonic() >= deadline:
+                    return
+                reply, update = self.interpret_message(item)
+                if update is not None:
+                    try:
+                        update()
+                    except Exception as e:
+                        logger.error(f"Could not update the database for user {item.author}'s message with id {item.id}: {e}")
+                        return
+                reply is not None and self.reply_to(item, reply, deadline)
+                handled_ids.add(item.id)
+
+        try:
+            if pool is None:
+                for author_items in by_author.values():
+                    handle_author(author_items)
+            else:
+                # Every author is waited for before raising so all the messages handled are marked read
+                futures = [pool.submit(handle_author, author_items) for author_items in by_author.values()]
+                errors = [e for e in (future.exception() for future in futures) if e is not None]
+                if len(errors) > 0:
+                    raise errors[0]
+        finally:
+            handled = [item for item in items if item.id in handled_ids]
+            len(handled) > 0 and self.reddit.inbox.mark_read(handled)
+            metrics.count('InboxMessagesHandled', len(handled))
+            metrics.count('InboxMessagesLeftUnread', len(items) - len(handled))
+        return len(handled)
+
+    def update_subscriptions(self, user: str, add: [str] = (), remove: [str] = ()):
+        """
+        While the inbox is processed the tickers are updated on the subscription pool shared by every inbox worker
+        rather than on a pool of their own
+        :raises SubscriptionUpdateError: if any ticker could not be updated, so the message is retried
+        """
+        results = self.database.update_user_subscriptions(user, add=add, remove=remove, pool=self.subscription_pool)
+        failed = [ticker for ticker, succeeded in results.items() if not succeeded]
+        if len(failed) > 0:
+            raise SubscriptionUpdateError(user, failed)
 
     def handle_message(self, item: Union[Message, Comment]):
         """
         Respond to a particular user message or comment
         :param item: the message or comment to respond to
         """
+        self.handle_messages([item])
+
+    def interpret_message(self, item: Union[Message, Comment]) -> (Optional[str], Optional[Callable]):
+        """
+        Work out how to respond to a user message or comment
+        :param item: the message or comment to respond to
+        :return: the reply to send, if any, and the database update to make before replying, if any
+        """
         body: str = item.body
         author: Redditor = item.author
 
         if author.name in {"reddit", "AutoModerator"}:
-            item.mark_read()
-            return
+            return None, None
         tickers = [ticker for ticker in parse_tickers_from_text(body)]
 
         is_old_enough = is_account_old_enough(author)
 
         if body.lower() == "unblock me":
-            self.database.unblock_user(author.name)
-            reply_to(item, f'You\'ve been unblocked and can now use the bot like normal. Make sure you have private messaging enabled or you\'ll be blocked again')
+            return (
+                f'You\'ve been unblocked and can now use the bot like normal. Make sure you have private messaging enabled or you\'ll be blocked again',
+                partial(self.database.unblock_user, author.name)
+            )
         elif self.database.is_user_blocked(author.name):
-            reply_to(item, f'I\'ve blocked you for some reason. Reply with "unblock me" to be unblocked')
+            return f'I\'ve blocked you for some reason. Reply with "unblock me" to be unblocked', None
         elif len(tickers) > MAX_TICKERS_TO_SUBSCRIBE_AT_ONCE and is_old_enough:
             logger.info(f'User {author} requested subscription to more than {MAX_TICKERS_TO_SUBSCRIBE_AT_ONCE} tickers')
-            reply_to(item, "You can only subscribe to 10 tickers at once")
+            return "You can only subscribe to 10 tickers at once", None
         elif body.lower() == "all dd" and is_old_enough:
-            self.database.subscribe_user_to_all_dd_feed(author.name)
             logger.info(f'User {author} requested subscription to all DD')
-            reply_to(item, create_all_subscription_notification())
+            return create_all_subscription_notification(), partial(self.database.subscribe_user_to_all_dd_feed, author.name)
         elif body.lower() == "stop all" and is_old_enough:
             logger.info(f'User {author} requested unsubscription from all DD')
-            self.database.unsubscribe_user_from_all_dd_feed(author.name)
-            reply_to(item, create_all_unsubscription_notification())
+            return create_all_unsubscription_notification(), partial(self.database.unsubscribe_user_from_all_dd_feed, author.name)
+        elif body.lower() == "list":
+            subscriptions = self.database.get_user_subscriptions(author.name)
+            return create_subscriptions_list_notification(subscriptions), None
+        elif body.lower() == "stop everything":
+            subscriptions = self.database.get_user_subscriptions(author.name)
+            logger.info(f'User {author} requested unsubscription from everything: {subscriptions}')
+            if len(subscriptions) == 0:
+                return create_no_subscriptions_notification(), None
+            return create_unsubscription_notification(subscriptions), \
+                partial(self.update_subscriptions, author.name, remove=subscriptions)
         elif len(tickers) == 0 and not item.was_comment and is_old_enough:
             logger.info(f'User {author} submitted uninterpretable message: {body}')
-            reply_to(item, create_error_notification())
+            return create_error_notification(), None
         elif len(tickers) == 0 and item.was_comment:
-            item.mark_read()
-            return
+            return None, None
         elif body.lower().startswith("stop"):
             logger.info(f'User {author} requested unsubscription from {tickers}')
-            [self.database.unsubscribe_user_from_ticker(author.name, ticker) for ticker in tickers]
-            reply_to(item, create_unsubscription_notification(tickers))
+            return create_unsubscription_notification(tickers), partial(self.update_subscriptions, author.name, remove=tickers)
         elif is_old_enough:
             logger.info(f'User {author} requested subscription to {tickers}')
-            [self.database.subscribe_user_to_ticker(author.name, ticker) for ticker in tickers]
-            reply_to(item, create_subscription_notification(tickers))
+            return create_subscription_notification(tickers), partial(self.update_subscriptions, author.name, add=tickers)
         else:
             logger.info(f'User {author} has an account which is not old enough to use the bot')
-            reply_to(item, create_user_not_old_enough())
-
-        item.mark_read()
+            return create_user_not_old_enough(), None
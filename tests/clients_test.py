@@ -0,0 +1,15 @@
+import clients
+from clients import BOTO_CONFIG, get_client, get_session
+
+
+def test_clients_are_reused(monkeypatch):
+    monkeypatch.setenv('AWS_DEFAULT_REGION', 'us-west-1')
+    monkeypatch.setattr(clients, '_session', None)
+    monkeypatch.setattr(clients, '_clients', {})
+
+    assert get_session() is get_session()
+    dynamodb = get_client('dynamodb')
+    assert get_client('dynamodb') is dynamodb
+    assert get_client('sqs') is not dynamodb
+    assert dynamodb.meta.config.read_timeout == BOTO_CONFIG['read_timeout']
+    assert dynamodb.meta.config.retries['mode'] == 'standard'
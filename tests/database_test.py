@@ -1,6 +1,10 @@
+import threading
+import time
+
 import pytest
 
 from database import *
+from local_backends import LocalDynamoDB
 
 
 @pytest.fixture(scope="module")
@@ -46,3 +50,375 @@ def test_subscribe_user_to_all_dd_feed(db_client):
     db_client.unsubscribe_user_from_all_dd_feed("TestUser1")
     assert db_client.is_user_subscribed_to_all_dd_feed("TestUser0") is False
     assert db_client.is_user_subscribed_to_all_dd_feed("TestUser1") is False
+
+
+class FakeBatchGetClient:
+    """
+    Serves batch_get_item from a dict of ticker -> users, leaving the last key of each request unprocessed
+    for the first @unprocessed_rounds calls. @unsharded is ticker -> users still on the unsharded item
+    """
+    def __init__(self, subscriptions: {str: [str]}, unprocessed_rounds=0, unsharded: {str: [str]} = None):
+        self.subscriptions = subscriptions
+        self.unsharded = unsharded or {}
+        self.unprocessed_rounds = unprocessed_rounds
+        self.requests = []
+
+    def batch_get_item(self, RequestItems):
+        self.requests.append(RequestItems)
+        keys = RequestItems['dd-notifications']['Keys']
+        unprocessed = []
+        if self.unprocessed_rounds > 0:
+            self.unprocessed_rounds -= 1
+            keys, unprocessed = keys[:-1], keys[-1:]
+        items = []
+        for k in keys:
+            ticker, _, shard = k['ticker']['S'].partition('#')
+            if shard == '':
+                users = self.unsharded.get(ticker, [])
+            else:
+                users = [u for u in self.subscriptions.get(ticker, []) if subscriber_shard(u) == int(shard)]
+            len(users) > 0 and items.append({'ticker': k['ticker'], 'subscribed_users': {'SS': users}})
+        response = {'Responses': {'dd-notifications': items}}
+        if len(unprocessed) > 0:
+            response['UnprocessedKeys'] = {'dd-notifications': {'Keys': unprocessed}}
+        return response
+
+
+def database_with_client(client) -> Database:
+    database = Database.__new__(Database)
+    database.client = client
+    return database
+
+
+def test_get_users_subscribed_to_tickers_chunks_keys(monkeypatch):
+    monkeypatch.setattr(time, 'sleep', lambda s: None)
+    tickers = [f'$T{i}' for i in range(250)]
+    client = FakeBatchGetClient({'$T0': ['User0'], '$T249': ['User1', 'User2']})
+    subscribed = database_with_client(client).get_users_subscribed_to_tickers(tickers)
+
+    # Every shard of every ticker and the unsharded item left from before the migration
+    assert [len(r['dd-notifications']['Keys']) for r in client.requests] == [100] * 12 + [50]
+    assert subscribed['$T0'] == ['User0']
+    assert subscribed['$T249'] == ['User1', 'User2']
+    assert subscribed['$T1'] == []
+    assert len(subscribed) == 250
+
+
+def test_get_users_subscribed_to_tickers_reads_unsharded_subscribers():
+    client = FakeBatchGetClient({'$A': ['User0', 'User2']}, unsharded={'$A': ['User1', 'User2'], '$B': ['User3']})
+    subscribed = database_with_client(client).get_users_subscribed_to_tickers(['$A', '$B', '$C'])
+
+    assert subscribed == {'$A': ['User0', 'User1', 'User2'], '$B': ['User3'], '$C': []}
+
+
+def test_unsubscribing_removes_unsharded_subscriber():
+    database = database_with_subscriptions({'$GME': ['User0']})
+    items = database.client.tables[TICKER_SUBSCRIPTIONS_TABLE_NAME]
+    items['$GME'] = {'ticker': {'S': '$GME'}, 'subscribed_users': {'SS': ['User0', 'User1']}}
+
+    database.unsubscribe_user_from_ticker('User0', '$GME')
+    assert database.get_users_subscribed_to_ticker('$GME') == ['User1']
+
+
+def test_get_users_subscribed_to_tickers_retries_unprocessed_keys(monkeypatch):
+    monkeypatch.setattr(time, 'sleep', lambda s: None)
+    client = FakeBatchGetClient({'$A': ['User0'], '$B': ['User1']}, unprocessed_rounds=2)
+    subscribed = database_with_client(client).get_users_subscribed_to_tickers(['$A', '$B'])
+
+    assert len(client.requests) == 3
+    assert subscribed == {'$A': ['User0'], '$B': ['User1']}
+
+
+def test_get_users_subscribed_to_tickers_gives_up(monkeypatch):
+    monkeypatch.setattr(time, 'sleep', lambda s: None)
+    client = FakeBatchGetClient({'$A': ['User0']}, unprocessed_rounds=MAX_BATCH_ATTEMPTS)
+    with pytest.raises(UnprocessedItemsError):
+        database_with_client(client).get_users_subscribed_to_tickers(['$A', '$B'])
+
+
+class FakeBatchWriteClient:
+    """
+    Accepts batch_write_item requests, leaving the last item of each request unprocessed
+    for the first @unprocessed_rounds calls
+    """
+    def __init__(self, unprocessed_rounds=0):
+        self.unprocessed_rounds = unprocessed_rounds
+        self.requests = []
+        self.written = []
+
+    def batch_write_item(self, RequestItems):
+        self.requests.append(RequestItems)
+        (table_name, requests), = RequestItems.items()
+        unprocessed = []
+        if self.unprocessed_rounds > 0:
+            self.unprocessed_rounds -= 1
+            requests, unprocessed = requests[:-1], requests[-1:]
+        self.written.extend(r['PutRequest']['Item'] for r in requests)
+        return {'UnprocessedItems': {table_name: unprocessed} if len(unprocessed) > 0 else {}}
+
+    def batch_get_item(self, RequestItems):
+        (table_name, request), = RequestItems.items()
+        written_ids = {i['submission_id']['S'] for i in self.written}
+        items = [k for k in request['Keys'] if k['submission_id']['S'] in written_ids]
+        return {'Responses': {table_name: items}}
+
+
+def test_add_submission_markers(monkeypatch):
+    monkeypatch.setattr(time, 'sleep', lambda s: None)
+    client = FakeBatchWriteClient(unprocessed_rounds=1)
+    database = database_with_client(client)
+    submission_ids = [f's{i}' for i in range(60)]
+    database.add_submission_markers(NOTIFIED_SUBMISSIONS_TABLE_NAME, submission_ids)
+
+    assert [len(r[NOTIFIED_SUBMISSIONS_TABLE_NAME]) for r in client.requests] == [25, 1, 25, 10]
+    assert sorted(i['submission_id']['S'] for i in client.written) == sorted(submission_ids)
+    assert all(int(i['ttl']['N']) > time.time() for i in client.written)
+    assert database.get_processed_submission_ids(['s1', 's59', 'new'], NOTIFIED_SUBMISSIONS_TABLE_NAME) == {'s1', 's59'}
+
+
+class FakeCacheClient:
+    def __init__(self, blocked_pages: [[str]], notified=()):
+        self.blocked_pages = blocked_pages
+        self.notified = set(notified)
+        self.scans = 0
+        self.batch_gets = 0
+
+    def scan(self, TableName, ProjectionExpression=None, ExclusiveStartKey=None):
+        self.scans += 1
+        page = ExclusiveStartKey['page']['N'] if ExclusiveStartKey else 0
+        response = {'Items': [{'user_id': {'S': u}} for u in self.blocked_pages[page]]}
+        if page + 1 < len(self.blocked_pages):
+            response['LastEvaluatedKey'] = {'page': {'N': page + 1}}
+        return response
+
+    def batch_get_item(self, RequestItems):
+        self.batch_gets += 1
+        (table_name, request), = RequestItems.items()
+        return {'Responses': {table_name: [k for k in request['Keys'] if k['id']['S'] in self.notified]}}
+
+    def batch_write_item(self, RequestItems):
+        return {'UnprocessedItems': {}}
+
+    def put_item(self, TableName, Item, ReturnValues):
+        return {}
+
+    def delete_item(self, TableName, Key, ReturnValues):
+        return {}
+
+
+def database_with_caches(client, clock=time.monotonic) -> Database:
+    database = database_with_client(client)
+    database.blocked_users_cache = UsersCache('blocked-users', ttl_seconds=60, clock=clock)
+    database.sent_notifications_cache = LRUSet(max_size=2)
+    return database
+
+
+def test_blocked_users_cache():
+    now = [0]
+    client = FakeCacheClient([['User0', 'User1'], ['User2']])
+    database = database_with_caches(client, clock=lambda: now[0])
+    cache_stats.reset()
+
+    assert database.is_user_blocked('User2') is True
+    assert database.is_user_blocked('User3') is False
+    assert client.scans == 2
+
+    database.add_blocked_user('User3')
+    database.unblock_user('User0')
+    assert database.is_user_blocked('User3') is True
+    assert database.is_user_blocked('User0') is False
+    assert client.scans == 2
+
+    now[0] = 61
+    assert database.is_user_blocked('User0') is True
+    assert client.scans == 4
+    assert (cache_stats.get('blocked-users', 'hits'), cache_stats.get('blocked-users', 'misses')) == (3, 2)
+
+
+def test_sent_notifications_cache():
+    client = FakeCacheClient([[]], notified={'User0-a'})
+    database = database_with_caches(client)
+
+    assert database.get_sent_notification_ids(['User0-a', 'User0-b']) == {'User0-a'}
+    assert database.get_sent_notification_ids(['User0-a']) == {'User0-a'}
+    assert client.batch_gets == 1
+
+    database.add_notification_markers(['User1-a', 'User2-a'])
+    assert database.get_sent_notification_ids(['User1-a', 'User2-a']) == {'User1-a', 'User2-a'}
+    assert client.batch_gets == 1
+    # Least recently seen ids are evicted
+    assert database.get_sent_notification_ids(['User0-a']) == {'User0-a'}
+    assert client.batch_gets == 2
+
+
+class FakeSubscriptionsClient(LocalDynamoDB):
+    """
+    Local DynamoDB which holds each ticker update for @latency seconds and fails updates to @failing_tickers
+    """
+    def __init__(self, failing_tickers=(), latency=0.0, page_size=100):
+        super().__init__(page_size)
+        self.failing_tickers = set(failing_tickers)
+        self.latency = latency
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self.scanned_segments = []
+        self._counter_lock = threading.Lock()
+
+    def update_item(self, TableName, Key, **kwargs):
+        if TableName == USER_SUBSCRIPTIONS_TABLE_NAME:
+            return super().update_item(TableName, Key, **kwargs)
+        with self._counter_lock:
+            self.in_flight += 1
+            self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        time.sleep(self.latency)
+        with self._counter_lock:
+            self.in_flight -= 1
+        if ticker_from_shard_key(Key['ticker']['S']) in self.failing_tickers:
+            raise Exception('ProvisionedThroughputExceededException')
+        return super().update_item(TableName, Key, **kwargs)
+
+    def scan(self, TableName, **kwargs):
+        with self._counter_lock:
+            self.scanned_segments.append((kwargs.get('Segment'), kwargs.get('TotalSegments')))
+        return super().scan(TableName, **kwargs)
+
+
+def database_with_subscriptions(subscriptions: {str: [str]}, **kwargs) -> Database:
+    database = database_with_client(FakeSubscriptionsClient(**kwargs))
+    for ticker, users in subscriptions.items():
+        for user in users:
+            database.subscribe_user_to_ticker(user, ticker)
+    return database
+
+
+def test_update_user_subscriptions_runs_concurrently():
+    database = database_with_subscriptions({'$GME': ['User0', 'User1'], '$AMC': ['User0']}, latency=0.05)
+    tickers = [f'$T{n}' for n in range(8)]
+
+    results = database.update_user_subscriptions('User0', add=tickers, remove=['$GME', '$AMC'])
+    assert results == {**{t: True for t in tickers}, '$GME': True, '$AMC': True}
+    assert database.client.max_in_flight > 1
+    subscribed = database.get_users_subscribed_to_tickers(['$GME', '$AMC'] + tickers)
+    assert subscribed['$GME'] == ['User1']
+    assert subscribed['$AMC'] == []
+    assert all(subscribed[t] == ['User0'] for t in tickers)
+
+
+def test_update_user_subscriptions_on_a_shared_pool():
+    from concurrent.futures import ThreadPoolExecutor
+
+    database = database_with_subscriptions({'$GME': ['User0']}, latency=0.05, failing_tickers={'$AMC'})
+    with ThreadPoolExecutor(max_workers=2) as pool:
+        results = database.update_user_subscriptions('User0', add=['$TSLA', '$AMC', '$PLTR'], remove=['$GME'], pool=pool)
+    assert results == {'$TSLA': True, '$AMC': False, '$PLTR': True, '$GME': True}
+    assert database.client.max_in_flight == 2
+
+
+def test_update_user_subscriptions_reports_failed_tickers():
+    database = database_with_subscriptions({}, failing_tickers={'$AMC'})
+    assert database.update_user_subscriptions('User0', add=['$GME', '$AMC']) == {'$GME': True, '$AMC': False}
+    assert database.update_user_subscriptions('User0') == {}
+
+
+def test_subscriptions_are_indexed_by_user():
+    database = database_with_subscriptions({})
+    database.update_user_subscriptions('User0', add=['$GME', '$AMC', '$TSLA'])
+    database.update_user_subscriptions('User0', remove=['$AMC'])
+
+    assert database.get_user_subscriptions('User0') == ['$GME', '$TSLA']
+    assert database.get_user_subscriptions('User1') == []
+
+
+def test_backfill_user_subscriptions():
+    database = database_with_subscriptions({'$GME': ['User0', 'User1'], '$AMC': ['User0'], '$TSLA': ['User2']})
+    database.subscribe_user_to_ticker('User3', '$NONE')
+    database.unsubscribe_user_from_ticker('User3', '$NONE')
+    database.client.tables[USER_SUBSCRIPTIONS_TABLE_NAME].clear()
+
+    assert database.backfill_user_subscriptions(total_segments=3) == 3
+    assert sorted(database.client.scanned_segments) == [(0, 3), (1, 3), (2, 3)]
+    assert database.get_user_subscriptions('User0') == ['$AMC', '$GME']
+    assert database.get_user_subscriptions('User1') == ['$GME']
+    assert database.get_user_subscriptions('User2') == ['$TSLA']
+
+
+def test_subscribers_are_sharded():
+    users = [f'User{n}' for n in range(100)]
+    database = database_with_subscriptions({'$GME': users, '$AMC': users[:3]})
+    items = database.client.tables[TICKER_SUBSCRIPTIONS_TABLE_NAME]
+
+    assert sorted(k for k in items if k.startswith('$GME')) == [f'$GME#{shard}' for shard in range(SUBSCRIBER_SHARDS)]
+    assert all(subscriber_shard(u) == int(k.partition('#')[2]) for k, i in items.items() for u in i['subscribed_users']['SS'])
+    assert database.get_users_subscribed_to_ticker('$GME') == sorted(users)
+    assert database.get_users_subscribed_to_ticker('$AMC') == sorted(users[:3])
+    assert database.get_users_subscribed_to_ticker('$NONE') == []
+    assert database.unsubscribe_user_from_ticker('User0', '$AMC') == [u for u in users[1:3] if subscriber_shard(u) == subscriber_shard('User0')]
+
+
+def test_migrate_subscriptions_to_shards():
+    database = database_with_subscriptions({'$GME': ['User9']}, page_size=2)
+    items = database.client.tables[TICKER_SUBSCRIPTIONS_TABLE_NAME]
+    items['$GME'] = {'ticker': {'S': '$GME'}, 'subscribed_users': {'SS': [f'User{n}' for n in range(9)]}}
+    items['$AMC'] = {'ticker': {'S': '$AMC'}, 'subscribed_users': {'SS': ['User0', 'User1']}}
+
+    assert database.migrate_subscriptions_to_shards(total_segments=2) == 2
+    assert all('subscribed_users' not in i for k, i in items.items() if '#' not in k)
+    assert database.get_users_subscribed_to_ticker('$GME') == [f'User{n}' for n in range(10)]
+    assert database.get_users_subscribed_to_ticker('$AMC') == ['User0', 'User1']
+    assert database.migrate_subscriptions_to_shards() == 0
+
+
+def test_unsubscribing_during_the_migration_is_kept():
+    database = database_with_subscriptions({})
+    items = database.client.tables[TICKER_SUBSCRIPTIONS_TABLE_NAME]
+    items['$GME'] = {'ticker': {'S': '$GME'}, 'subscribed_users': {'SS': ['User0', 'User1']}}
+    scan_segments = database.scan_segments
+
+    def unsubscribe_after_scan(*args):
+        scanned = scan_segments(*args)
+        database.unsubscribe_user_from_ticker('User0', '$GME')
+        return scanned
+
+    database.scan_segments = unsubscribe_after_scan
+    assert database.migrate_subscriptions_to_shards() == 1
+    assert database.get_users_subscribed_to_ticker('$GME') == ['User1']
+
+
+def test_migration_puts_subscribers_back_when_a_shard_fails():
+    database = database_with_subscriptions({})
+    items = database.client.tables[TICKER_SUBSCRIPTIONS_TABLE_NAME]
+    items['$GME'] = {'ticker': {'S': '$GME'}, 'subscribed_users': {'SS': ['User0', 'User1']}}
+    update_item = database.client.update_item
+
+    def fail_on_shards(TableName, Key, **kwargs):
+        if '#' in Key['ticker']['S']:
+            raise Exception('ProvisionedThroughputExceededException')
+        return update_item(TableName, Key, **kwargs)
+
+    database.client.update_item = fail_on_shards
+    with pytest.raises(Exception, match='ProvisionedThroughputExceededException'):
+        database.migrate_subscriptions_to_shards()
+    assert items['$GME']['subscribed_users'] == {'SS': ['User0', 'User1']}
+
+
+def test_unsubscribing_does_not_create_unsharded_items():
+    database = database_with_subscriptions({'$GME': ['User0']})
+    database.unsubscribe_user_from_ticker('User0', '$GME')
+
+    assert '$GME' not in database.client.tables[TICKER_SUBSCRIPTIONS_TABLE_NAME]
+    assert database.get_users_subscribed_to_ticker('$GME') == []
+
+
+def test_all_dd_subscribers_are_paginated_and_cached():
+    client = LocalDynamoDB(page_size=2)
+    database = database_with_client(client)
+    database.all_dd_subscribers_cache = UsersCache('all-dd-subscribers', ttl_seconds=60)
+    for n in range(5):
+        database.subscribe_user_to_all_dd_feed(f'User{n}')
+
+    assert database.get_users_subscribed_to_all_dd_feed() == [f'User{n}' for n in range(5)]
+    assert client.calls['scan'] == 3
+    database.unsubscribe_user_from_all_dd_feed('User0')
+    database.subscribe_user_to_all_dd_feed('User5')
+    assert database.get_users_subscribed_to_all_dd_feed() == [f'User{n}' for n in range(1, 6)]
+    assert client.calls['scan'] == 3
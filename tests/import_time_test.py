@@ -0,0 +1,42 @@
+import os
+import subprocess
+import sys
+
+import pytest
+
+SRC_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'src')
+HANDLERS = ['lambda_function_notify', 'lambda_function_process_inbox', 'lambda_function_process_submissions']
+# Modules which are only imported once a handler actually talks to Reddit or AWS
+DEFERRED_MODULES = ['boto3', 'botocore', 'praw', 'prawcore', 'requests', 'sqs', 'kinesis']
+# Cumulative import time allowed for a handler module, override with IMPORT_TIME_BUDGET_MS on slow machines
+IMPORT_TIME_BUDGET_MS = float(os.environ.get('IMPORT_TIME_BUDGET_MS', 250))
+
+
+def run_python(*args) -> subprocess.CompletedProcess:
+    env = dict(os.environ, PYTHONPATH=SRC_DIR)
+    return subprocess.run([sys.executable, *args], env=env, capture_output=True, text=True, check=True)
+
+
+def import_time_ms(module: str) -> float:
+    """
+    :return: the cumulative time python -X importtime reports for importing @module
+    """
+    stderr = run_python('-X', 'importtime', '-c', f'import {module}').stderr
+    for line in stderr.splitlines():
+        _, cumulative, name = line.split('|')
+        if name.strip() == module:
+            return int(cumulative) / 1000
+    raise AssertionError(f'{module} was not in the import time report')
+
+
+@pytest.mark.parametrize('handler', HANDLERS)
+def test_handler_defers_heavy_imports(handler):
+    check = f'import sys, {handler}; print(",".join(m for m in {DEFERRED_MODULES!r} if m in sys.modules))'
+    assert run_python('-c', check).stdout.strip() == ''
+
+
+@pytest.mark.parametrize('handler', HANDLERS)
+def test_handler_import_time_budget(handler):
+    # Take the best of a few runs, the first may include writing bytecode caches
+    best = min(import_time_ms(handler) for _ in range(3))
+    assert best < IMPORT_TIME_BUDGET_MS, f'{handler} took {best:.0f}ms to import, the budget is {IMPORT_TIME_BUDGET_MS:.0f}ms'
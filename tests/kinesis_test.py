@@ -0,0 +1,95 @@
+import time
+
+import pytest
+
+from kinesis import Kinesis, MAX_PUT_ATTEMPTS, partition_key, record_size
+from notification_codec import NotificationsNotQueuedError
+from submission_utils import SubmissionNotification
+from utils import decode_notification_from_sqs
+
+
+class FakeKinesisClient:
+    """
+    Accepts put_records calls, failing the records of users in @fail_users for the first @fail_rounds attempts
+    """
+    def __init__(self, fail_users=(), fail_rounds=1):
+        self.fail_users = set(fail_users)
+        self.fail_rounds = fail_rounds
+        self.calls = []
+        self.records = []
+
+    def put_records(self, StreamName, Records):
+        self.calls.append(Records)
+        failing = self.fail_rounds > 0
+        self.fail_rounds -= 1
+        results = []
+        for r in Records:
+            users = {n[0] for n in decode_notification_from_sqs(r['Data'].decode())}
+            if failing and users & self.fail_users:
+                results.append({'ErrorCode': 'ProvisionedThroughputExceededException', 'ErrorMessage': 'Rate exceeded'})
+            else:
+                self.records.append(r)
+                results.append({'SequenceNumber': str(len(self.records)), 'ShardId': 'shardId-000000000000'})
+        return {'FailedRecordCount': sum('ErrorCode' in r for r in results), 'Records': results}
+
+
+def kinesis_with_client(client) -> Kinesis:
+    kinesis = Kinesis.__new__(Kinesis)
+    kinesis.client = client
+    kinesis.stream_name = 'wsb-ticker-bot-notifications'
+    return kinesis
+
+
+def make_notifications(num_users: int) -> [tuple]:
+    return [
+        (f'User{u}', [{'ticker': '$SPY', 'subs': [SubmissionNotification(f'id{u}', 'DD', f'/r/wsb/id{u}', f'DD {u}')]}])
+        for u in range(num_users)
+    ]
+
+
+def decode_records(records: [{}]) -> [tuple]:
+    return [n for r in records for n in decode_notification_from_sqs(r['Data'].decode())]
+
+
+def test_pack_records_keeps_each_record_to_one_partition():
+    notifications = make_notifications(300)
+    records = Kinesis.pack_records(notifications, max_notifications=10)
+
+    assert all(len(decode_notification_from_sqs(r['Data'].decode())) <= 10 for r in records)
+    assert all(partition_key(n[0]) == r['PartitionKey'] for r in records for n in decode_records([r]))
+    assert sorted(decode_records(records), key=lambda n: n[0]) == sorted(notifications, key=lambda n: n[0])
+    assert len({r['PartitionKey'] for r in records}) > 1
+
+
+def test_pack_puts_respects_record_count_and_size():
+    records = [{'Data': b'a' * 100, 'PartitionKey': '1'}] * 1200
+    assert [len(p) for p in Kinesis.pack_puts(records)] == [500, 500, 200]
+
+    records = [{'Data': b'a' * 999, 'PartitionKey': '1'}] * 12
+    puts = Kinesis.pack_puts(records, max_bytes=5000)
+    assert [len(p) for p in puts] == [5, 5, 2]
+    assert all(sum(record_size(r) for r in p) <= 5000 for p in puts)
+
+
+def test_send_notification_batch_resends_failed_records(monkeypatch):
+    monkeypatch.setattr(time, 'sleep', lambda s: None)
+    client = FakeKinesisClient(fail_users={'User3', 'User42'})
+    notifications = make_notifications(100)
+    stats = kinesis_with_client(client).send_notification_batch(notifications)
+
+    assert (stats.puts, stats.failed) == (1, 0)
+    assert stats.retried == len(client.calls[1]) == 2
+    assert sorted(decode_records(client.records), key=lambda n: n[0]) == sorted(notifications, key=lambda n: n[0])
+
+
+def test_send_notification_batch_gives_up(monkeypatch):
+    monkeypatch.setattr(time, 'sleep', lambda s: None)
+    client = FakeKinesisClient(fail_users={'User3'}, fail_rounds=MAX_PUT_ATTEMPTS)
+    with pytest.raises(NotificationsNotQueuedError) as e:
+        kinesis_with_client(client).send_notification_batch(make_notifications(20))
+
+    assert len(client.calls) == MAX_PUT_ATTEMPTS
+    assert 'User3' in e.value.users
+    assert 'User3' not in {n[0] for n in decode_records(client.records)}
+    # Only the record holding User3's partition failed, everyone else was put
+    assert sorted(e.value.users + [n[0] for n in decode_records(client.records)]) == sorted(f'User{u}' for u in range(20))
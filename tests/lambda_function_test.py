@@ -1,8 +1,19 @@
+from types import SimpleNamespace
+
 import pytest
 
+from defaults import INBOX_TIME_BUDGET_SECONDS, INBOX_TIME_MARGIN_SECONDS
+from lambda_function_process_inbox import inbox_time_budget
 from lambda_function_process_submissions import *
 
 
 @pytest.mark.integration
 def test_run():
     run()
+
+
+def test_inbox_time_budget_leaves_a_margin_before_the_timeout():
+    context = SimpleNamespace(get_remaining_time_in_millis=lambda: 20000)
+    assert inbox_time_budget(context) == 20 - INBOX_TIME_MARGIN_SECONDS
+    assert inbox_time_budget(SimpleNamespace(get_remaining_time_in_millis=lambda: 1000)) == 0
+    assert inbox_time_budget(None) == INBOX_TIME_BUDGET_SECONDS
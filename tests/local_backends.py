@@ -0,0 +1,449 @@
+"""
+In-memory stand-ins for the DynamoDB, SQS and Kinesis clients and the parts of praw the bot uses, so the whole
+pipeline can run without Reddit or AWS credentials. Every backend can add latency to its calls and throttle them
+the way the real service does once a rate limit is passed
+"""
+import base64
+import hashlib
+import random
+import threading
+import time
+import zlib
+from types import SimpleNamespace
+
+from rate_limit import RateLimitExceeded, TokenBucket
+
+# Hash key of each table the bot uses
+KEY_ATTRIBUTES = {
+    'dd-notifications': 'ticker',
+    'user-subscriptions': 'user_name',
+    'all-dd-subscribers': 'user_name',
+    'blocked-users': 'user_id',
+    'sent-notifications': 'id',
+    'notified-submissions': 'submission_id',
+    'commented-submissions': 'submission_id',
+    'submission-cursors': 'cursor_name',
+}
+
+
+class Throttled(Exception):
+    """
+    Raised by FaultInjector.call when a call is over the injected rate limit
+    """
+
+    def __init__(self, retry_after: float):
+        super().__init__(f'Throttled for another {retry_after:.1f} seconds')
+        self.retry_after = retry_after
+
+
+class FaultInjector:
+    """
+    Delays every call by @latency seconds plus up to @jitter and throttles calls made faster than @rate_limit
+    per second, after an initial @burst
+    """
+
+    def __init__(self, latency: float = 0.0, jitter: float = 0.0, rate_limit: float = None, burst: float = 1,
+                 seed: int = 0, sleep=time.sleep):
+        self.latency = latency
+        self.jitter = jitter
+        self.bucket = TokenBucket(rate_limit, burst) if rate_limit is not None else None
+        self.calls = 0
+        self.throttled = 0
+        self._random = random.Random(seed)
+        self._sleep = sleep
+        self._lock = threading.Lock()
+
+    def call(self):
+        """
+        :raises Throttled: if the call is over the rate limit
+        """
+        with self._lock:
+            self.calls += 1
+            delay = self.latency + (self._random.random() * self.jitter if self.jitter else 0.0)
+        if delay > 0:
+            self._sleep(delay)
+        if self.bucket is not None:
+            try:
+                self.bucket.acquire(max_wait=0)
+            except RateLimitExceeded as e:
+                with self._lock:
+                    self.throttled += 1
+                raise Throttled(e.wait_seconds)
+
+
+def client_error(code: str, operation: str) -> Exception:
+    from botocore.exceptions import ClientError
+    return ClientError({'Error': {'Code': code, 'Message': 'Rate exceeded'}}, operation)
+
+
+class LocalDynamoDB:
+    """
+    Stand-in for the subset of the DynamoDB client API the bot uses, items are stored in the same attribute value
+    format DynamoDB returns. Update expressions are limited to a single ADD or DELETE on a set and scans return at
+    most @page_size items per page. Throttled calls raise ProvisionedThroughputExceededException
+    """
+
+    def __init__(self, page_size: int = 100, faults: FaultInjector = None):
+        self.page_size = page_size
+        self.faults = faults or FaultInjector()
+        self.tables = {name: {} for name in KEY_ATTRIBUTES}
+        self.calls = {}
+        self._lock = threading.Lock()
+
+    def _call(self, operation: str):
+        with self._lock:
+            self.calls[operation] = self.calls.get(operation, 0) + 1
+        try:
+            self.faults.call()
+        except Throttled:
+            raise client_error('ProvisionedThroughputExceededException', operation)
+
+    @staticmethod
+    def _key_value(table_name: str, key_or_item: {}) -> str:
+        return key_or_item[KEY_ATTRIBUTES[table_name]]['S']
+
+    @staticmethod
+    def _project(item: {}, projection_expression: str = None) -> {}:
+        if projection_expression is None:
+            return dict(item)
+        attributes = [a.strip() for a in projection_expression.split(',')]
+        return {a: item[a] for a in attributes if a in item}
+
+    def get_item(self, TableName, Key, ProjectionExpression=None, ConsistentRead=False):
+        self._call('get_item')
+        with self._lock:
+            item = self.tables[TableName].get(self._key_value(TableName, Key))
+            return {'Item': self._project(item, ProjectionExpression)} if item is not None else {}
+
+    def put_item(self, TableName, Item, ReturnValues='NONE'):
+        self._call('put_item')
+        with self._lock:
+            self.tables[TableName][self._key_value(TableName, Item)] = dict(Item)
+            return {}
+
+    def delete_item(self, TableName, Key, ReturnValues='NONE'):
+        self._call('delete_item')
+        with self._lock:
+            self.tables[TableName].pop(self._key_value(TableName, Key), None)
+            return {}
+
+    def update_item(self, TableName, Key, UpdateExpression, ExpressionAttributeValues=None, ConditionExpression=None,
+                    ReturnValues='NONE'):
+        """
+        Supports `ADD`/`DELETE` of a string set, `REMOVE` of an attribute and an `attribute_exists` condition
+        """
+        self._call('update_item')
+        action, attribute, *placeholder = UpdateExpression.split()
+        values = set(ExpressionAttributeValues[placeholder[0]]['SS']) if placeholder else set()
+        with self._lock:
+            key_value = self._key_value(TableName, Key)
+            existing = self.tables[TableName].get(key_value)
+            if ConditionExpression is not None:
+                required = ConditionExpression[len('attribute_exists('):-1]
+                if existing is None or required not in existing:
+                    raise client_error('ConditionalCheckFailedException', 'UpdateItem')
+            old = dict(existing) if existing is not None else {}
+            item = self.tables[TableName].setdefault(key_value, dict(Key))
+            current = set(item.get(attribute, {}).get('SS', []))
+            if action == 'ADD':
+                current = current | values
+            elif action == 'DELETE':
+                current = current - values
+            else:
+                current = set()
+            if len(current) > 0:
+                item[attribute] = {'SS': sorted(current)}
+            else:
+                item.pop(attribute, None)
+            if ReturnValues == 'ALL_OLD' and len(old) > 0:
+                return {'Attributes': old}
+            if ReturnValues == 'UPDATED_NEW' and attribute in item:
+                return {'Attributes': {attribute: item[attribute]}}
+            return {}
+
+    def batch_get_item(self, RequestItems):
+        self._call('batch_get_item')
+        with self._lock:
+            responses = {}
+            for table_name, request in RequestItems.items():
+                table = self.tables[table_name]
+                items = [table.get(self._key_value(table_name, k)) for k in request['Keys']]
+                responses[table_name] = [self._project(i, request.get('ProjectionExpression')) for i in items if i is not None]
+            return {'Responses': responses, 'UnprocessedKeys': {}}
+
+    def batch_write_item(self, RequestItems):
+        self._call('batch_write_item')
+        with self._lock:
+            for table_name, requests in RequestItems.items():
+                table = self.tables[table_name]
+                for request in requests:
+                    if 'PutRequest' in request:
+                        item = request['PutRequest']['Item']
+                        table[self._key_value(table_name, item)] = dict(item)
+                    else:
+                        table.pop(self._key_value(table_name, request['DeleteRequest']['Key']), None)
+            return {'UnprocessedItems': {}}
+
+    def scan(self, TableName, ProjectionExpression=None, ExclusiveStartKey=None, Segment=None, TotalSegments=None):
+        self._call('scan')
+        with self._lock:
+            key_values = sorted(self.tables[TableName])
+            if TotalSegments is not None:
+                key_values = [k for k in key_values if zlib.crc32(k.encode()) % TotalSegments == Segment]
+            if ExclusiveStartKey is not None:
+                start = self._key_value(TableName, ExclusiveStartKey)
+                key_values = [k for k in key_values if k > start]
+            page = key_values[:self.page_size]
+            response = {'Items': [self._project(self.tables[TableName][k], ProjectionExpression) for k in page]}
+            if len(key_values) > self.page_size:
+                response['LastEvaluatedKey'] = {KEY_ATTRIBUTES[TableName]: {'S': page[-1]}}
+            return response
+
+
+class LocalSQS:
+    """
+    Stand-in for one SQS queue. Throttled entries are reported in Failed like SQS does for a partial failure
+    """
+
+    def __init__(self, faults: FaultInjector = None):
+        self.faults = faults or FaultInjector()
+        self.messages = []
+        self._lock = threading.Lock()
+        self._next_id = 0
+
+    def send_message_batch(self, QueueUrl, Entries):
+        successful, failed = [], []
+        for entry in Entries:
+            try:
+                self.faults.call()
+            except Throttled:
+                failed.append({'Id': entry['Id'], 'SenderFault': False, 'Code': 'ServiceUnavailable'})
+                continue
+            with self._lock:
+                self._next_id += 1
+                self.messages.append({'messageId': str(self._next_id), 'receiptHandle': str(self._next_id), 'body': entry['MessageBody']})
+            successful.append({'Id': entry['Id'], 'MessageId': str(self._next_id)})
+        return {'Successful': successful, 'Failed': failed}
+
+    def send_message(self, QueueUrl, MessageBody):
+        return self.send_message_batch(QueueUrl, [{'Id': '0', 'MessageBody': MessageBody}])
+
+    def delete_message(self, QueueUrl, ReceiptHandle):
+        return {}
+
+    def receive_lambda_records(self) -> [{}]:
+        """
+        :return: every queued message as an SQS Lambda event record, removing them from the queue
+        """
+        with self._lock:
+            messages, self.messages = self.messages, []
+        return messages
+
+
+class LocalKinesis:
+    """
+    Stand-in for one Kinesis stream with @shards shards. Throttled records are reported per record with
+    ProvisionedThroughputExceededException like put_records does
+    """
+
+    def __init__(self, shards: int = 2, faults: FaultInjector = None):
+        self.faults = faults or FaultInjector()
+        self.shards = [[] for _ in range(shards)]
+        self._lock = threading.Lock()
+
+    def shard_for(self, partition_key: str) -> int:
+        # Kinesis maps the MD5 of the partition key onto the shards' hash key ranges
+        return int(hashlib.md5(partition_key.encode()).hexdigest(), 16) * len(self.shards) >> 128
+
+    def put_records(self, StreamName, Records):
+        results = []
+        for record in Records:
+            try:
+                self.faults.call()
+            except Throttled:
+                results.append({'ErrorCode': 'ProvisionedThroughputExceededException', 'ErrorMessage': 'Rate exceeded'})
+                continue
+            shard = self.shard_for(record['PartitionKey'])
+            with self._lock:
+                self.shards[shard].append(record)
+                results.append({'SequenceNumber': str(len(self.shards[shard])), 'ShardId': f'shardId-{shard:012d}'})
+        return {'FailedRecordCount': sum('ErrorCode' in r for r in results), 'Records': results}
+
+    def receive_lambda_records(self) -> [{}]:
+        """
+        :return: every record as a Kinesis Lambda event record, shard by shard, removing them from the stream
+        """
+        with self._lock:
+            shards, self.shards = self.shards, [[] for _ in self.shards]
+        return [
+            {'kinesis': {'partitionKey': r['PartitionKey'], 'data': base64.b64encode(r['Data']).decode()}}
+            for shard in shards for r in shard
+        ]
+
+
+class LocalSubmission:
+    def __init__(self, reddit, number: int, title: str, selftext: str = '', link_flair_text: str = 'DD', created_utc: float = None):
+        self._reddit = reddit
+        self.id = f'local{number}'
+        self.fullname = f't3_{self.id}'
+        self.title = title
+        self.selftext = selftext
+        self.is_self = True
+        self.link_flair_text = link_flair_text
+        self.created_utc = created_utc if created_utc is not None else 1600000000 + number
+        self.permalink = f'/r/wallstreetbets/comments/{self.id}/'
+        self.comments = []
+
+    def reply(self, body: str):
+        self._reddit.call('comment')
+        self.comments.append(body)
+
+
+class LocalSubreddit:
+    def __init__(self, reddit, name: str):
+        self._reddit = reddit
+        self.display_name = name
+        self.submissions = []
+
+    def new(self, limit: int = 100):
+        """
+        Newest first, one request per page of 100 like praw's listing generator
+        """
+        newest_first = sorted(self.submissions, key=lambda s: s.created_utc, reverse=True)[:limit]
+        for i, submission in enumerate(newest_first):
+            i % 100 == 0 and self._reddit.call('listing')
+            yield submission
+
+
+class LocalMessage:
+    def __init__(self, reddit, number: int, author: str, body: str, was_comment: bool = False):
+        self._reddit = reddit
+        self.id = f'message{number}'
+        self.author = LocalRedditor(reddit, author)
+        self.body = body
+        self.was_comment = was_comment
+        self.replies = []
+
+    def reply(self, body: str):
+        self._reddit.call('comment')
+        self.replies.append(body)
+
+
+class LocalInbox:
+    def __init__(self, reddit):
+        self._reddit = reddit
+        self.items = []
+        self.read = set()
+
+    def unread(self, limit: int = None):
+        self._reddit.call('listing')
+        return [i for i in self.items if i.id not in self.read][:limit]
+
+    def stream(self, pause_after: int = None):
+        seen = set()
+        while True:
+            new = [i for i in self.unread() if i.id not in seen]
+            for item in new:
+                seen.add(item.id)
+                yield item
+            if len(new) == 0:
+                if pause_after is not None:
+                    yield None
+                else:
+                    return
+
+    def mark_read(self, items):
+        self._reddit.call('mark_read')
+        self.read.update(i.id for i in items)
+
+    def receive(self, author: str, body: str, was_comment: bool = False) -> LocalMessage:
+        """
+        Deliver a message from @author to the bot
+        """
+        message = LocalMessage(self._reddit, len(self.items), author, body, was_comment)
+        self.items.append(message)
+        return message
+
+
+class LocalRedditor:
+    def __init__(self, reddit, name: str):
+        self._reddit = reddit
+        self.name = name
+        self.created_utc = 1500000000
+
+    def __str__(self):
+        return self.name
+
+    def message(self, subject: str, message: str):
+        self._reddit.call('message')
+        self._reddit.record_message(self.name, subject, message)
+
+
+class LocalReddit:
+    """
+    Stand-in for praw.Reddit. Throttled calls raise the RATELIMIT error Reddit sends, which asks the bot to take a
+    break, and auth.limits reports the requests left in the current window like praw does
+    """
+
+    def __init__(self, faults: FaultInjector = None, requests_per_window: int = None, window_seconds: float = 600,
+                 clock=time.time):
+        self.faults = faults or FaultInjector()
+        self.requests_per_window = requests_per_window
+        self.window_seconds = window_seconds
+        self._clock = clock
+        self._window_started_at = clock()
+        self._window_requests = 0
+        self.subreddits = {}
+        self.inbox = LocalInbox(self)
+        self.messages = []
+        self.calls = {}
+        self._lock = threading.Lock()
+
+    @property
+    def auth(self):
+        if self.requests_per_window is None:
+            return SimpleNamespace(limits={})
+        with self._lock:
+            return SimpleNamespace(limits={
+                'remaining': max(self.requests_per_window - self._window_requests, 0),
+                'used': self._window_requests,
+                'reset_timestamp': self._window_started_at + self.window_seconds,
+            })
+
+    def call(self, operation: str):
+        with self._lock:
+            self.calls[operation] = self.calls.get(operation, 0) + 1
+            now = self._clock()
+            if now - self._window_started_at >= self.window_seconds:
+                self._window_started_at, self._window_requests = now, 0
+            self._window_requests += 1
+        try:
+            self.faults.call()
+        except Throttled as e:
+            from praw.exceptions import RedditAPIException
+            raise RedditAPIException([[
+                'RATELIMIT',
+                f"Looks like you've been doing that a lot. Take a break for {max(int(e.retry_after), 1)} seconds before trying again.",
+                'ratelimit'
+            ]])
+
+    def record_message(self, user: str, subject: str, message: str):
+        with self._lock:
+            self.messages.append(SimpleNamespace(user=user, subject=subject, body=message, sent_at=time.monotonic()))
+
+    def subreddit(self, name: str) -> LocalSubreddit:
+        if name not in self.subreddits:
+            self.subreddits[name] = LocalSubreddit(self, name)
+        return self.subreddits[name]
+
+    def redditor(self, name: str) -> LocalRedditor:
+        return LocalRedditor(self, name)
+
+    def post(self, title: str, selftext: str = '', link_flair_text: str = 'DD', subreddit: str = 'wallstreetbets') -> LocalSubmission:
+        """
+        Post a submission to @subreddit, newer than every submission posted before it
+        """
+        posts = self.subreddit(subreddit).submissions
+        submission = LocalSubmission(self, len(posts), title, selftext, link_flair_text)
+        posts.append(submission)
+        return submission
@@ -0,0 +1,138 @@
+import base64
+import time
+
+import pytest
+from botocore.exceptions import ClientError
+from praw.exceptions import RedditAPIException
+
+import clients
+from database import Database
+from local_backends import FaultInjector, LocalDynamoDB, LocalKinesis, LocalReddit, LocalSQS
+from utils import should_sleep_for_seconds
+
+
+def test_fault_injector_throttles_after_burst():
+    slept = []
+    faults = FaultInjector(latency=0.01, rate_limit=0.001, burst=2, sleep=slept.append)
+
+    faults.call()
+    faults.call()
+    with pytest.raises(Exception) as e:
+        faults.call()
+
+    assert e.value.retry_after > 0
+    assert slept == [0.01] * 3
+    assert faults.calls == 3
+    assert faults.throttled == 1
+
+
+def test_local_dynamodb_throttles_like_dynamodb():
+    client = LocalDynamoDB(faults=FaultInjector(rate_limit=0.001, burst=1))
+    client.put_item(TableName='blocked-users', Item={'user_id': {'S': 'User0'}})
+
+    with pytest.raises(ClientError) as e:
+        client.get_item(TableName='blocked-users', Key={'user_id': {'S': 'User0'}})
+
+    assert e.value.response['Error']['Code'] == 'ProvisionedThroughputExceededException'
+
+
+def test_local_sqs_reports_throttled_entries_as_failed():
+    queue = LocalSQS(faults=FaultInjector(rate_limit=0.001, burst=1))
+
+    response = queue.send_message_batch(QueueUrl='local', Entries=[
+        {'Id': '0', 'MessageBody': 'first'},
+        {'Id': '1', 'MessageBody': 'second'},
+    ])
+
+    assert [e['Id'] for e in response['Successful']] == ['0']
+    assert response['Failed'] == [{'Id': '1', 'SenderFault': False, 'Code': 'ServiceUnavailable'}]
+    assert [r['body'] for r in queue.receive_lambda_records()] == ['first']
+    assert queue.receive_lambda_records() == []
+
+
+def test_local_kinesis_keeps_partitions_on_one_shard():
+    stream = LocalKinesis(shards=4, faults=FaultInjector(rate_limit=0.001, burst=3))
+
+    response = stream.put_records(StreamName='local', Records=[
+        {'Data': b'a', 'PartitionKey': '1'},
+        {'Data': b'b', 'PartitionKey': '1'},
+        {'Data': b'c', 'PartitionKey': '2'},
+        {'Data': b'd', 'PartitionKey': '2'},
+    ])
+
+    assert response['FailedRecordCount'] == 1
+    assert response['Records'][-1]['ErrorCode'] == 'ProvisionedThroughputExceededException'
+    records = stream.receive_lambda_records()
+    assert [base64.b64decode(r['kinesis']['data']) for r in records if r['kinesis']['partitionKey'] == '1'] == [b'a', b'b']
+    assert len(records) == 3
+
+
+def test_local_reddit_asks_for_a_break_when_throttled():
+    reddit = LocalReddit(faults=FaultInjector(rate_limit=0.1, burst=1))
+    reddit.redditor('User0').message('subject', 'body')
+
+    with pytest.raises(RedditAPIException) as e:
+        reddit.redditor('User1').message('subject', 'body')
+
+    assert should_sleep_for_seconds(str(e.value)) >= 1
+    assert [m.user for m in reddit.messages] == ['User0']
+
+
+def test_local_reddit_reports_limits():
+    now = [0.0]
+    reddit = LocalReddit(requests_per_window=10, window_seconds=600, clock=lambda: now[0])
+    reddit.redditor('User0').message('subject', 'body')
+
+    assert reddit.auth.limits == {'remaining': 9, 'used': 1, 'reset_timestamp': 600}
+    now[0] = 601
+    reddit.redditor('User0').message('subject', 'body')
+    assert reddit.auth.limits['remaining'] == 9
+
+
+def test_submission_to_notification_offline(monkeypatch):
+    from lambda_function_notify import run_notify
+    from lambda_function_process_inbox import run_process_inbox
+    from lambda_function_process_submissions import run_process_submissions
+
+    reddit, queue = LocalReddit(), LocalSQS()
+    monkeypatch.setattr(clients, '_clients', {'dynamodb': LocalDynamoDB(), 'sqs': queue})
+    monkeypatch.setattr(clients, '_reddits', {'LocalBot': reddit})
+    monkeypatch.setenv('BotUserName', 'LocalBot')
+    monkeypatch.setenv('NotificationsQueueUrl', 'local')
+    monkeypatch.setenv('NotificationTransport', 'sqs')
+
+    reddit.inbox.receive('LocalUser0', 'GME')
+    reddit.inbox.receive('LocalUser1', 'GME AMC')
+    reddit.inbox.receive('LocalUser2', 'AMC')
+    run_process_inbox({}, None)
+    reddit.post('Why GME is undervalued', 'A long look at the fundamentals')
+    reddit.post('Daily discussion', link_flair_text='Daily Discussion')
+    run_process_submissions({}, None)
+    run_notify({'Records': queue.receive_lambda_records()}, None)
+
+    assert all(len(m.replies) == 1 for m in reddit.inbox.items)
+    assert sorted(m.user for m in reddit.messages) == ['LocalUser0', 'LocalUser1']
+    assert all('Why GME is undervalued' in m.body for m in reddit.messages)
+
+
+def test_submissions_are_not_marked_when_notifications_cannot_be_queued(monkeypatch):
+    from lambda_function_process_submissions import run_process_submissions
+    from notification_codec import NotificationsNotQueuedError
+
+    reddit, dynamodb = LocalReddit(), LocalDynamoDB()
+    queue = LocalSQS(faults=FaultInjector(rate_limit=0.001, burst=0))
+    monkeypatch.setattr(clients, '_clients', {'dynamodb': dynamodb, 'sqs': queue})
+    monkeypatch.setattr(clients, '_reddits', {'LocalBot': reddit})
+    monkeypatch.setattr(time, 'sleep', lambda s: None)
+    monkeypatch.setenv('BotUserName', 'LocalBot')
+    monkeypatch.setenv('NotificationsQueueUrl', 'local')
+    monkeypatch.setenv('NotificationTransport', 'sqs')
+    Database().subscribe_user_to_ticker('LocalUser0', '$GME')
+    reddit.post('Why GME is undervalued')
+
+    with pytest.raises(NotificationsNotQueuedError) as e:
+        run_process_submissions({}, None)
+
+    assert e.value.users == ['LocalUser0']
+    assert dynamodb.tables['notified-submissions'] == {}
+    assert dynamodb.tables['submission-cursors'] == {}
@@ -1 +1,33 @@
-# Untested because I don't feel like comparing a ton of string outputs
+import random
+
+from messages import example_tickers, make_comment_from_tickers, make_pretty_message, render_submission_block
+from stock_data.tickers import tickers
+from submission_utils import SubmissionNotification
+
+
+def test_make_pretty_message():
+    random.seed(0)
+    sub1 = SubmissionNotification('a1', 'DD', 'test.permalink1', 'test-submission1')
+    sub2 = SubmissionNotification('a2', 'DD', 'test.permalink2', 'test-submission2')
+    message = make_pretty_message([{'ticker': '$FNJN', 'subs': [sub1, sub2]}, {'ticker': '$WISA', 'subs': [sub1]}])
+
+    assert message.startswith(
+        '## $FNJN $WISA:\n- [test-submission1](test.permalink1)\n\n\n'
+        '## $FNJN:\n- [test-submission2](test.permalink2)\n\n\n'
+        "To stop notifications, reply with the tickers you'd like to stop like `stop "
+    )
+    assert sorted(message[message.rindex('stop ') + 5:-1].split()) == ['$FNJN', '$WISA']
+
+
+def test_submission_blocks_are_rendered_once():
+    render_submission_block.cache_clear()
+    sub = SubmissionNotification('a1', 'DD', 'test.permalink1', 'test-submission1')
+    for _ in range(100):
+        make_pretty_message([{'ticker': '$FNJN', 'subs': [sub]}])
+    assert render_submission_block.cache_info().misses == 1
+
+
+def test_make_comment_uses_example_tickers():
+    assert all(t in tickers for t in example_tickers())
+    assert example_tickers() is example_tickers()
+    assert 'I\'ve found these tickers in this submission: [$GME]' in make_comment_from_tickers(['$GME'])
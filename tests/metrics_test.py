@@ -0,0 +1,93 @@
+import json
+import threading
+
+import clients
+from database import Database
+from local_backends import LocalDynamoDB, LocalReddit, LocalSQS
+from metrics import Metrics, metrics as shared_metrics
+
+
+def test_disabled_metrics_record_nothing():
+    emitted = []
+    metrics = Metrics(emit=emitted.append)
+    metrics.begin('notify', enabled=False)
+
+    with metrics.stage('RedditSend'):
+        pass
+    metrics.count('NotificationsSent', 3)
+    metrics.flush()
+
+    assert metrics.durations == {} and metrics.counts == {}
+    assert emitted == []
+
+
+def test_metrics_are_emitted_as_emf():
+    emitted = []
+    metrics = Metrics(namespace='Test', emit=emitted.append)
+    metrics.begin('notify', {'BotUser': 'Bot'}, enabled=True)
+
+    with metrics.stage('RedditSend'):
+        pass
+    metrics.duration('RateLimitWait', 0.5)
+    metrics.count('NotificationsSent', 3)
+    metrics.flush()
+
+    document = json.loads(emitted[0])
+    directive = document['_aws']['CloudWatchMetrics'][0]
+    assert directive['Namespace'] == 'Test'
+    assert directive['Dimensions'] == [['Handler', 'BotUser']]
+    assert {'Name': 'RateLimitWaitTime', 'Unit': 'Milliseconds'} in directive['Metrics']
+    assert {'Name': 'NotificationsSent', 'Unit': 'Count'} in directive['Metrics']
+    assert document['Handler'] == 'notify' and document['BotUser'] == 'Bot'
+    assert document['RateLimitWaitTime'] == 500
+    assert document['RedditSendCalls'] == 1 and document['NotificationsSent'] == 3
+    # Every defined metric has a value
+    assert all(m['Name'] in document for m in directive['Metrics'])
+    assert metrics.counts == {}
+
+
+def test_metrics_are_thread_safe():
+    metrics = Metrics()
+    metrics.begin('notify', enabled=True)
+
+    def record():
+        for _ in range(1000):
+            with metrics.stage('DedupLookup'):
+                metrics.count('Checked')
+
+    threads = [threading.Thread(target=record) for _ in range(4)]
+    [t.start() for t in threads]
+    [t.join() for t in threads]
+
+    assert metrics.counts == {'Checked': 4000, 'DedupLookupCalls': 4000}
+
+
+def test_handlers_emit_their_stages(monkeypatch):
+    from lambda_function_notify import run_notify
+    from lambda_function_process_submissions import run_process_submissions
+
+    emitted = []
+    reddit, queue, dynamodb = LocalReddit(), LocalSQS(), LocalDynamoDB()
+    monkeypatch.setattr(clients, '_clients', {'dynamodb': dynamodb, 'sqs': queue})
+    monkeypatch.setattr(clients, '_reddits', {'MetricsBot': reddit})
+    # Restores the shared metrics to disabled once the test is done
+    monkeypatch.setattr(shared_metrics, 'enabled', False)
+    monkeypatch.setattr(shared_metrics, '_emit', emitted.append)
+    monkeypatch.setenv('BotUserName', 'MetricsBot')
+    monkeypatch.setenv('NotificationsQueueUrl', 'local')
+    monkeypatch.setenv('NotificationTransport', 'sqs')
+    monkeypatch.setenv('EmitMetrics', 'true')
+    Database().subscribe_user_to_ticker('MetricsUser', '$PLTR')
+
+    reddit.post('PLTR is a long term hold')
+    run_process_submissions({}, None)
+    run_notify({'Records': queue.receive_lambda_records()}, None)
+
+    submissions, notify = [json.loads(e) for e in emitted]
+    assert submissions['Handler'] == 'process_submissions'
+    for stage in ['FetchSubmissions', 'DedupLookup', 'TickerParsing', 'NotificationBuild', 'SubscriberLookup', 'QueueSend', 'MarkerWrite']:
+        assert f'{stage}Time' in submissions
+    assert submissions['SubmissionsFetched'] == 1 and submissions['NotificationsBuilt'] == 1
+    assert notify['Handler'] == 'notify' and notify['BotUser'] == 'MetricsBot'
+    assert notify['RedditSendCalls'] == 1 and notify['NotificationsSent'] == 1
+    assert 'MarkerWriteTime' in notify and 'RateLimitWaitTime' in notify
@@ -0,0 +1,42 @@
+from notification_builder import build_notifications, notification_size, unique_submissions
+from submission_utils import SubmissionNotification
+
+
+def make_sub(number: int, flair='DD') -> SubmissionNotification:
+    return SubmissionNotification(f'a{number}', flair, f'test.permalink{number}', f'test-submission{number}')
+
+
+def test_build_notifications_orders_largest_first():
+    subs = [make_sub(n) for n in range(4)]
+    tickers_with_submissions = {'$FNJN': subs[:1], '$WISA': subs[:3], '$GME': subs[3:]}
+    subscribed = {'$FNJN': ['small', 'medium', 'large'], '$WISA': ['large'], '$GME': ['medium', 'large']}
+
+    notifications = build_notifications(tickers_with_submissions, lambda tickers: subscribed)
+    assert list(notifications) == ['large', 'medium', 'small']
+    assert [n['ticker'] for n in notifications['large']] == ['$FNJN', '$WISA', '$GME']
+
+
+def test_build_notifications_counts_each_submission_once():
+    shared, other = make_sub(1), make_sub(2)
+    # The user subscribed to three tickers all mentioned in one post has one post to read about
+    tickers_with_submissions = {'$A': [shared], '$B': [shared], '$C': [shared, shared], '$D': [other]}
+    subscribed = {'$A': ['three_tickers'], '$B': ['three_tickers'], '$C': ['three_tickers'], '$D': ['two_posts']}
+    notifications = build_notifications(tickers_with_submissions, lambda tickers: subscribed, lambda: ['two_posts'])
+
+    assert notification_size(notifications['three_tickers']) == 1
+    assert notification_size(notifications['two_posts']) == 2
+    assert list(notifications) == ['two_posts', 'three_tickers']
+    assert notifications['three_tickers'][2] == {'ticker': '$C', 'subs': [shared]}
+
+
+def test_build_notifications_shares_ticker_notifications():
+    notifications = build_notifications({'$A': [make_sub(1)]}, lambda tickers: {'$A': ['u1', 'u2']}, lambda: ['u3'])
+    assert notifications['u1'][0] is notifications['u2'][0] is notifications['u3'][0]
+
+
+def test_build_notifications_without_tickers():
+    assert build_notifications({}, lambda tickers: {}) == {}
+
+
+def test_unique_submissions():
+    assert [s.id for s in unique_submissions([make_sub(2), make_sub(1), make_sub(2)])] == ['a2', 'a1']
@@ -0,0 +1,58 @@
+import codecs
+import pickle
+from datetime import date
+
+import pytest
+
+from notification_codec import decode_notifications, encode_notifications
+from submission_utils import SubmissionNotification
+
+
+def make_batch(num_users: int) -> [tuple]:
+    subs = [
+        SubmissionNotification(f'id{i}', 'DD', f'/r/wallstreetbets/comments/id{i}/a_long_title_about_the_company_{i}/',
+                               f'A long title about the company {i} and why it will moon ðŸš€')
+        for i in range(3)
+    ]
+    return [
+        (f'User{u}', [{'ticker': '$SPY', 'subs': subs}, {'ticker': '$GME', 'subs': subs[1:]}, {'ticker': '$AMC', 'subs': [subs[2]]}])
+        for u in range(num_users)
+    ]
+
+
+def test_encode_decode_round_trip():
+    for num_users in (0, 1, 10, 200):
+        batch = make_batch(num_users)
+        assert decode_notifications(encode_notifications(batch)) == batch
+
+
+def test_encode_keeps_missing_flair():
+    batch = [('User0', [{'ticker': '$SPY', 'subs': [SubmissionNotification('a', None, 'link', 'title')]}])]
+    encoded = encode_notifications(batch)
+    assert encoded.startswith('1:')
+    assert decode_notifications(encoded) == batch
+
+
+def test_encoding_is_smaller_than_pickle():
+    batch = make_batch(10)
+    legacy = codecs.encode(pickle.dumps(batch), 'base64').decode()
+    encoded = encode_notifications(batch)
+    assert encoded.startswith('1z:')
+    assert len(encoded) * 4 < len(legacy)
+    # Users share the submission dictionary so adding users costs much less than a full notification
+    assert len(encode_notifications(make_batch(100))) < 2 * len(encoded)
+
+
+def test_decode_legacy_pickle():
+    batch = make_batch(2)
+    assert decode_notifications(codecs.encode(pickle.dumps(batch), 'base64').decode()) == batch
+
+
+def test_decode_legacy_pickle_rejects_other_types():
+    with pytest.raises(pickle.UnpicklingError):
+        decode_notifications(codecs.encode(pickle.dumps([('User0', date(2021, 1, 1))]), 'base64').decode())
+
+
+def test_decode_unknown_version():
+    with pytest.raises(ValueError):
+        decode_notifications('9:{}')
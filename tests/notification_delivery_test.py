@@ -0,0 +1,63 @@
+import threading
+
+from notification_delivery import NotificationDelivery
+from submission_utils import SubmissionNotification
+
+
+class FakeDatabase:
+    def __init__(self, notified=(), blocked=()):
+        self.notified = set(notified)
+        self.blocked = set(blocked)
+        self.markers = []
+        self.lock = threading.Lock()
+
+    def get_sent_notification_ids(self, notification_ids):
+        return {i for i in notification_ids if i in self.notified}
+
+    def is_user_blocked(self, user):
+        return user in self.blocked
+
+    def add_notification_markers(self, notification_ids):
+        with self.lock:
+            self.markers.extend(notification_ids)
+
+
+class FakeWSBReddit:
+    def __init__(self, database):
+        self.database = database
+        self.sent = []
+        self.notifications = []
+
+    def send_notification(self, notification):
+        self.sent.append(notification[0])
+        self.notifications.append(notification)
+
+
+def make_notification(user, submission_id='s1'):
+    return user, [{'ticker': '$SPY', 'subs': [SubmissionNotification(submission_id, 'DD', 'permalink', 'title')]}]
+
+
+def test_deliver_skips_sent_and_blocked_users():
+    database = FakeDatabase(notified={'User1-s1'}, blocked={'User2'})
+    wsb_reddit = FakeWSBReddit(database)
+    notifications = [make_notification(f'User{i}') for i in range(5)]
+
+    assert NotificationDelivery(wsb_reddit, max_workers=3).deliver(notifications) == 3
+    # Sends keep the order of the batch
+    assert wsb_reddit.sent == ['User0', 'User3', 'User4']
+    # Blocked users are marked so they aren't checked again, already sent notifications aren't re-marked
+    assert sorted(database.markers) == ['User0-s1', 'User2-s1', 'User3-s1', 'User4-s1']
+
+
+def test_deliver_only_sends_submissions_not_sent_yet():
+    database = FakeDatabase(notified={'User0-s1', 'User1-s1', 'User1-s2'})
+    wsb_reddit = FakeWSBReddit(database)
+    s1, s2 = SubmissionNotification('s1', 'DD', 'permalink1', 'title1'), SubmissionNotification('s2', 'DD', 'permalink2', 'title2')
+    notifications = [
+        ('User0', [{'ticker': '$SPY', 'subs': [s1, s2]}, {'ticker': '$GME', 'subs': [s1]}]),
+        ('User1', [{'ticker': '$SPY', 'subs': [s1, s2]}]),
+    ]
+
+    assert NotificationDelivery(wsb_reddit).deliver(notifications) == 1
+    assert wsb_reddit.notifications == [('User0', [{'ticker': '$SPY', 'subs': [s2]}])]
+    assert database.markers == ['User0-s2']
@@ -0,0 +1,81 @@
+import boto3
+from botocore.stub import Stubber
+
+import profiling
+from profiling import RemoteCallTracer, profiled, reddit_call_name
+
+
+def test_tracer_times_boto_calls():
+    client = boto3.session.Session(region_name='us-west-1', aws_access_key_id='local', aws_secret_access_key='local').client('sqs')
+    tracer = RemoteCallTracer()
+    with Stubber(client) as stubber:
+        stubber.add_response('send_message', {'MessageId': '1'})
+        stubber.add_response('send_message', {'MessageId': '2'})
+        stubber.add_response('send_message', {'MessageId': '3'})
+        tracer.install()
+        client.send_message(QueueUrl='local', MessageBody='first')
+        client.send_message(QueueUrl='local', MessageBody='second')
+        tracer.uninstall()
+        client.send_message(QueueUrl='local', MessageBody='untraced')
+
+    [(name, count, total, longest)] = tracer.top_calls()
+    assert name == 'sqs SendMessage' and count == 2
+    assert 0 < longest <= total
+
+
+def test_tracer_errors_do_not_mask_the_call():
+    class Api:
+        def call(self, value):
+            return value
+
+    def fail_to_name(*args, **kwargs):
+        raise ValueError('unnamed')
+
+    tracer = RemoteCallTracer()
+    tracer._wrap(Api, 'call', fail_to_name)
+    try:
+        assert Api().call(3) == 3
+    finally:
+        tracer.uninstall()
+    assert tracer.calls == {}
+
+
+def test_reddit_calls_are_grouped_by_endpoint():
+    assert reddit_call_name(None, 'GET', 'https://oauth.reddit.com/user/SomeUser/about/?raw_json=1') == 'reddit GET /user/*/about/'
+    assert reddit_call_name(None, 'POST', 'https://oauth.reddit.com/api/compose/') == 'reddit POST /api/compose/'
+
+
+def test_profiled_handler_only_profiles_when_asked(monkeypatch, tmp_path):
+    monkeypatch.delenv('AWS_LAMBDA_FUNCTION_NAME', raising=False)
+    monkeypatch.setattr(profiling, 'PROFILE_OUTPUT_DIR', str(tmp_path))
+
+    @profiled
+    def run_handler(event, context):
+        return sum(range(1000))
+
+    assert run_handler({}, None) == 499500
+    assert list(tmp_path.iterdir()) == []
+    assert run_handler({'profile': True}, None) == 499500
+    summaries = list(tmp_path.glob('run_handler-*.txt'))
+    assert len(summaries) == 1 and len(list(tmp_path.glob('run_handler-*.prof'))) == 1
+    assert 'Profile of run_handler' in summaries[0].read_text()
+
+
+def test_profile_summary_is_logged_on_lambda(monkeypatch, tmp_path):
+    logged = []
+    monkeypatch.setenv('AWS_LAMBDA_FUNCTION_NAME', 'notify')
+    monkeypatch.setattr(profiling, 'PROFILE_OUTPUT_DIR', str(tmp_path))
+    monkeypatch.setattr(profiling.logger, 'info', logged.append)
+
+    @profiled
+    def run_handler(event, context):
+        raise ValueError('handler failed')
+
+    try:
+        run_handler({'profile': True}, None)
+    except ValueError:
+        pass
+
+    assert len(logged) == 1 and logged[0].startswith('Profile of run_handler')
+    assert 'run_handler' in logged[0].split('\n', 3)[3]
+    assert list(tmp_path.iterdir()) == []
@@ -0,0 +1,83 @@
+import pytest
+
+from rate_limit import RateLimitExceeded, TokenBucket, rate_limiter_for
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.now += seconds
+
+    def wall_clock(self):
+        return 1600000000 + self.now
+
+
+def make_bucket(rate, capacity) -> (TokenBucket, FakeClock):
+    clock = FakeClock()
+    return TokenBucket(rate=rate, capacity=capacity, clock=clock, sleep=clock.sleep, wall_clock=clock.wall_clock), clock
+
+
+def test_token_bucket_allows_burst_then_paces():
+    clock = FakeClock()
+    bucket = TokenBucket(rate=2, capacity=3, clock=clock, sleep=clock.sleep)
+
+    assert [bucket.acquire() for _ in range(3)] == [0, 0, 0]
+    assert bucket.acquire() == 0.5
+    assert bucket.acquire() == 0.5
+    assert clock.now == 1.0
+
+
+def test_token_bucket_refills_up_to_capacity():
+    clock = FakeClock()
+    bucket = TokenBucket(rate=1, capacity=2, clock=clock, sleep=clock.sleep)
+    bucket.acquire()
+    bucket.acquire()
+    clock.now += 60
+
+    assert bucket.acquire() == 0
+    assert bucket.acquire() == 0
+    assert bucket.acquire() == 1
+
+
+def test_token_bucket_pause():
+    bucket, clock = make_bucket(rate=1, capacity=5)
+    bucket.pause(30)
+
+    with pytest.raises(RateLimitExceeded) as e:
+        bucket.acquire(max_wait=10)
+    assert e.value.wait_seconds == 30
+    # Tokens don't build up while paused
+    assert bucket.acquire() == 30
+    assert bucket.acquire() == 1
+    assert clock.now == 31
+
+
+def test_token_bucket_follows_reported_limits():
+    bucket, clock = make_bucket(rate=1, capacity=5)
+    bucket.update_from_limits({'remaining': 30.0, 'reset_timestamp': clock.wall_clock() + 100, 'used': 570})
+    assert bucket.rate == 0.3
+
+    bucket.update_from_limits({'remaining': 0.0, 'reset_timestamp': clock.wall_clock() + 20, 'used': 600})
+    assert bucket.acquire() == 20
+
+    # Limits are unknown until the first request is made
+    bucket.update_from_limits({'remaining': None, 'reset_timestamp': None, 'used': None})
+    assert bucket.rate == 0.3
+
+
+def test_reported_limits_never_raise_the_rate_above_the_send_rate():
+    bucket, clock = make_bucket(rate=1, capacity=5)
+    for remaining, seconds_until_reset in [(300.0, 100), (600.0, 6), (30.0, 100), (599.0, 1)]:
+        bucket.update_from_limits({'remaining': remaining, 'reset_timestamp': clock.wall_clock() + seconds_until_reset})
+        assert bucket.rate <= 1
+    assert bucket.rate == 1
+
+
+def test_rate_limiter_for_is_shared_per_account():
+    assert rate_limiter_for('Account0') is rate_limiter_for('Account0')
+    assert rate_limiter_for('Account0') is not rate_limiter_for('Account1')
@@ -0,0 +1,86 @@
+import time
+
+import pytest
+
+from notification_codec import NotificationsNotQueuedError
+from sqs import SQS, MAX_BATCH_BYTES, message_size
+from submission_utils import SubmissionNotification
+from utils import decode_notification_from_sqs
+
+
+class FakeSQSClient:
+    """
+    Accepts send_message_batch calls, failing the entries listed in @fail_ids the first time they are sent
+    """
+    def __init__(self, fail_ids=(), sender_fault=False):
+        self.fail_ids = set(fail_ids)
+        self.sender_fault = sender_fault
+        self.calls = []
+        self.bodies = []
+
+    def send_message_batch(self, QueueUrl, Entries):
+        self.calls.append(Entries)
+        failed = []
+        for e in Entries:
+            # Ids are '<batch>-<entry>-<digest>'
+            entry_id = '-'.join(e['Id'].split('-')[:2])
+            if entry_id in self.fail_ids:
+                self.fail_ids.discard(entry_id)
+                failed.append({'Id': e['Id'], 'SenderFault': self.sender_fault, 'Code': 'InternalError'})
+            else:
+                self.bodies.append(e['MessageBody'])
+        return {'Successful': [], 'Failed': failed}
+
+
+def sqs_with_client(client) -> SQS:
+    sqs = SQS.__new__(SQS)
+    sqs.client = client
+    sqs.queue_url = 'SOME_QUEUE_URL'
+    return sqs
+
+
+def make_notifications(num_users: int, title_length=40) -> [tuple]:
+    return [
+        (f'User{u}', [{'ticker': '$SPY', 'subs': [SubmissionNotification(f'id{u}', 'DD', f'/r/wsb/id{u}', f'{u}' * title_length)]}])
+        for u in range(num_users)
+    ]
+
+
+def test_pack_messages_respects_count_and_size():
+    notifications = make_notifications(25)
+    assert [len(decode_notification_from_sqs(m)) for m in SQS.pack_messages(notifications)] == [10, 10, 5]
+
+    messages = SQS.pack_messages(notifications, max_bytes=600)
+    assert all(message_size(m) <= 600 for m in messages)
+    assert [n for m in messages for n in decode_notification_from_sqs(m)] == notifications
+
+
+def test_pack_batches_respects_payload_size():
+    messages = ['a' * (MAX_BATCH_BYTES // 4)] * 9 + ['b'] * 12
+    batches = SQS.pack_batches(messages)
+    assert [len(b) for b in batches] == [4, 4, 10, 3]
+    assert all(sum(len(m) for m in b) <= MAX_BATCH_BYTES for b in batches)
+
+
+def test_send_notification_batch_resends_failed_entries(monkeypatch):
+    monkeypatch.setattr(time, 'sleep', lambda s: None)
+    client = FakeSQSClient(fail_ids={'1-3', '2-0'})
+    notifications = make_notifications(150)
+    stats = sqs_with_client(client).send_notification_batch(notifications)
+
+    assert (stats.messages, stats.batches, stats.retried, stats.failed) == (15, 2, 2, 0)
+    assert [len(c) for c in client.calls] == [10, 1, 5, 1]
+    assert len({e['Id'] for e in client.calls[0]}) == 10
+    assert sorted((n for b in client.bodies for n in decode_notification_from_sqs(b)), key=lambda n: n[0]) == \
+        sorted(notifications, key=lambda n: n[0])
+
+
+def test_send_notification_batch_does_not_resend_sender_faults(monkeypatch):
+    monkeypatch.setattr(time, 'sleep', lambda s: None)
+    client = FakeSQSClient(fail_ids={'1-0'}, sender_fault=True)
+    with pytest.raises(NotificationsNotQueuedError) as e:
+        sqs_with_client(client).send_notification_batch(make_notifications(20))
+
+    assert e.value.users == [f'User{u}' for u in range(10)]
+    assert len(client.calls) == 1
+    assert len(client.bodies) == 1
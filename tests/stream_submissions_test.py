@@ -0,0 +1,110 @@
+import time
+from types import SimpleNamespace
+
+from notification_codec import NotificationsNotQueuedError
+from stream_submissions import SubmissionStream
+from submission_utils import SubmissionCursor
+
+
+class FakeDatabase:
+    def __init__(self, cursor=None):
+        self.cursor = cursor
+
+    def get_submission_cursor(self, name):
+        return self.cursor
+
+    def set_submission_cursor(self, name, cursor):
+        self.cursor = cursor
+
+
+class FakeWSBReddit:
+    def __init__(self, stream, cursor=None, catch_up=(), failures=0):
+        self.wsb = SimpleNamespace(stream=SimpleNamespace(submissions=lambda pause_after: iter(stream)))
+        self.database = FakeDatabase(cursor)
+        self.catch_up = list(catch_up)
+        self.failures = failures
+        self.processed = []
+
+    def get_new_submissions(self, cursor, flair_filter=False):
+        return self.catch_up, SubmissionCursor(self.catch_up[0].fullname, self.catch_up[0].created_utc) if self.catch_up else cursor
+
+    def process_submissions(self, submissions):
+        if self.failures > 0:
+            self.failures -= 1
+            raise NotificationsNotQueuedError([])
+        self.processed.append([s.id for s in submissions])
+
+
+def make_submission(number: int, flair='DD'):
+    return SimpleNamespace(id=f's{number}', fullname=f't3_s{number}', created_utc=1600000000 + number, link_flair_text=flair)
+
+
+def test_stream_flushes_when_idle_or_full():
+    stream = [make_submission(1), make_submission(2, 'Meme'), None, None] + [make_submission(n) for n in range(3, 8)] + [None]
+    wsb_reddit = FakeWSBReddit(stream)
+    num_batches = SubmissionStream(wsb_reddit, batch_size=3).run()
+
+    assert num_batches == 3
+    assert wsb_reddit.processed == [['s1'], ['s3', 's4', 's5'], ['s6', 's7']]
+    assert wsb_reddit.database.cursor == SubmissionCursor('t3_s7', 1600000007)
+
+
+def test_stream_flushes_after_batch_seconds():
+    now = [0]
+
+    def stream():
+        for n in range(1, 5):
+            now[0] = n * 10
+            yield make_submission(n)
+
+    wsb_reddit = FakeWSBReddit(stream())
+    SubmissionStream(wsb_reddit, batch_size=10, batch_seconds=15, clock=lambda: now[0]).run()
+    assert wsb_reddit.processed == [['s1', 's2', 's3'], ['s4']]
+
+
+def test_stream_moves_cursor_for_filtered_batches():
+    wsb_reddit = FakeWSBReddit([make_submission(1, 'Meme'), None])
+    SubmissionStream(wsb_reddit).run()
+    assert wsb_reddit.processed == []
+    assert wsb_reddit.database.cursor == SubmissionCursor('t3_s1', 1600000001)
+
+
+def test_stream_skips_submissions_before_cursor():
+    stream = [make_submission(n) for n in range(1, 6)] + [None]
+    wsb_reddit = FakeWSBReddit(stream, cursor=SubmissionCursor('t3_s3', 1600000003))
+    submission_stream = SubmissionStream(wsb_reddit)
+    submission_stream.catch_up()
+    submission_stream.run()
+
+    assert wsb_reddit.processed == [['s4', 's5']]
+    assert wsb_reddit.database.cursor == SubmissionCursor('t3_s5', 1600000005)
+
+
+def test_cursor_never_moves_backwards():
+    wsb_reddit = FakeWSBReddit([], cursor=SubmissionCursor('t3_s5', 1600000005))
+    submission_stream = SubmissionStream(wsb_reddit)
+    submission_stream.catch_up()
+    submission_stream.process([], SubmissionCursor('t3_s2', 1600000002))
+
+    assert wsb_reddit.database.cursor == SubmissionCursor('t3_s5', 1600000005)
+    assert submission_stream.cursor == SubmissionCursor('t3_s5', 1600000005)
+
+
+def test_catch_up_processes_submissions_since_cursor():
+    wsb_reddit = FakeWSBReddit([], cursor=SubmissionCursor('t3_s1', 1600000001), catch_up=[make_submission(3), make_submission(2)])
+    SubmissionStream(wsb_reddit).catch_up()
+    assert wsb_reddit.processed == [['s3', 's2']]
+    assert wsb_reddit.database.cursor == SubmissionCursor('t3_s3', 1600000003)
+
+
+def test_stream_restarts_after_a_failed_batch(monkeypatch):
+    slept = []
+    monkeypatch.setattr(time, 'sleep', slept.append)
+    wsb_reddit = FakeWSBReddit([make_submission(1), None], cursor=SubmissionCursor('t3_s0', 1600000000), failures=1)
+    submission_stream = SubmissionStream(wsb_reddit)
+    submission_stream.run_forever(max_runs=2)
+
+    assert len(slept) == 1
+    # The failed batch is dropped rather than carried into the restarted stream
+    assert wsb_reddit.processed == [['s1']]
+    assert wsb_reddit.database.cursor == SubmissionCursor('t3_s1', 1600000001)
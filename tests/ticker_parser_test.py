@@ -0,0 +1,16 @@
+from ticker_parser import parse_tickers
+
+
+def test_parse_tickers_excludes_unless_dollar_sign():
+    assert parse_tickers('OTM ITM YOLO') == []
+    assert parse_tickers('$YOLO') == ['$YOLO']
+
+
+def test_parse_tickers_short_dollar_tickers():
+    assert parse_tickers('$r and $z/$f') == ['$F', '$R', '$Z']
+    assert parse_tickers('R and Z') == []
+
+
+def test_parse_tickers_long_text():
+    text = 'Lorem ipsum dolor SIT amet, $AAPL TSLA. (GME) **BOLD** [link](http://x.com/ABCXYZ)\n' * 2000
+    assert parse_tickers(text) == ['$AAPL', '$GME', '$TSLA']
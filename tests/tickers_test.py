@@ -0,0 +1,44 @@
+import pytest
+
+from stock_data.tickers import LOOKUP_CACHE_SIZE, SymbolInfo, SymbolTable, tickers, write_symbol_table
+
+
+def test_symbol_table_round_trip(tmp_path):
+    file_name = str(tmp_path / 'symbols.bin')
+    write_symbol_table([
+        SymbolInfo('SPY', 'P', True, False),
+        SymbolInfo('BRK.A', 'N', False, False),
+        SymbolInfo('AAIC$B', 'N', False, False),
+        SymbolInfo('AAPL', 'Q', False, False),
+        SymbolInfo('SPY', 'N', False, False),
+    ], file_name)
+    table = SymbolTable(file_name)
+
+    assert len(table) == 4
+    assert list(table) == ['AAIC$B', 'AAPL', 'BRK.A', 'SPY']
+    assert 'BRK.A' in table and 'AAIC$B' in table
+    assert 'BRK' not in table and 'SPYY' not in table and 'TOOLONGSYMBOL' not in table
+    assert table.lookup('SPY') == SymbolInfo('SPY', 'P', True, False)
+    assert table.lookup('NOPE') is None
+    assert table[-1] == 'SPY'
+
+
+def test_symbol_table_lookup_cache_is_bounded():
+    for n in range(LOOKUP_CACHE_SIZE * 2):
+        f'NOTA{n}' in tickers
+    assert 'SPY' in tickers
+    assert tickers._contains.cache_info().currsize == LOOKUP_CACHE_SIZE
+    assert [] not in tickers
+
+
+def test_symbol_table_rejects_unknown_file(tmp_path):
+    file_name = tmp_path / 'symbols.bin'
+    file_name.write_bytes(b'not a symbol table')
+    with pytest.raises(ValueError):
+        len(SymbolTable(str(file_name)))
+
+
+def test_packaged_symbol_table():
+    assert len(tickers) > 10000
+    assert 'SPY' in tickers and 'BF.A' in tickers
+    assert list(tickers) == sorted(tickers)
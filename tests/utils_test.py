@@ -1,12 +1,12 @@
 import base64
-import pickle
 from functools import partial
 
 from fixtures import *
+from notification_builder import build_notifications
 from submission_utils import SubmissionNotification
-from utils import chunks, create_notifications, get_tickers_for_submission, group_submissions_for_tickers, \
-    is_account_old_enough, parse_tickers_from_text, should_sleep_for_seconds, generate_notification_id, \
-    decode_notification_kinesis, encode_notification_for_sqs, decode_notification_from_sqs, reduce_notifications, \
+from utils import chunks, get_tickers_for_submission, group_submissions_for_tickers, \
+    is_account_old_enough, parse_tickers_from_text, should_sleep_for_seconds, generate_notification_ids, \
+    decode_notification_record, encode_notification_for_sqs, decode_notification_from_sqs, reduce_notifications, \
     should_block_based_on_message
 
 
@@ -15,12 +15,9 @@ def test_chunks():
     assert list(chunks(data, 2)) == [{'a': [1], 'b': [2, 3, 4]}, {'c': [5], 'd': [6]}, {'e': [7]}]
 
 
-def test_create_notifications():
-    def mock_get_subscribed_users(ticker: str) -> [str]:
-        if ticker == "$WISA":
-            return ["u1", "u2"]
-        else:
-            return ["u1", "u3"]
+def test_build_notifications():
+    def mock_get_subscribed_users(tickers: [str]) -> {str: [str]}:
+        return {ticker: ["u1", "u2"] if ticker == "$WISA" else ["u1", "u3"] for ticker in tickers}
 
     tickers_with_submissions = {
         "$FNJN": [
@@ -31,7 +28,7 @@ def test_create_notifications():
             SubmissionNotification('a1', 'DD', 'test.permalink1', 'test-submission1'),
         ]
     }
-    notifications = create_notifications(tickers_with_submissions, partial(mock_get_subscribed_users))
+    notifications = build_notifications(tickers_with_submissions, partial(mock_get_subscribed_users))
     expected_result = {
         # User 1 is notified about FNJN which occurs in both posts and also about WISA which only occurs in one of them
         'u1': [{
@@ -184,20 +181,53 @@ def test_sleep_for_time():
 
 
 def test_encode_decode_sqs(notifications):
-    string = encode_notification_for_sqs(notifications)
+    batch = [(user, subs) for n in notifications for user, subs in n.items()]
+    string = encode_notification_for_sqs(batch)
     decoded = decode_notification_from_sqs(string)
-    assert decoded[0]['User0'][0]['ticker'] == "$SPY"
-    assert decoded[1]['User1'][0]['ticker'] == "$SPXL"
-
-
-def test_encode_decode_kinesis(notification_kinesis):
-    string = base64.b64encode(pickle.dumps(notification_kinesis))
-    user, notification = decode_notification_kinesis(string)
-    notification_id = generate_notification_id((user, notification))
-    assert notification_id == "SomeUser-gn18pl"
-    assert user == 'SomeUser'
-    assert notification[0]['ticker'] == "$SPY"
-
-
-def test_generate_notification_id(notification_kinesis):
-    assert generate_notification_id(notification_kinesis) == 'SomeUser-gn18pl'
+    assert decoded[0][0] == 'User0'
+    assert decoded[0][1][0]['ticker'] == "$SPY"
+    assert decoded[1][1][0]['ticker'] == "$SPXL"
+    assert decoded == batch
+
+
+def test_decode_notification_record(notification_kinesis):
+    encoded = encode_notification_for_sqs([notification_kinesis])
+    kinesis_record = {'kinesis': {'partitionKey': '7', 'data': base64.b64encode(encoded.encode()).decode()}}
+    assert decode_notification_record(kinesis_record) == [notification_kinesis]
+    assert decode_notification_record({'body': encoded}) == [notification_kinesis]
+    user, notification = decode_notification_record(kinesis_record)[0]
+    assert generate_notification_ids((user, notification))[0] == "SomeUser-gn18pl"
+
+
+def test_generate_notification_ids(notification_kinesis):
+    user, ticker_notifications = notification_kinesis
+    submission_ids = list(dict.fromkeys(s.id for n in ticker_notifications for s in n['subs']))
+    assert generate_notification_ids(notification_kinesis) == [f'SomeUser-{i}' for i in submission_ids]
+    assert generate_notification_ids(notification_kinesis)[0] == 'SomeUser-gn18pl'
+
+
+def test_build_notifications_for_all_dd_subscribers():
+    dd1 = SubmissionNotification('a1', 'DD', 'test.permalink1', 'test-submission1')
+    dd2 = SubmissionNotification('a2', 'DD', 'test.permalink2', 'test-submission2')
+    discussion = SubmissionNotification('a3', 'Discussion', 'test.permalink3', 'test-submission3')
+    tickers_with_submissions = {"$FNJN": [dd1, discussion], "$WISA": [dd2], "$GME": [discussion]}
+
+    notifications = build_notifications(
+        tickers_with_submissions,
+        lambda tickers: {ticker: ['u1'] if ticker == '$FNJN' else [] for ticker in tickers},
+        lambda: ['u1', 'all1', 'all2']
+    )
+    # Individual subscriptions include every submission, the all DD feed only DD
+    assert notifications['u1'] == [{'ticker': '$FNJN', 'subs': [dd1, discussion]}, {'ticker': '$WISA', 'subs': [dd2]}]
+    assert notifications['all1'] == [{'ticker': '$FNJN', 'subs': [dd1]}, {'ticker': '$WISA', 'subs': [dd2]}]
+    assert notifications['all2'] == notifications['all1']
+    assert len(notifications) == 3
+
+
+def test_build_notifications_only_loads_all_dd_subscribers_for_dd():
+    def fail():
+        raise AssertionError('all DD subscribers should not be loaded')
+
+    discussion = SubmissionNotification('a3', 'Discussion', 'test.permalink3', 'test-submission3')
+    assert build_notifications({"$GME": [discussion]}, lambda tickers: {'$GME': ['u1']}, fail) == \
+        {'u1': [{'ticker': '$GME', 'subs': [discussion]}]}
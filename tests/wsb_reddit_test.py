@@ -1,6 +1,9 @@
 import logging
+from types import SimpleNamespace
 
 from fixtures import *
+from rate_limit import TokenBucket
+from submission_utils import SubmissionCursor
 
 logger = logging.getLogger()
 logger.setLevel(logging.INFO)
@@ -72,3 +75,231 @@ def test_notify_some_users_of_something(wsb_reddit_client):
             logger.error(f'Could not send {user} a message: {e}')
 
     [create_notification(u) for u in us]
+
+
+class FakeSubreddit:
+    def __init__(self, submissions):
+        self.submissions = submissions
+        self.fetched = 0
+
+    def new(self, limit):
+        for s in self.submissions[:limit]:
+            self.fetched += 1
+            yield s
+
+
+def make_submission(number: int, flair='DD'):
+    return SimpleNamespace(id=f's{number}', fullname=f't3_s{number}', created_utc=1600000000 + number, link_flair_text=flair)
+
+
+def wsb_reddit_with_subreddit(subreddit) -> WSBReddit:
+    wsb_reddit = WSBReddit.__new__(WSBReddit)
+    wsb_reddit.wsb = subreddit
+    return wsb_reddit
+
+
+def test_get_new_submissions_stops_at_cursor():
+    subreddit = FakeSubreddit([make_submission(n, 'DD' if n % 2 == 0 else 'Meme') for n in range(10, 0, -1)])
+    wsb_reddit = wsb_reddit_with_subreddit(subreddit)
+
+    submissions, cursor = wsb_reddit.get_new_submissions(SubmissionCursor('t3_s6', 1600000006), flair_filter=True)
+    assert [s.id for s in submissions] == ['s10', 's8']
+    assert cursor == SubmissionCursor('t3_s10', 1600000010)
+    assert subreddit.fetched == 5
+
+
+def test_get_new_submissions_without_new_posts():
+    subreddit = FakeSubreddit([make_submission(n) for n in range(10, 0, -1)])
+    cursor = SubmissionCursor('t3_s10', 1600000010)
+
+    assert wsb_reddit_with_subreddit(subreddit).get_new_submissions(cursor) == ([], cursor)
+    assert subreddit.fetched == 1
+
+
+def test_get_new_submissions_stops_at_older_posts_when_cursor_post_is_gone():
+    subreddit = FakeSubreddit([make_submission(n) for n in range(10, 0, -1) if n != 7])
+    submissions, _ = wsb_reddit_with_subreddit(subreddit).get_new_submissions(SubmissionCursor('t3_s7', 1600000007))
+    assert [s.id for s in submissions] == ['s10', 's9', 's8']
+
+
+def test_get_new_submissions_without_cursor():
+    subreddit = FakeSubreddit([make_submission(n) for n in range(10, 0, -1)])
+    submissions, cursor = wsb_reddit_with_subreddit(subreddit).get_new_submissions(None, limit=3)
+    assert [s.id for s in submissions] == ['s10', 's9', 's8']
+    assert cursor == SubmissionCursor('t3_s10', 1600000010)
+
+
+class FakeInbox:
+    def __init__(self, items):
+        self.items = items
+        self.marked_read = []
+
+    def stream(self, pause_after=None):
+        yield from self.items
+        yield None
+
+    def mark_read(self, items):
+        self.marked_read.append([i.id for i in items])
+
+
+class FakeInboxDatabase:
+    def __init__(self, failing_users=()):
+        self.failing_users = set(failing_users)
+        self.subscriptions = []
+
+    def is_user_blocked(self, user_id):
+        return False
+
+    def update_user_subscriptions(self, user_id, add=(), remove=(), pool=None):
+        if user_id in self.failing_users:
+            return {ticker: False for ticker in add}
+        self.subscriptions.extend((user_id, ticker) for ticker in add)
+        self.subscriptions = [s for s in self.subscriptions if s[0] != user_id or s[1] not in remove]
+        return {ticker: True for ticker in [*add, *remove]}
+
+    def get_user_subscriptions(self, user_id):
+        return sorted(ticker for user, ticker in self.subscriptions if user == user_id)
+
+
+def make_message(number: int, body: str, user: str = None):
+    author = SimpleNamespace(name=user or f'user{number}', created_utc=1500000000)
+    return SimpleNamespace(id=f'm{number}', body=body, author=author, was_comment=False,
+                           replies=[], reply=lambda message, replies=None: None)
+
+
+def wsb_reddit_with_inbox(inbox, database) -> WSBReddit:
+    wsb_reddit = WSBReddit.__new__(WSBReddit)
+    wsb_reddit.reddit = SimpleNamespace(inbox=inbox, auth=SimpleNamespace(limits={}))
+    wsb_reddit.database = database
+    wsb_reddit.rate_limiter = TokenBucket(rate=1000, capacity=1000)
+    return wsb_reddit
+
+
+def test_process_inbox_marks_messages_read_in_batches(monkeypatch):
+    monkeypatch.setattr('wsb_reddit.INBOX_BATCH_SIZE', 4)
+    inbox = FakeInbox([make_message(n, '$TSLA') for n in range(10)])
+    database = FakeInboxDatabase()
+    wsb_reddit_with_inbox(inbox, database).process_inbox()
+
+    assert inbox.marked_read == [[f'm{n}' for n in range(0, 4)], [f'm{n}' for n in range(4, 8)], ['m8', 'm9']]
+    assert sorted(database.subscriptions) == sorted((f'user{n}', '$TSLA') for n in range(10))
+
+
+def test_process_inbox_leaves_messages_unread_when_update_fails():
+    replies = []
+    messages = [make_message(1, '$TSLA'), make_message(2, '$GME', user='throttled'), make_message(3, '$AMC')]
+    for m in messages:
+        m.reply = lambda message, m=m: replies.append(m.id)
+    inbox = FakeInbox(messages)
+    wsb_reddit_with_inbox(inbox, FakeInboxDatabase(failing_users={'throttled'})).process_inbox()
+
+    assert inbox.marked_read == [['m1', 'm3']]
+    assert replies == ['m1', 'm3']
+
+
+def test_process_inbox_stops_when_out_of_time():
+    inbox = FakeInbox([make_message(n, '$TSLA') for n in range(30)])
+    database = FakeInboxDatabase()
+    wsb_reddit_with_inbox(inbox, database).process_inbox(time_budget=0)
+    assert inbox.marked_read == []
+    assert database.subscriptions == []
+
+
+def test_process_inbox_handles_each_authors_messages_in_order():
+    replies = {}
+    messages = [make_message(1, '$TSLA $GME', user='User0'), make_message(2, 'list', user='User0'),
+                make_message(3, '$AMC', user='User1'), make_message(4, 'stop everything', user='User0'),
+                make_message(5, 'list', user='User0'), make_message(6, 'list', user='User1')]
+    for m in messages:
+        m.reply = lambda message, m=m: replies.setdefault(m.id, message)
+    inbox = FakeInbox(messages)
+    database = FakeInboxDatabase()
+    wsb_reddit_with_inbox(inbox, database).process_inbox()
+
+    assert inbox.marked_read == [[f'm{n}' for n in range(1, 7)]]
+    assert replies['m2'].startswith("You're subscribed to DD for $GME, $TSLA")
+    assert replies['m4'] == 'You are no longer subscribed to $GME, $TSLA'
+    assert replies['m5'] == "You aren't subscribed to any tickers"
+    assert replies['m6'].startswith("You're subscribed to DD for $AMC")
+
+
+def test_list_and_stop_everything():
+    replies = []
+    messages = [make_message(1, '$TSLA $GME', user='User0'), make_message(2, 'list', user='User0'),
+                make_message(3, '$AMC', user='User1'), make_message(4, 'stop everything', user='User0'),
+                make_message(5, 'list', user='User0')]
+    for m in messages:
+        m.reply = lambda message, m=m: replies.append(message)
+    database = FakeInboxDatabase()
+    wsb_reddit = wsb_reddit_with_inbox(FakeInbox([]), database)
+    for m in messages:
+        wsb_reddit.handle_message(m)
+
+    assert replies[1].startswith("You're subscribed to DD for $GME, $TSLA")
+    assert replies[3] == 'You are no longer subscribed to $GME, $TSLA'
+    assert replies[4] == "You aren't subscribed to any tickers"
+    assert database.subscriptions == [('User1', '$AMC')]
+
+
+def test_send_notification_fails_the_batch_when_reddit_keeps_asking_for_a_break():
+    from rate_limit import RateLimitExceeded
+
+    now, attempts = [0.0], []
+
+    def message(subject, body):
+        attempts.append(subject)
+        raise Exception('RATELIMIT: "Looks like you\'ve been doing that a lot. Take a break for 3 seconds before trying again."')
+
+    wsb_reddit = WSBReddit.__new__(WSBReddit)
+    wsb_reddit.reddit = SimpleNamespace(redditor=lambda user: SimpleNamespace(message=message), auth=SimpleNamespace(limits={}))
+    wsb_reddit.rate_limiter = TokenBucket(rate=1, capacity=1, clock=lambda: now[0],
+                                          sleep=lambda s: now.__setitem__(0, now[0] + s))
+
+    with pytest.raises(RateLimitExceeded) as e:
+        wsb_reddit.send_notification(('User0', [{'ticker': '$GME', 'subs': []}]))
+    assert len(attempts) == 2
+    assert e.value.wait_seconds == 4
+
+
+class FakeSubmissionsDatabase:
+    def __init__(self, subscriptions: {str: [str]}):
+        self.subscriptions = subscriptions
+        self.markers = []
+
+    def get_processed_submission_ids(self, submission_ids, table_name):
+        return set()
+
+    def get_users_subscribed_to_tickers(self, tickers):
+        return {t: self.subscriptions.get(t, []) for t in tickers}
+
+    def get_users_subscribed_to_all_dd_feed(self):
+        return []
+
+    def add_submission_markers(self, table_name, submission_ids):
+        self.markers.extend(submission_ids)
+
+
+class FailingTransport:
+    def __init__(self, failing_users):
+        self.failing_users = set(failing_users)
+
+    def send_notification_batch(self, notifications):
+        from notification_codec import NotificationsNotQueuedError
+        raise NotificationsNotQueuedError([n for n in notifications if n[0] in self.failing_users])
+
+
+def test_submissions_queued_for_every_subscriber_are_marked_when_others_fail():
+    from notification_codec import NotificationsNotQueuedError
+
+    def make_post(number: int, title: str):
+        return SimpleNamespace(id=f's{number}', title=title, selftext='', is_self=True, link_flair_text='DD',
+                               permalink=f'/r/wsb/s{number}')
+
+    database = FakeSubmissionsDatabase({'$GME': ['User0'], '$AMC': ['User1']})
+    wsb_reddit = WSBReddit.__new__(WSBReddit)
+    wsb_reddit.database = database
+    wsb_reddit._notification_transport = FailingTransport({'User1'})
+
+    with pytest.raises(NotificationsNotQueuedError):
+        wsb_reddit.process_submissions([make_post(1, 'GME to the moon'), make_post(2, 'AMC is next')])
+    assert database.markers == ['s1']
@@ -0,0 +1,11 @@
+import argparse
+import logging
+
+from database import BACKFILL_SCAN_SEGMENTS, Database
+
+if __name__ == '__main__':
+    logging.basicConfig(format='%(asctime)s %(levelname)s %(message)s')
+    parser = argparse.ArgumentParser(description='Build the user subscriptions index from the ticker subscriptions table')
+    parser.add_argument('--segments', type=int, default=BACKFILL_SCAN_SEGMENTS, help='number of parallel scan segments')
+    args = parser.parse_args()
+    Database().backfill_user_subscriptions(args.segments)
@@ -0,0 +1,11 @@
+import argparse
+import logging
+
+from database import BACKFILL_SCAN_SEGMENTS, Database
+
+if __name__ == '__main__':
+    logging.basicConfig(format='%(asctime)s %(levelname)s %(message)s')
+    parser = argparse.ArgumentParser(description='Move ticker subscribers from one dd-notifications item into sharded items')
+    parser.add_argument('--segments', type=int, default=BACKFILL_SCAN_SEGMENTS, help='number of parallel scan segments')
+    args = parser.parse_args()
+    Database().migrate_subscriptions_to_shards(args.segments)
@@ -1,12 +1,12 @@
 import os
 import wget
-import pickle
 import time
 # from database import Database
+from stock_data.tickers import NASDAQ_EXCHANGE, SymbolInfo, write_symbol_table
 
 nasdaq_tickers_file_name = 'nasdaqlisted.txt'
 other_tickers_file_name = 'otherlisted.txt'
-combined_file_name = f'{os.path.dirname(os.path.realpath(__file__))}/combined.pkl'
+symbols_file_name = f'{os.path.dirname(os.path.realpath(__file__))}/symbols.bin'
 
 main_tickers_ftp = 'ftp://ftp.nasdaqtrader.com/SymbolDirectory/nasdaqlisted.txt'
 other_tickers_ftp = 'ftp://ftp.nasdaqtrader.com/SymbolDirectory/otherlisted.txt'
@@ -22,18 +22,17 @@ def process_tickers():
     csv.register_dialect('piper', delimiter='|', quoting=csv.QUOTE_NONE)
     all_tickers = []
     with open(nasdaq_tickers_file_name) as nasdaq_tickers_file, open(other_tickers_file_name) as other_tickers_file:
-        for row in csv.DictReader(nasdaq_tickers_file, dialect='piper'):
-            all_tickers.append(row['Symbol'])
+        nasdaq_rows = list(csv.DictReader(nasdaq_tickers_file, dialect='piper'))
         # Remove meta info
-        all_tickers = all_tickers[:-1]
-        for row in csv.DictReader(other_tickers_file, dialect='piper'):
-            all_tickers.append(row['ACT Symbol'])
-        all_tickers = all_tickers[:-1]
-        with open(combined_file_name, 'wb') as f:
-            pickle.dump(all_tickers, f)
+        for row in nasdaq_rows[:-1]:
+            all_tickers.append(SymbolInfo(row['Symbol'], NASDAQ_EXCHANGE, row['ETF'] == 'Y', row['Test Issue'] == 'Y'))
+        other_rows = list(csv.DictReader(other_tickers_file, dialect='piper'))
+        for row in other_rows[:-1]:
+            all_tickers.append(SymbolInfo(row['ACT Symbol'], row['Exchange'], row['ETF'] == 'Y', row['Test Issue'] == 'Y'))
+        write_symbol_table(all_tickers, symbols_file_name)
 
         # Uncomment to write to DB, otherwise just update the file and it is small enough to be committed and used
-        # chunked_symbols = divide_chunks(all_tickers, 25)
+        # chunked_symbols = divide_chunks([t.symbol for t in all_tickers], 25)
         #
         # client = Database().client
         #